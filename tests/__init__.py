@@ -0,0 +1,16 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    """A TestCase with a temporary directory, removed after each test."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def file_path(self, name):
+        return os.path.join(self.directory, name)
@@ -1,50 +1,127 @@
+import os
+import sys
+import json
+import subprocess
 import unittest
-from mock import MagicMock, patch, call
+from mock import MagicMock, patch, call, ANY
 
 from vdsgen import app
 
 app_patch_path = "vdsgen.app"
 parser_patch_path = app_patch_path + ".ArgumentParser"
 VDSGenerator_patch_path = app_patch_path + ".VDSGenerator"
-InterleaveVDSGenerator_patch_path = app_patch_path + ".InterleaveVDSGenerator"
-SubFrameVDSGenerator_patch_path = app_patch_path + ".SubFrameVDSGenerator"
-ExcaliburGapFillVDSGenerator_patch_path = app_patch_path + \
-                                          ".ExcaliburGapFillVDSGenerator"
-ReshapeVDSGenerator_patch_path = app_patch_path + \
-                                 ".ReshapeVDSGenerator"
+# Generators are imported when the mode is selected, so patch them at source
+InterleaveVDSGenerator_patch_path = \
+    "vdsgen.interleavevdsgenerator.InterleaveVDSGenerator"
+SubFrameVDSGenerator_patch_path = \
+    "vdsgen.subframevdsgenerator.SubFrameVDSGenerator"
+ExcaliburGapFillVDSGenerator_patch_path = \
+    "vdsgen.excaliburgapfillvdsgenerator.ExcaliburGapFillVDSGenerator"
+ReshapeVDSGenerator_patch_path = \
+    "vdsgen.reshapevdsgenerator.ReshapeVDSGenerator"
 
 
 class ParseArgsTest(unittest.TestCase):
 
     @patch(parser_patch_path + '.error')
     @patch(parser_patch_path + '.parse_args',
-           return_value=MagicMock(empty=True, files=None))
+           return_value=MagicMock(empty=True, files=None, watch=False,
+                                  preview=None, verify=False))
     def test_empty_and_not_files_then_error(self, parse_mock, error_mock):
 
         app.parse_args()
 
-        parse_mock.assert_called_once_with()
+        parse_mock.assert_called_once_with(None)
         error_mock.assert_called_once_with(
             "To make an empty VDS you must explicitly define --files for the "
             "eventual raw datasets.")
 
     @patch(parser_patch_path + '.error')
     @patch(parser_patch_path + '.parse_args',
-           return_value=MagicMock(mode="gap-fill", files=["one.h5", "two.h5"]))
+           return_value=MagicMock(mode="gap-fill", files=["one.h5", "two.h5"],
+                                  watch=False, preview=None, verify=False))
     def test_gap_fill_only_one_file(self, parse_mock, error_mock):
 
         app.parse_args()
 
-        parse_mock.assert_called_once_with()
+        parse_mock.assert_called_once_with(None)
         error_mock.assert_called_once_with(
             "Gap fill can only operate on a single dataset.")
 
+    def test_nodes(self):
+        args = app.parse_args(["/test/path", "-p", "stripe_",
+                               "-N", "fn", "ts:meta/ts"])
+
+        self.assertEqual([("fn", "fn"), ("ts", "meta/ts")], args.nodes)
+
+    def test_roi(self):
+        args = app.parse_args(["/test/path", "-p", "stripe_",
+                               "--roi", "10", "20", "30", "40"])
+
+        self.assertEqual((10, 20, 30, 40), args.roi)
+
+    def test_frame_range(self):
+        args = app.parse_args(["/test/path", "-p", "stripe_",
+                               "--frame-range", "10::5"])
+
+        self.assertEqual((10, None, 5), args.frame_range)
+
+    def test_frame_range_invalid_then_error(self):
+        with self.assertRaises(SystemExit):
+            app.parse_args(["/test/path", "-p", "stripe_",
+                            "--frame-range", "10"])
+
+    @patch(parser_patch_path + '.error', side_effect=SystemExit)
+    def test_preview_and_watch_then_error(self, error_mock):
+        with self.assertRaises(SystemExit):
+            app.parse_args(["/test/path", "-p", "stripe_", "-w",
+                            "--preview", "2", "4"])
+
+        error_mock.assert_called_once_with(
+            "Cannot --preview a VDS when using --watch or --empty")
+
+    @patch(parser_patch_path + '.error', side_effect=SystemExit)
+    def test_watch_interleave_without_expected_files_then_error(self,
+                                                                error_mock):
+        with self.assertRaises(SystemExit):
+            app.parse_args(["/test/path", "-p", "stripe_", "-w",
+                            "--mode", "interleave"])
+
+        error_mock.assert_called_once_with(
+            "Must provide --expected-files to --watch in interleave mode")
+
+    @patch(parser_patch_path + '.error', side_effect=SystemExit)
+    def test_nodes_and_empty_then_error(self, error_mock):
+        with self.assertRaises(SystemExit):
+            app.parse_args(["/test/path", "-f", "stripe_1.h5", "-e",
+                            "-N", "fn"])
+
+        error_mock.assert_called_once_with(
+            "Cannot map --nodes when making an --empty VDS")
+
+
+class CreateGeneratorTest(unittest.TestCase):
+
+    def test_metadata_cache_set_on_generator(self):
+        from vdsgen.cache import MetadataCache
+        from vdsgen.vdsgenerator import VDSGenerator
+        cache = MetadataCache()
+        args = app.parse_args(["/data", "-f", "stripe_1.h5", "-e"])
+
+        gen = app.create_generator(args, cache)
+
+        self.assertIs(cache, gen.metadata_cache)
+        self.assertIsNone(VDSGenerator.metadata_cache)
+
 
 class MainTest(unittest.TestCase):
 
     @patch(SubFrameVDSGenerator_patch_path)
     @patch(app_patch_path + '.parse_args',
-           return_value=MagicMock(mode="sub-frames", empty=True))
+           return_value=MagicMock(mode="sub-frames", empty=True,
+                                  server=None, watch=False,
+                                  shard_mappings=None, shard_frames=None,
+                                  preview=None, verify=False))
     def test_main_empty(self, parse_mock, init_mock):
         gen_mock = init_mock.return_value
         args_mock = parse_mock.return_value
@@ -62,13 +139,22 @@ class MainTest(unittest.TestCase):
             stripe_spacing=args_mock.stripe_spacing,
             module_spacing=args_mock.module_spacing,
             fill_value=args_mock.fill_value,
-            log_level=args_mock.log_level)
+            log_level=args_mock.log_level,
+            nodes=args_mock.nodes,
+            roi=args_mock.roi,
+            frame_range=args_mock.frame_range,
+            skip_unchanged=args_mock.skip_unchanged,
+            frame_index=args_mock.frame_index,
+            relative_paths=args_mock.relative_paths)
 
         gen_mock.generate_vds.assert_called_once_with()
 
     @patch(SubFrameVDSGenerator_patch_path)
     @patch(app_patch_path + '.parse_args',
-           return_value=MagicMock(mode="sub-frames", empty=False))
+           return_value=MagicMock(mode="sub-frames", empty=False,
+                                  server=None, watch=False,
+                                  shard_mappings=None, shard_frames=None,
+                                  preview=None, verify=False))
     def test_main_not_empty(self, parse_mock, init_mock):
         args_mock = parse_mock.return_value
 
@@ -85,11 +171,20 @@ class MainTest(unittest.TestCase):
             stripe_spacing=args_mock.stripe_spacing,
             module_spacing=args_mock.module_spacing,
             fill_value=args_mock.fill_value,
-            log_level=args_mock.log_level)
+            log_level=args_mock.log_level,
+            nodes=args_mock.nodes,
+            roi=args_mock.roi,
+            frame_range=args_mock.frame_range,
+            skip_unchanged=args_mock.skip_unchanged,
+            frame_index=args_mock.frame_index,
+            relative_paths=args_mock.relative_paths)
 
     @patch(InterleaveVDSGenerator_patch_path)
     @patch(app_patch_path + '.parse_args',
-           return_value=MagicMock(mode="interleave", empty=False))
+           return_value=MagicMock(mode="interleave", empty=False,
+                                  server=None, watch=False,
+                                  shard_mappings=None, shard_frames=None,
+                                  preview=None, verify=False))
     def test_main_interleave(self, parse_mock, init_mock):
         args_mock = parse_mock.return_value
 
@@ -105,11 +200,20 @@ class MainTest(unittest.TestCase):
             target_node=args_mock.target_node,
             block_size=args_mock.block_size,
             fill_value=args_mock.fill_value,
-            log_level=args_mock.log_level)
+            log_level=args_mock.log_level,
+            nodes=args_mock.nodes,
+            roi=args_mock.roi,
+            frame_range=args_mock.frame_range,
+            skip_unchanged=args_mock.skip_unchanged,
+            frame_index=args_mock.frame_index,
+            relative_paths=args_mock.relative_paths)
 
     @patch(ExcaliburGapFillVDSGenerator_patch_path)
     @patch(app_patch_path + '.parse_args',
-           return_value=MagicMock(mode="gap-fill", modules=3, empty=False))
+           return_value=MagicMock(mode="gap-fill", modules=3, empty=False,
+                                  server=None, watch=False,
+                                  shard_mappings=None, shard_frames=None,
+                                  preview=None, verify=False))
     def test_main_gap_fill(self, parse_mock, init_mock):
         args_mock = parse_mock.return_value
 
@@ -127,11 +231,20 @@ class MainTest(unittest.TestCase):
             chip_spacing=args_mock.stripe_spacing,
             module_spacing=args_mock.module_spacing,
             fill_value=args_mock.fill_value,
-            log_level=args_mock.log_level)
+            log_level=args_mock.log_level,
+            nodes=args_mock.nodes,
+            roi=args_mock.roi,
+            frame_range=args_mock.frame_range,
+            skip_unchanged=args_mock.skip_unchanged,
+            frame_index=args_mock.frame_index,
+            relative_paths=args_mock.relative_paths)
 
     @patch(ReshapeVDSGenerator_patch_path)
     @patch(app_patch_path + '.parse_args',
-           return_value=MagicMock(mode="reshape", empty=False))
+           return_value=MagicMock(mode="reshape", empty=False,
+                                  server=None, watch=False,
+                                  shard_mappings=None, shard_frames=None,
+                                  preview=None, verify=False))
     def test_main_reshape(self, parse_mock, init_mock):
         args_mock = parse_mock.return_value
 
@@ -148,5 +261,160 @@ class MainTest(unittest.TestCase):
             target_node=args_mock.target_node,
             fill_value=args_mock.fill_value,
             log_level=args_mock.log_level,
-            alternate=args_mock.alternate
+            alternate=args_mock.alternate,
+            nodes=args_mock.nodes,
+            roi=args_mock.roi,
+            frame_range=args_mock.frame_range,
+            skip_unchanged=args_mock.skip_unchanged,
+            frame_index=args_mock.frame_index,
+            relative_paths=args_mock.relative_paths
         )
+
+    @patch(app_patch_path + '.create_generator')
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(server=None, watch=False,
+                                  shard_mappings=100, shard_frames=None,
+                                  preview=None, verify=False))
+    def test_main_sharded(self, parse_mock, create_mock):
+        gen_mock = create_mock.return_value
+
+        app.main()
+
+        gen_mock.generate_sharded_vds.assert_called_once_with(100, None)
+        gen_mock.generate_vds.assert_not_called()
+
+    @patch("vdsgen.preview.generate_previews")
+    @patch(app_patch_path + '.create_generator')
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(server=None, watch=False,
+                                  shard_mappings=None, shard_frames=None,
+                                  preview=[2, 4], verify=False))
+    def test_main_preview(self, parse_mock, create_mock, preview_mock):
+        gen_mock = create_mock.return_value
+        gen_mock.up_to_date = False
+
+        app.main()
+
+        gen_mock.generate_vds.assert_called_once_with()
+        preview_mock.assert_called_once_with(
+            gen_mock.output_file, gen_mock.target_node, [2, 4])
+
+    @patch("vdsgen.verify.verify_plan", return_value=[MagicMock()])
+    @patch(app_patch_path + '.create_generator')
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(server=None, watch=False,
+                                  shard_mappings=None, shard_frames=None,
+                                  preview=None, verify=True))
+    def test_main_verify_mismatch_then_error(self, parse_mock, create_mock,
+                                             verify_mock):
+        gen_mock = create_mock.return_value
+
+        with self.assertRaises(IOError):
+            app.main()
+
+        verify_mock.assert_called_once_with(
+            gen_mock.output_file, gen_mock.layout_plan, gen_mock.target_node)
+        gen_mock.create_layout_plan.assert_not_called()
+
+    @patch("vdsgen.verify.verify_vds", return_value=[])
+    @patch(app_patch_path + '.create_generator')
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(server=None, watch=False,
+                                  shard_mappings=None, shard_frames=None,
+                                  preview=None, verify=True))
+    def test_main_verify_unchanged(self, parse_mock, create_mock,
+                                   verify_mock):
+        gen_mock = create_mock.return_value
+        gen_mock.layout_plan = None
+
+        app.main()
+
+        verify_mock.assert_called_once_with(gen_mock.output_file,
+                                            gen_mock.target_node)
+
+    @patch(app_patch_path + '.watch')
+    @patch(app_patch_path + '.create_generator')
+    @patch(app_patch_path + '.parse_args',
+           return_value=MagicMock(server=None, watch=True))
+    def test_main_watch(self, parse_mock, create_mock, watch_mock):
+        app.main()
+
+        watch_mock.assert_called_once_with(parse_mock.return_value)
+        create_mock.assert_not_called()
+
+    @patch("vdsgen.watcher.VDSWatcher")
+    def test_watch(self, watcher_mock):
+        args = MagicMock(mode="interleave", prefix="stripe_", files=None,
+                         output=None)
+
+        app.watch(args)
+
+        watcher_mock.assert_called_once_with(
+            args.path, "stripe_", ANY, files=None,
+            expected_files=args.expected_files, incremental=False,
+            source_node=args.source_node, settle_time=args.settle_time,
+            log_level=args.log_level)
+        watcher_mock.return_value.watch.assert_called_once_with(
+            timeout=args.timeout)
+
+
+class ImportTest(unittest.TestCase):
+
+    script = """
+import sys, json
+import vdsgen, vdsgen.app
+try:
+    sys.argv = ["dls-vds-gen.py", "--help"]
+    vdsgen.app.parse_args()
+except SystemExit:
+    pass
+sys.stdout.flush()
+print(json.dumps(sorted(sys.modules)))
+"""
+
+    def run_script(self, script=None):
+        root = os.path.join(os.path.dirname(__file__), "..")
+        output = subprocess.check_output(
+            [sys.executable, "-c", script or self.script], cwd=root)
+        return json.loads(output.decode().strip().splitlines()[-1])
+
+    def test_help_does_not_import_h5py_or_numpy(self):
+        modules = self.run_script()
+
+        self.assertNotIn("h5py", modules)
+        self.assertNotIn("numpy", modules)
+
+    def test_help_does_not_import_generators(self):
+        modules = self.run_script()
+
+        # Only the base class, for its defaults
+        for module in ["vdsgen.subframevdsgenerator",
+                       "vdsgen.interleavevdsgenerator",
+                       "vdsgen.excaliburgapfillvdsgenerator",
+                       "vdsgen.reshapevdsgenerator"]:
+            self.assertNotIn(module, modules)
+
+    def test_generator_import_does_not_import_h5py(self):
+        modules = self.run_script(
+            "import sys, json\n"
+            "import vdsgen.interleavevdsgenerator\n"
+            "print(json.dumps(sorted(sys.modules)))")
+
+        self.assertNotIn("h5py", modules)
+
+    def test_lazy_attribute_import(self):
+        import vdsgen
+        from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+
+        self.assertIs(SubFrameVDSGenerator, vdsgen.SubFrameVDSGenerator)
+        with self.assertRaises(AttributeError):
+            vdsgen.NotAGenerator
+
+    def test_eager_import_without_module_getattr(self):
+        modules = self.run_script(
+            "import sys, json\n"
+            "sys.version_info = (3, 6)\n"
+            "import vdsgen\n"
+            "print(json.dumps(sorted(sys.modules)))")
+
+        self.assertIn("vdsgen.subframevdsgenerator", modules)
@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import threading
+from mock import MagicMock, patch, call, ANY
+
+from vdsgen.asyncgenerator import AsyncVDSGenerator
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+from vdsgen.vdsgenerator import NodeMeta
+
+from tests import TempDirTestCase
+
+
+asyncgen_patch_path = "vdsgen.asyncgenerator"
+read_metadata_patch_path = asyncgen_patch_path + ".read_metadata"
+vdsgen_read_metadata_patch_path = "vdsgen.vdsgenerator.read_metadata"
+
+metadata = dict(frames=(3,), height=256, width=2048, dtype="uint16")
+
+
+class AsyncVDSGeneratorTest(TempDirTestCase):
+
+    def setUp(self):
+        super(AsyncVDSGeneratorTest, self).setUp()
+        self.files = ["stripe_1.h5", "stripe_2.h5"]
+        for file_ in self.files:
+            with open(os.path.join(self.directory, file_), "w") as f:
+                f.write("data")
+        self.runner = AsyncVDSGenerator(max_concurrency=2)
+
+    def tearDown(self):
+        self.runner.close()
+
+    def test_run_limits_concurrency(self):
+        lock = threading.Lock()
+        active = [0, 0]  # Current, maximum
+
+        def work():
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+        async def run_all():
+            await asyncio.gather(*[self.runner.run(work) for _ in range(6)])
+
+        asyncio.run(run_all())
+
+        self.assertEqual(2, active[1])
+
+    def test_run_timeout_then_error(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(self.runner.run(time.sleep, 0.5, timeout=0.01))
+
+    def test_run_cancelled_then_error(self):
+        async def cancel():
+            task = asyncio.ensure_future(self.runner.run(time.sleep, 0.5))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await task
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel())
+
+    @patch(asyncgen_patch_path + ".find_source_files")
+    def test_find_files(self, find_mock):
+        files = asyncio.run(self.runner.find_files("/test/path", "stripe_"))
+
+        find_mock.assert_called_once_with("/test/path", "stripe_")
+        self.assertEqual(find_mock.return_value, files)
+
+    @patch(read_metadata_patch_path, return_value=metadata)
+    def test_scan_cached(self, read_mock):
+        file_paths = [os.path.join(self.directory, file_)
+                      for file_ in self.files]
+
+        asyncio.run(self.runner.scan(file_paths))
+        scanned = asyncio.run(self.runner.scan(file_paths))
+
+        read_mock.assert_has_calls(
+            [call(file_path, "data", ()) for file_path in file_paths],
+            any_order=True)
+        self.assertEqual(2, read_mock.call_count)
+        self.assertEqual([metadata] * 2, scanned)
+
+    @patch(read_metadata_patch_path, return_value=metadata)
+    def test_scan_nodes_not_cached_without_nodes(self, read_mock):
+        file_paths = [os.path.join(self.directory, self.files[0])]
+
+        asyncio.run(self.runner.scan(file_paths))
+        asyncio.run(self.runner.scan(file_paths, nodes=["timestamps"]))
+
+        read_mock.assert_has_calls([call(file_paths[0], "data", ()),
+                                    call(file_paths[0], "data",
+                                         ("timestamps",))])
+
+    @patch(vdsgen_read_metadata_patch_path)
+    @patch(read_metadata_patch_path, return_value=metadata)
+    def test_create_scans_once(self, read_mock, generator_read_mock):
+        gen = asyncio.run(self.runner.create(
+            SubFrameVDSGenerator, self.directory, files=self.files,
+            stripe_spacing=3, log_level=3))
+
+        self.assertIsInstance(gen, SubFrameVDSGenerator)
+        self.assertEqual(3, gen.stripe_spacing)
+        self.assertEqual((3,), gen.source_metadata.frames)
+        self.assertEqual(2, read_mock.call_count)
+        generator_read_mock.assert_not_called()
+
+    @patch(vdsgen_read_metadata_patch_path)
+    @patch(read_metadata_patch_path, return_value=dict(
+        metadata, nodes=(NodeMeta("ts", (), "float64"),)))
+    def test_create_nodes_scans_nodes(self, read_mock, generator_read_mock):
+        gen = asyncio.run(self.runner.create(
+            SubFrameVDSGenerator, self.directory, files=self.files,
+            nodes=[("ts", "timestamps")], log_level=3))
+
+        self.assertEqual(2, read_mock.call_count)
+        read_mock.assert_called_with(ANY, "data", ("ts",))
+        generator_read_mock.assert_not_called()
+        self.assertEqual("ts", gen.node_metadata[0].node)
+
+    @patch(read_metadata_patch_path, return_value=metadata)
+    def test_create_prefix_then_find_files(self, read_mock):
+        gen = asyncio.run(self.runner.create(
+            SubFrameVDSGenerator, self.directory, prefix="stripe_",
+            log_level=3))
+
+        self.assertEqual([os.path.join(self.directory, file_)
+                          for file_ in self.files], gen.files)
+        self.assertEqual(2, read_mock.call_count)
+
+    @patch(read_metadata_patch_path)
+    def test_create_given_source_then_no_scan(self, read_mock):
+        gen = asyncio.run(self.runner.create(
+            SubFrameVDSGenerator, self.directory, files=self.files,
+            source=dict(shape=(3, 256, 2048), dtype="uint16"), log_level=3))
+
+        read_mock.assert_not_called()
+        self.assertEqual(256, gen.source_metadata.height)
+
+    def test_generate_vds(self):
+        gen_mock = MagicMock()
+
+        asyncio.run(self.runner.generate_vds(gen_mock))
+
+        gen_mock.generate_vds.assert_called_once_with()
+
+    @patch(SubFrameVDSGenerator.__module__ + ".SubFrameVDSGenerator"
+           ".generate_vds")
+    @patch(read_metadata_patch_path, return_value=metadata)
+    def test_generate_concurrently(self, read_mock, generate_mock):
+        async def generate_all():
+            return await asyncio.gather(*[
+                self.runner.generate(SubFrameVDSGenerator, self.directory,
+                                     files=[file_], log_level=3)
+                for file_ in self.files])
+
+        generators = asyncio.run(generate_all())
+
+        self.assertEqual(2, len(generators))
+        self.assertEqual(2, generate_mock.call_count)
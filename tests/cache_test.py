@@ -0,0 +1,80 @@
+import unittest
+from mock import MagicMock
+
+from vdsgen.cache import LayoutCache, MetadataCache
+
+from tests import TempDirTestCase
+
+
+class LayoutCacheTest(unittest.TestCase):
+
+    def test_get_creates_once(self):
+        cache = LayoutCache()
+        factory = MagicMock(return_value="layout")
+
+        self.assertEqual("layout", cache.get("key", factory))
+        self.assertEqual("layout", cache.get("key", factory))
+
+        factory.assert_called_once_with()
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_get_evicts_least_recently_used(self):
+        cache = LayoutCache(max_entries=2)
+        cache.get("one", lambda: 1)
+        cache.get("two", lambda: 2)
+        cache.get("one", lambda: 1)  # Make "two" least recently used
+        cache.get("three", lambda: 3)
+
+        factory = MagicMock(return_value=2)
+        cache.get("two", factory)
+        factory.assert_called_once_with()
+        self.assertEqual(2, len(cache))
+
+
+class MetadataCacheTest(TempDirTestCase):
+
+    def setUp(self):
+        super(MetadataCacheTest, self).setUp()
+        self.raw_file = self.file_path("raw_0.h5")
+        with open(self.raw_file, "w") as f:
+            f.write("data")
+
+    def test_get_metadata_unchanged_file_then_cached(self):
+        cache = MetadataCache()
+        loader = MagicMock(return_value=dict(frames=(3,)))
+
+        cache.get_metadata(self.raw_file, "data", loader)
+        metadata = cache.get_metadata(self.raw_file, "data", loader)
+
+        loader.assert_called_once_with(self.raw_file)
+        self.assertEqual(dict(frames=(3,)), metadata)
+
+    def test_get_metadata_modified_file_then_reloaded(self):
+        cache = MetadataCache()
+        loader = MagicMock(return_value=dict(frames=(3,)))
+
+        cache.get_metadata(self.raw_file, "data", loader)
+        with open(self.raw_file, "a") as f:
+            f.write("more data")
+        cache.get_metadata(self.raw_file, "data", loader)
+
+        self.assertEqual(2, loader.call_count)
+
+    def test_get_metadata_different_node_then_loaded(self):
+        cache = MetadataCache()
+        loader = MagicMock(return_value=dict(frames=(3,)))
+
+        cache.get_metadata(self.raw_file, "data", loader)
+        cache.get_metadata(self.raw_file, "timestamps", loader)
+
+        self.assertEqual(2, loader.call_count)
+
+    def test_get_metadata_other_nodes_then_loaded(self):
+        cache = MetadataCache()
+        loader = MagicMock(return_value=dict(frames=(3,)))
+
+        cache.get_metadata(self.raw_file, "data", loader)
+        cache.get_metadata(self.raw_file, "data", loader, ["timestamps"])
+
+        self.assertEqual(2, loader.call_count)
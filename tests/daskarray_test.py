@@ -0,0 +1,125 @@
+import unittest
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.layoutplan import LayoutPlan, PlanSource
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+from vdsgen.reshapevdsgenerator import ReshapeVDSGenerator
+from vdsgen.daskarray import split_axis, plan_chunks, read_block, \
+    from_plan, from_generator
+
+try:
+    import dask  # noqa: F401
+except ImportError:
+    dask = None
+
+from tests import TempDirTestCase
+
+
+class SplitAxisTest(unittest.TestCase):
+
+    def test_cut_at_candidates(self):
+        self.assertEqual((4, 3, 3), split_axis(10, [0, 4, 7, 10], 5))
+
+    def test_cut_at_limit_without_candidates(self):
+        self.assertEqual((4, 4, 2), split_axis(10, [0, 10], 4))
+
+
+class PlanChunksTest(unittest.TestCase):
+
+    def setUp(self):
+        # 10 frames of two stripes with a gap row, from 2 files each
+        self.plan = LayoutPlan((10, 5, 4), "uint16")
+        for stripe in range(2):
+            for idx in range(2):
+                source = PlanSource("/s{}_{}.h5".format(stripe, idx), "data",
+                                    (5, 2, 4), "uint16")
+                self.plan[idx * 5:idx * 5 + 5,
+                          stripe * 3:stripe * 3 + 2] = source
+
+    def test_frame_axes_cut_at_mappings_within_budget(self):
+        chunks = plan_chunks(self.plan, block_bytes=8 * 5 * 4 * 2)
+
+        self.assertEqual(((5, 5), (2, 1, 2), (4,)), chunks)
+
+    def test_frame_axes_cut_at_source_chunks(self):
+        source_chunks = {("/s{}_{}.h5".format(stripe, idx), "data"):
+                         (2, 2, 4) for stripe in range(2) for idx in range(2)}
+
+        chunks = plan_chunks(self.plan, block_bytes=3 * 5 * 4 * 2,
+                             source_chunks=source_chunks)
+
+        self.assertEqual((2, 3, 2, 3), chunks[0])
+
+
+@unittest.skipIf(dask is None, "dask is not installed")
+class FromPlanTest(TempDirTestCase):
+
+    def setUp(self):
+        super(FromPlanTest, self).setUp()
+        self.data = {}
+        rng = np.random.RandomState(0)
+        for stripe in range(2):
+            for idx in range(2):
+                name = "stripe{}_{}.h5".format(stripe, idx)
+                self.data[name] = rng.randint(0, 100, (5, 3, 4))
+                with h5.File(self.file_path(name), "w") as f:
+                    f.create_dataset("data", data=self.data[name],
+                                     chunks=(1, 3, 4))
+
+    def assert_matches_vds(self, generator, node=None, **kwargs):
+        generator.generate_vds()
+        array = from_generator(generator, node, **kwargs)
+
+        with h5.File(generator.output_file, "r") as f:
+            np.testing.assert_array_equal(
+                f[node or generator.target_node][...], array.compute())
+        return array
+
+    def test_interleave(self):
+        self.assert_matches_vds(InterleaveVDSGenerator(
+            self.directory, prefix="stripe0_", output="frames.h5"))
+
+    def test_subframe_with_gaps(self):
+        array = self.assert_matches_vds(SubFrameVDSGenerator(
+            self.directory, files=["stripe0_0.h5", "stripe1_0.h5"],
+            output="frames.h5", stripe_spacing=2, module_spacing=1,
+            fill_value=7), block_bytes=2 * 8 * 4 * 8)
+
+        # Gap rows are filled without reading any sources
+        self.assertEqual(((2, 2, 1), (3, 2, 3), (4,)), array.chunks)
+        tasks = dict(array.__dask_graph__())
+        gap = tasks[(array.name, 0, 1, 0)]
+        self.assertIs(np.full, gap[0])
+        self.assertIs(read_block, tasks[(array.name, 0, 0, 0)][0])
+
+    def test_reshape(self):
+        with h5.File(self.file_path("long.h5"), "w") as f:
+            f.create_dataset("data", data=np.arange(10 * 3 * 4).reshape(
+                10, 3, 4), chunks=(2, 3, 4))
+
+        array = self.assert_matches_vds(ReshapeVDSGenerator(
+            (5, 2), self.directory, files=["long.h5"], output="frames.h5"),
+            block_bytes=4 * 3 * 4 * 8)
+
+        self.assertEqual(((2, 2, 1), (2,)), array.chunks[:2])
+
+    def test_frame_range_and_roi(self):
+        self.assert_matches_vds(InterleaveVDSGenerator(
+            self.directory, prefix="stripe0_", output="frames.h5",
+            frame_range=(1, 9, 3), roi=(1, 1, 2, 2)))
+
+    def test_unmapped_frames(self):
+        plan = LayoutPlan((8, 3, 4), "int64")
+        plan[2:7] = PlanSource(self.file_path("stripe0_0.h5"), "data",
+                               (5, 3, 4), "int64")
+
+        array = from_plan(plan, fill_value=-1, block_bytes=2 * 3 * 4 * 8)
+
+        expected = np.full((8, 3, 4), -1)
+        expected[2:7] = self.data["stripe0_0.h5"]
+        np.testing.assert_array_equal(expected, array.compute())
+        self.assertIs(np.full, dict(array.__dask_graph__())[
+            (array.name, 0, 0, 0)][0])
@@ -10,6 +10,7 @@ vdsgen_patch_path = "vdsgen.excaliburgapfillvdsgenerator"
 gapfill_vdsgen_patch_path = "vdsgen.gapfillvdsgenerator"
 GapFillVDSGenerator_patch_path = vdsgen_patch_path + ".GapFillVDSGenerator"
 h5py_patch_path = "h5py"
+layoutplan_patch_path = "vdsgen.layoutplan"
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "h5py"))
 
@@ -73,8 +74,8 @@ class SimpleFunctionsTest(unittest.TestCase):
            '.ExcaliburGapFillVDSGenerator.construct_vds_spacing',
            return_value=([3, 3, 3, 3, 3, 3, 3, 0], [3, 123, 3, 123, 3, 0]))
     @patch(h5py_patch_path + '.File', return_value=file_mock)
-    @patch(h5py_patch_path + '.VirtualSource')
-    @patch(h5py_patch_path + '.VirtualLayout')
+    @patch(layoutplan_patch_path + '.PlanSource')
+    @patch(layoutplan_patch_path + '.StreamingLayout')
     def test_create_virtual_layout(self, layout_mock, source_mock, file_mock,
                                    construct_mock):
         gen = ExcaliburGapFillVDSGeneratorTester(
@@ -93,5 +94,5 @@ class SimpleFunctionsTest(unittest.TestCase):
 
         layout_mock.assert_called_once_with((3, 1791, 2069), "uint16")
         source_mock.assert_called_once_with(
-            "raw.h5", name="data", dtype="uint16", shape=(3, 1536, 2048))
+            "raw.h5", "data", (3, 1536, 2048), "uint16")
         # TODO: Pass numpy arrays to check slicing
@@ -0,0 +1,92 @@
+import numpy as np
+import h5py as h5
+
+from vdsgen.flatten import flatten_vds
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+from vdsgen.reshapevdsgenerator import ReshapeVDSGenerator
+from vdsgen.vdsgenerator import VDSGenerator
+
+from tests import TempDirTestCase
+
+
+class FlattenVDSTest(TempDirTestCase):
+
+    def setUp(self):
+        super(FlattenVDSTest, self).setUp()
+        rng = np.random.RandomState(0)
+        # Two stripes, each with 10 frames interleaved across two files
+        for stripe in range(2):
+            for idx in range(2):
+                with h5.File(self.file_path("stripe{}_{}.h5".format(
+                        stripe, idx)), "w") as f:
+                    f["data"] = rng.randint(0, 100, (5, 3, 4))
+
+        for idx in range(2):
+            InterleaveVDSGenerator(
+                self.directory, prefix="stripe{}_".format(idx)).generate_vds()
+        SubFrameVDSGenerator(self.directory,
+                             files=["stripe0_vds.h5", "stripe1_vds.h5"],
+                             output="frames.h5", stripe_spacing=1,
+                             module_spacing=1).generate_vds()
+        ReshapeVDSGenerator((2, 5), self.directory, files=["frames.h5"],
+                            output="nested.h5").generate_vds()
+
+    def test_flatten_vds(self):
+        with h5.File(self.file_path("nested.h5"), "r+") as f:
+            f["data"].attrs["units"] = "counts"
+
+        stats = flatten_vds(self.file_path("nested.h5"),
+                            self.file_path("flat.h5"))
+
+        with h5.File(self.file_path("nested.h5"), "r") as nested, \
+                h5.File(self.file_path("flat.h5"), "r") as flat:
+            np.testing.assert_array_equal(nested["data"][...],
+                                          flat["data"][...])
+            self.assertEqual(nested["data"].fillvalue,
+                             flat["data"].fillvalue)
+            self.assertEqual("counts", flat["data"].attrs["units"])
+            v_maps = flat["data"].virtual_sources()
+        self.assertEqual(set(self.file_path("stripe{}_{}.h5".format(s, i))
+                             for s in range(2) for i in range(2)),
+                         set(v_map.file_name for v_map in v_maps))
+        # 1 reshape + 2 subframe + 2 x 2 interleave mappings
+        self.assertEqual(dict(before=1, nested=7, after=len(v_maps)), stats)
+
+    def test_flatten_drops_fingerprint(self):
+        flatten_vds(self.file_path("nested.h5"), self.file_path("flat.h5"))
+
+        with h5.File(self.file_path("nested.h5"), "r") as nested, \
+                h5.File(self.file_path("flat.h5"), "r") as flat:
+            self.assertIn(VDSGenerator.FINGERPRINT, nested["data"].attrs)
+            self.assertNotIn(VDSGenerator.FINGERPRINT, flat["data"].attrs)
+
+    def test_flatten_different_fill_value_then_error(self):
+        ReshapeVDSGenerator((2, 5), self.directory, files=["frames.h5"],
+                            output="filled.h5", fill_value=7).generate_vds()
+
+        with self.assertRaises(ValueError):
+            flatten_vds(self.file_path("filled.h5"),
+                        self.file_path("flat.h5"))
+
+    def test_flatten_raw_then_error(self):
+        with self.assertRaises(ValueError):
+            flatten_vds(self.file_path("stripe0_0.h5"),
+                        self.file_path("flat.h5"))
+
+    def test_flatten_existing_node_then_error(self):
+        with self.assertRaises(IOError):
+            flatten_vds(self.file_path("nested.h5"),
+                        self.file_path("frames.h5"))
+
+    def test_flatten_cycle_then_error(self):
+        with h5.File(self.file_path("cycle.h5"), "w", libver="latest") as f:
+            layout = h5.VirtualLayout((2,), "i4")
+            layout[...] = h5.VirtualSource(".", "other", (2,))
+            f.create_virtual_dataset("data", layout)
+            layout = h5.VirtualLayout((2,), "i4")
+            layout[...] = h5.VirtualSource(".", "data", (2,))
+            f.create_virtual_dataset("other", layout)
+
+        with self.assertRaises(ValueError):
+            flatten_vds(self.file_path("cycle.h5"), self.file_path("flat.h5"))
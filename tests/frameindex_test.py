@@ -0,0 +1,75 @@
+import os
+import unittest
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.frameindex import FrameIndex, Location
+from vdsgen.layoutplan import LayoutPlan, PlanSource
+
+from tests import TempDirTestCase
+
+
+class FrameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        # Two stripes, each with 6 frames interleaved across 2 files in
+        # blocks of 2
+        self.plan = LayoutPlan((6, 4, 3), "int32")
+        for stripe in range(2):
+            for idx in range(2):
+                source = PlanSource("/s{}_{}.h5".format(stripe, idx), "data",
+                                    (4, 2, 3), "int32")
+                self.plan[h5.MultiBlockSlice(idx * 2, 4, None, 2),
+                          stripe * 2:stripe * 2 + 2] = \
+                    source[:4 if idx == 0 else 2]
+
+    def test_from_plan(self):
+        index = FrameIndex.from_plan(self.plan)
+
+        self.assertEqual(["/s0_0.h5", "/s0_1.h5", "/s1_0.h5", "/s1_1.h5"],
+                         index.files)
+        self.assertEqual([(0, 0, 2, 0, 0), (0, 2, 2, 1, 0), (0, 4, 2, 0, 2),
+                          (1, 0, 2, 2, 0), (1, 2, 2, 3, 0), (1, 4, 2, 2, 2)],
+                         index.runs.tolist())
+        np.testing.assert_array_equal([[0, 2, 0, 3], [2, 4, 0, 3]],
+                                      index.regions)
+
+    def test_lookup(self):
+        index = FrameIndex.from_plan(self.plan)
+
+        self.assertEqual([Location(0, "/s0_0.h5", 3),
+                          Location(1, "/s1_0.h5", 3)], index.lookup(5))
+        self.assertEqual([Location(0, "/s0_1.h5", 1),
+                          Location(1, "/s1_1.h5", 1)], index.lookup((3,)))
+
+    def test_lookup_unmapped(self):
+        plan = LayoutPlan((6, 4, 3), "int32")
+        plan[2:4] = PlanSource("/raw.h5", "data", (2, 4, 3), "int32")
+        index = FrameIndex.from_plan(plan)
+
+        self.assertEqual([], index.lookup(1))
+        self.assertEqual([Location(0, "/raw.h5", 1)], index.lookup(3))
+        self.assertEqual([], index.lookup(4))
+
+
+class FrameIndexFileTest(TempDirTestCase):
+
+    def setUp(self):
+        super(FrameIndexFileTest, self).setUp()
+        for idx in range(2):
+            with h5.File(os.path.join(self.directory,
+                                      "stripe_{}.h5".format(idx)), "w") as f:
+                f["data"] = np.zeros((3, 2, 4))
+
+    def test_generate_vds_frame_index(self):
+        from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+
+        gen = InterleaveVDSGenerator(self.directory, prefix="stripe_",
+                                     frame_index=True)
+        gen.generate_vds()
+
+        with h5.File(gen.output_file, "r") as vds:
+            index = FrameIndex.read(vds, "data_frame_index")
+        self.assertEqual([Location(0, gen.files[1], 2)], index.lookup(5))
+        self.assertEqual((6,), index.frame_shape)
@@ -0,0 +1,85 @@
+import os
+import unittest
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.layoutplan import LayoutPlan, PlanSource
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+from vdsgen.framestats import gap_mask, frame_statistics, scan_vds
+
+from tests import TempDirTestCase
+
+
+class FrameStatisticsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = np.array([[[1, 2], [3, 255]],
+                                [[0, 0], [9, 1]]], dtype="uint8")
+
+    def test_statistics(self):
+        statistics = frame_statistics(self.frames)
+
+        self.assertEqual([261, 10], statistics["sum"].tolist())
+        self.assertEqual([255, 9], statistics["max"].tolist())
+        self.assertEqual([1, 0], statistics["saturated"].tolist())
+        self.assertEqual(np.int64, statistics["sum"].dtype)
+
+    def test_statistics_mask_and_saturation(self):
+        mask = np.array([[True, True], [True, False]])
+
+        statistics = frame_statistics(self.frames, mask, saturation=3)
+
+        self.assertEqual([6, 9], statistics["sum"].tolist())
+        self.assertEqual([3, 9], statistics["max"].tolist())
+        self.assertEqual([1, 1], statistics["saturated"].tolist())
+
+    def test_gap_mask(self):
+        plan = LayoutPlan((4, 5, 3), "uint8")
+        plan[:, 0:2] = PlanSource("/raw_1.h5", "data", (4, 2, 3), "uint8")
+        plan[:, 3:5, 1:3] = PlanSource("/raw_2.h5", "data", (4, 2, 2),
+                                       "uint8")
+
+        np.testing.assert_array_equal(
+            [[1, 1, 1], [1, 1, 1], [0, 0, 0], [0, 1, 1], [0, 1, 1]],
+            gap_mask(plan))
+
+
+class ScanVDSTest(TempDirTestCase):
+
+    def setUp(self):
+        super(ScanVDSTest, self).setUp()
+        rng = np.random.RandomState(0)
+        for idx in range(2):
+            with h5.File(os.path.join(self.directory,
+                                      "stripe_{}.h5".format(idx)), "w") as f:
+                f["data"] = rng.randint(0, 1000, (6, 3, 4)).astype("uint16")
+        SubFrameVDSGenerator(self.directory, prefix="stripe_",
+                             stripe_spacing=2, module_spacing=1,
+                             fill_value=65535).generate_vds()
+        self.vds = os.path.join(self.directory, "stripe_vds.h5")
+        with h5.File(self.vds, "r") as f:
+            self.data = f["data"][...]
+
+    def test_scan_vds_excluding_gaps(self):
+        statistics = scan_vds(self.vds, exclude_gaps=True, processes=2,
+                              batch_bytes=2 * 8 * 4 * 2)
+
+        pixels = np.concatenate([self.data[:, :3], self.data[:, 5:]], axis=1)
+        np.testing.assert_array_equal(pixels.sum(axis=(1, 2)),
+                                      statistics["sum"])
+        np.testing.assert_array_equal(pixels.max(axis=(1, 2)),
+                                      statistics["max"])
+        np.testing.assert_array_equal(0, statistics["saturated"])
+        with h5.File(self.vds, "r") as f:
+            np.testing.assert_array_equal(statistics["sum"], f["data_sum"])
+            np.testing.assert_array_equal(statistics["max"], f["data_max"])
+            self.assertEqual((6,), f["data_saturated"].shape)
+
+    def test_scan_vds_including_gaps(self):
+        statistics = scan_vds(self.vds)
+
+        # Gap rows are the fill value, which is saturated
+        np.testing.assert_array_equal(2 * 4, statistics["saturated"])
+        np.testing.assert_array_equal(
+            self.data.astype(np.int64).sum(axis=(1, 2)), statistics["sum"])
@@ -1,6 +1,7 @@
 import os
 import sys
 import unittest
+import tracemalloc
 from mock import MagicMock, patch, call
 
 from vdsgen import vdsgenerator
@@ -9,6 +10,7 @@ from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
 vdsgen_patch_path = "vdsgen.interleavevdsgenerator"
 VDSGenerator_patch_path = vdsgen_patch_path + ".VDSGenerator"
 h5py_patch_path = "h5py"
+layoutplan_patch_path = "vdsgen.layoutplan"
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "h5py"))
 
@@ -67,10 +69,10 @@ class SimpleFunctionsTest(unittest.TestCase):
     file_mock = MagicMock()
 
     @patch(h5py_patch_path + '.File', return_value=file_mock)
-    @patch(h5py_patch_path + '.VirtualSource',
+    @patch(layoutplan_patch_path + '.PlanSource',
            side_effect=[MagicMock(shape=(3, 256, 2048)),
                         MagicMock(shape=(2, 256, 2048))])
-    @patch(h5py_patch_path + '.VirtualLayout')
+    @patch(layoutplan_patch_path + '.StreamingLayout')
     def test_create_virtual_layout(self, layout_mock, source_mock, file_mock):
         gen = InterleaveVDSGeneratorTester(
             output_file="/test/path/vds.hdf5",
@@ -88,7 +90,27 @@ class SimpleFunctionsTest(unittest.TestCase):
 
         layout_mock.assert_called_once_with((5, 256, 2048), "uint16")
         source_mock.assert_has_calls(
-            [call("raw1.h5", dtype="uint16", name="data", shape=(3, 256, 2048)),
-             call("raw2.h5", dtype="uint16", name="data", shape=(2, 256, 2048))],
+            [call("raw1.h5", "data", (3, 256, 2048), "uint16"),
+             call("raw2.h5", "data", (2, 256, 2048), "uint16")],
             any_order=True)
         # TODO: Pass numpy arrays to check slicing
+
+    def test_create_target_layout_memory_bounded(self):
+        files = ["raw{}.h5".format(idx) for idx in range(4)]
+        gen = InterleaveVDSGeneratorTester(
+            files=files, block_size=1, source_node="data", name="vds.h5",
+            source_metadata=vdsgenerator.SourceMeta(
+                frames=(1000000,) * 4, height=256, width=2048,
+                dtype="uint16"))
+        gen.create_target_layout()  # Import modules before measuring
+
+        tracemalloc.start()
+        try:
+            layout = gen.create_target_layout()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # One MultiBlockSlice mapping per file, whatever the frame count
+        self.assertEqual(4, layout.mapping_count)
+        self.assertLess(peak, 1000000)
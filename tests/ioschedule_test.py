@@ -0,0 +1,103 @@
+import unittest
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.layoutplan import LayoutPlan, PlanSource
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+from vdsgen.reshapevdsgenerator import ReshapeVDSGenerator
+from vdsgen.ioschedule import schedule_reads, schedule_vds_reads, \
+    read_frames, read_vds_frames, mapping_reads
+
+from tests import TempDirTestCase
+
+
+class MappingReadsTest(unittest.TestCase):
+
+    def test_scattered_frames(self):
+        plan = LayoutPlan((40, 2, 3), "int32")
+        plan[...] = PlanSource("/raw.h5", "data", (40, 2, 3), "int32")
+        frames = [7, 3, 30, 8, 3, 9, 0, 31, 20]
+
+        reads = mapping_reads(plan.take(frames).mappings[0])
+
+        # Runs of consecutive source frames, each with its requested frames
+        self.assertEqual([(0, 1), (3, 4), (7, 10), (20, 21), (30, 32)],
+                         [(read.source[0].start, read.source[0].stop)
+                          for read in reads])
+        requested = {}
+        for read in reads:
+            for frame, position in zip(read.frames, read.positions):
+                requested[int(position)] = read.source[0].start + frame
+        self.assertEqual(frames, [requested[idx]
+                                  for idx in range(len(frames))])
+
+
+class ScheduleTest(TempDirTestCase):
+
+    def setUp(self):
+        super(ScheduleTest, self).setUp()
+        rng = np.random.RandomState(0)
+        for stripe in range(2):
+            for idx in range(2):
+                with h5.File(self.file_path("stripe{}_{}.h5".format(
+                        stripe, idx)), "w") as f:
+                    f.create_dataset("data",
+                                     data=rng.randint(0, 100, (5, 3, 4)),
+                                     chunks=(1, 3, 4) if stripe else None)
+        for stripe in range(2):
+            InterleaveVDSGenerator(self.directory,
+                                   prefix="stripe{}_".format(stripe),
+                                   output="frames{}.h5".format(stripe),
+                                   fill_value=-1).generate_vds()
+
+    def test_schedule_reads_in_source_order(self):
+        reads = schedule_vds_reads(self.file_path("frames0.h5"),
+                                   [5, 0, 2, 9, 3, 2])
+
+        # Frames 0, 2 from stripe0_0 (0, 1) and 3, 5, 9 from stripe0_1
+        # (1, 2, 4) - each file once, in offset order, adjacent frames merged
+        self.assertEqual([(self.file_path("stripe0_0.h5"), slice(0, 2)),
+                          (self.file_path("stripe0_1.h5"), slice(1, 3)),
+                          (self.file_path("stripe0_1.h5"), slice(4, 5))],
+                         [(read.file_path, read.source[0]) for read in reads])
+        self.assertLess(reads[1].offset, reads[2].offset)
+        self.assertEqual([1, 2, 5], sorted(reads[0].positions.tolist()))
+
+    def test_read_vds_frames(self):
+        frames = [5, 0, 2, 9, 3, 2]
+
+        for name in ["frames0.h5", "frames1.h5"]:
+            with h5.File(self.file_path(name), "r") as f:
+                expected = f["data"][...][frames]
+            np.testing.assert_array_equal(
+                expected, read_vds_frames(self.file_path(name), frames))
+
+    def test_read_nested_vds_with_gaps(self):
+        SubFrameVDSGenerator(self.directory,
+                             files=["frames0.h5", "frames1.h5"],
+                             output="stripes.h5", stripe_spacing=2,
+                             module_spacing=1, fill_value=-1).generate_vds()
+        ReshapeVDSGenerator((2, 5), self.directory, files=["stripes.h5"],
+                            output="nested.h5").generate_vds()
+        frames = [7, 1, 8, 4]
+
+        with h5.File(self.file_path("nested.h5"), "r") as f:
+            expected = f["data"][...].reshape(10, 8, 4)[frames]
+        np.testing.assert_array_equal(
+            expected, read_vds_frames(self.file_path("nested.h5"), frames))
+
+    def test_read_frames_missing_source(self):
+        plan = LayoutPlan((4, 3, 4), "int64")
+        plan[0:2] = PlanSource(self.file_path("stripe0_0.h5"), "data",
+                               (5, 3, 4), "int64")[3:5]
+        plan[2:4] = PlanSource(self.file_path("missing.h5"), "data",
+                               (2, 3, 4), "int64")
+
+        data = read_frames(plan, [3, 1], fill_value=-1)
+
+        with h5.File(self.file_path("stripe0_0.h5"), "r") as f:
+            np.testing.assert_array_equal(f["data"][4], data[1])
+        np.testing.assert_array_equal(-1, data[0])
+        self.assertEqual(1, len(schedule_reads(plan, [3, 1])))
@@ -0,0 +1,332 @@
+import os
+import unittest
+import tracemalloc
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.layoutplan import LayoutPlan, PlanSource, Run, StreamingLayout, \
+    axis_indices, compose_axis, frame_pieces, hyperslab, regular_runs, \
+    selection_hyperslab, shard_ranges
+
+from tests import TempDirTestCase
+
+
+class AxisIndicesTest(unittest.TestCase):
+
+    def test_selections(self):
+        indices = axis_indices(
+            (h5.MultiBlockSlice(1, 4, 2, 2), slice(1, 6, 2), -1), (10, 6, 3))
+
+        np.testing.assert_array_equal([1, 2, 5, 6], indices[0])
+        np.testing.assert_array_equal([1, 3, 5], indices[1])
+        np.testing.assert_array_equal([2], indices[2])
+
+    def test_ellipsis(self):
+        indices = axis_indices((Ellipsis, slice(0, 2)), (2, 3, 4))
+
+        self.assertEqual([2, 3, 2], [len(axis) for axis in indices])
+
+    def test_too_many_axes_then_error(self):
+        with self.assertRaises(ValueError):
+            axis_indices((0, 0, 0), (2, 3))
+
+
+class RegularRunsTest(unittest.TestCase):
+
+    def test_blocks(self):
+        target = np.array([0, 1, 6, 7, 12, 13, 18])
+        source = np.arange(7)
+
+        runs = regular_runs(target, source)
+
+        self.assertEqual([Run(0, 6, 0, 2, 3, 2), Run(18, 1, 6, 1, 1, 1)],
+                         runs)
+
+    def test_reversed(self):
+        runs = regular_runs(np.array([0, 1, 2]), np.array([2, 1, 0]))
+
+        self.assertEqual([Run(0, 1, 2, 1, 1, 1), Run(1, 1, 1, 1, 1, 1),
+                          Run(2, 1, 0, 1, 1, 1)], runs)
+
+    def test_empty(self):
+        self.assertEqual([], regular_runs(np.array([]), np.array([])))
+
+
+class FramePiecesTest(unittest.TestCase):
+
+    def test_reshape_full_rows(self):
+        pieces = frame_pieces(0, 0, 6, (2, 3), (6,))
+
+        self.assertEqual([((slice(0, 2), slice(0, 3)), (slice(0, 6),))],
+                         pieces)
+
+    def test_partial_rows(self):
+        pieces = frame_pieces(2, 0, 3, (2, 3), (6,))
+
+        self.assertEqual([((slice(0, 1), slice(2, 3)), (slice(0, 1),)),
+                          ((slice(1, 2), slice(0, 2)), (slice(1, 3),))],
+                         pieces)
+
+
+class LayoutPlanTest(unittest.TestCase):
+
+    def test_setitem(self):
+        plan = LayoutPlan((6, 4, 5), "int32")
+        source = PlanSource("raw.h5", "data", (3, 4, 5), "int32")
+
+        plan[h5.MultiBlockSlice(0, 2, 3, 1), :, 1:] = source[:, :, :4]
+
+        mapping = plan.mappings[0]
+        self.assertEqual(("raw.h5", "data", (3, 4, 5)), mapping[:3])
+        np.testing.assert_array_equal([0, 2, 4], mapping.frames[0])
+        np.testing.assert_array_equal([0, 1, 2], mapping.frames[1])
+        np.testing.assert_array_equal([1, 2, 3, 4], mapping.axes[1][0])
+        np.testing.assert_array_equal([0, 1, 2, 3], mapping.axes[1][1])
+
+    def test_mismatched_selections_then_error(self):
+        plan = LayoutPlan((6, 4, 5), "int32")
+        source = PlanSource("raw.h5", "data", (3, 4, 5), "int32")
+
+        with self.assertRaises(ValueError):
+            plan[0:2] = source
+
+    def test_compose_axis(self):
+        target, source = compose_axis(
+            (np.array([10, 11, 12]), np.array([0, 1, 2])),
+            (np.array([2, 1]), np.array([7, 5])))
+
+        np.testing.assert_array_equal([11, 12], target)
+        np.testing.assert_array_equal([5, 7], source)
+
+    def test_compose_axis_empty(self):
+        empty = np.array([], dtype=np.int64)
+
+        for outer, inner in [((np.array([10, 11]), np.array([0, 1])),
+                              (empty, empty)),
+                             ((empty, empty),
+                              (np.array([2, 1]), np.array([7, 5])))]:
+            target, source = compose_axis(outer, inner)
+
+            self.assertEqual((0, 0), (len(target), len(source)))
+
+    def test_compose(self):
+        inner = LayoutPlan((4, 2, 2), "int32")
+        inner[0:2] = PlanSource("/raw_1.h5", "data", (2, 2, 2), "int32")
+        inner[2:4] = PlanSource("/raw_2.h5", "data", (2, 2, 2), "int32")
+        outer = LayoutPlan((2, 2, 2), "int32")
+        outer[...] = PlanSource("/inner.h5", "data", (4, 2, 2), "int32")[1:3]
+
+        plan = outer.compose({("/inner.h5", "data"): inner})
+
+        self.assertEqual(["/raw_1.h5", "/raw_2.h5"],
+                         [mapping.file_path for mapping in plan.mappings])
+        self.assertEqual([((slice(0, 1), slice(0, 2), slice(0, 2)),
+                           (slice(1, 2), slice(0, 2), slice(0, 2)))],
+                         plan.selections(plan.mappings[0]))
+        self.assertEqual([((slice(1, 2), slice(0, 2), slice(0, 2)),
+                           (slice(0, 1), slice(0, 2), slice(0, 2)))],
+                         plan.selections(plan.mappings[1]))
+
+    def test_compose_shape_mismatch_then_error(self):
+        inner = LayoutPlan((4, 2, 2), "int32")
+        outer = LayoutPlan((2, 2, 2), "int32")
+        outer[...] = PlanSource("/inner.h5", "data", (2, 2, 2), "int32")
+
+        with self.assertRaises(ValueError):
+            outer.compose({("/inner.h5", "data"): inner})
+
+    def test_view(self):
+        plan = LayoutPlan((4, 2, 2), "int32")
+        plan[0:2] = PlanSource("/raw_1.h5", "data", (2, 2, 2), "int32")
+        plan[2:4] = PlanSource("/raw_2.h5", "data", (2, 2, 2), "int32")
+
+        view = plan.view((slice(2, 4), slice(None), slice(1, 2)))
+
+        self.assertEqual((2, 2, 1), view.shape)
+        self.assertEqual([((slice(0, 2), slice(0, 2), slice(0, 1)),
+                           (slice(0, 2), slice(0, 2), slice(1, 2)))],
+                         [selection for mapping in view.mappings
+                          for selection in view.selections(mapping)])
+        self.assertEqual(["/raw_2.h5"],
+                         [mapping.file_path for mapping in view.mappings])
+
+    def test_take(self):
+        plan = LayoutPlan((2, 2, 2, 2), "int32")
+        plan[0] = PlanSource("/raw_1.h5", "data", (2, 2, 2), "int32")
+        plan[1] = PlanSource("/raw_2.h5", "data", (2, 2, 2), "int32")
+
+        taken = plan.take([3, 0, 3])
+
+        self.assertEqual((3, 2, 2), taken.shape)
+        self.assertEqual(1, taken.frame_axes)
+        self.assertEqual([("/raw_1.h5", [1], [0]), ("/raw_2.h5", [0, 2],
+                                                    [1, 1])],
+                         [(mapping.file_path, mapping.frames[0].tolist(),
+                           mapping.frames[1].tolist())
+                          for mapping in taken.mappings])
+
+    def test_take_out_of_range_then_error(self):
+        plan = LayoutPlan((4, 2, 2), "int32")
+
+        with self.assertRaises(ValueError):
+            plan.take([4])
+
+
+class HyperslabTest(unittest.TestCase):
+
+    def test_hyperslab(self):
+        self.assertEqual(((2, 1), (1, 3), (1, 4), (5, 2)),
+                         hyperslab((slice(2, 7),
+                                    h5.MultiBlockSlice(1, 4, 3, 2))))
+
+
+class SelectionHyperslabTest(unittest.TestCase):
+
+    def test_selections(self):
+        self.assertEqual(((1, 1, 2), (5, 3, 1), (4, 2, 1), (2, 1, 1)),
+                         selection_hyperslab(
+                             (h5.MultiBlockSlice(1, 4, None, 2),
+                              slice(1, 6, 2), -1), (20, 6, 3)))
+
+    def test_ellipsis(self):
+        self.assertEqual(((0, 0, 1), (1, 1, 1), (1, 1, 1), (2, 3, 2)),
+                         selection_hyperslab((Ellipsis, slice(1, 3)),
+                                             (2, 3, 4)))
+
+    def test_negative_step_then_error(self):
+        with self.assertRaises(ValueError):
+            selection_hyperslab(slice(None, None, -1), (4,))
+
+
+class CreateVirtualDatasetTest(TempDirTestCase):
+
+    def setUp(self):
+        super(CreateVirtualDatasetTest, self).setUp()
+        self.raw_file = os.path.join(self.directory, "raw.h5")
+        with h5.File(self.raw_file, "w") as f:
+            f["data"] = np.arange(6 * 2 * 3).reshape(6, 2, 3)
+
+    def test_create_virtual_dataset(self):
+        plan = LayoutPlan((4, 2, 3), "int64")
+        source = PlanSource(self.raw_file, "data", (6, 2, 3), "int64")
+        plan[0:3, :, 1:] = source[::2, :, :2]  # Regular run
+        plan[3] = source[1]
+
+        with h5.File(os.path.join(self.directory, "vds.h5"), "w",
+                     libver="latest") as f:
+            dataset = plan.create_virtual_dataset(f, "entry/data",
+                                                  fill_value=-1)
+            data = dataset[...]
+            self.assertEqual(2, len(dataset.virtual_sources()))
+
+        expected = np.full((4, 2, 3), -1)
+        with h5.File(self.raw_file, "r") as f:
+            expected[0:3, :, 1:] = f["data"][::2, :, :2]
+            expected[3] = f["data"][1]
+        np.testing.assert_array_equal(expected, data)
+
+    def test_streaming_layout(self):
+        layout = StreamingLayout((4, 2, 3), "int64")
+        source = PlanSource(self.raw_file, "data", (6, 2, 3), "int64")
+        layout[0:3, :, 1:] = source[::2, :, :2]
+        layout[3] = source[1]
+
+        vds_file = os.path.join(self.directory, "vds.h5")
+        with h5.File(vds_file, "w", libver="latest") as f:
+            data = layout.create_virtual_dataset(f, "data",
+                                                 fill_value=-1)[...]
+            expected_plan = LayoutPlan.from_dataset(f["data"])
+
+        expected = np.full((4, 2, 3), -1)
+        with h5.File(self.raw_file, "r") as f:
+            expected[0:3, :, 1:] = f["data"][::2, :, :2]
+            expected[3] = f["data"][1]
+        np.testing.assert_array_equal(expected, data)
+
+        plan = layout.to_plan(vds_file)
+        self.assertEqual(
+            [[tuple(map(hyperslab, selection))
+              for selection in plan.selections(mapping)]
+             for mapping in plan.mappings],
+            [[tuple(map(hyperslab, selection))
+              for selection in expected_plan.selections(mapping)]
+             for mapping in expected_plan.mappings])
+
+    def test_streaming_layout_mismatch_then_error(self):
+        layout = StreamingLayout((4, 2, 3), "int64")
+        source = PlanSource(self.raw_file, "data", (6, 2, 3), "int64")
+
+        with self.assertRaises(ValueError):
+            layout[0:3] = source[0:2]
+
+
+class StreamingLayoutMemoryTest(unittest.TestCase):
+
+    def test_memory_bounded(self):
+        # A LayoutPlan holds index arrays of every frame, so these would
+        # take tens of MB - a StreamingLayout holds nothing per mapping
+        frames = 4000000
+        tracemalloc.start()
+        try:
+            layout = StreamingLayout((frames, 256, 2048), "uint16")
+            for idx in range(4):
+                layout[h5.MultiBlockSlice(idx, 4, frames // 4, 1)] = \
+                    PlanSource("/raw_{}.h5".format(idx), "data",
+                               (frames // 4, 256, 2048), "uint16")
+            for idx in range(2000):  # One mapping per frame
+                layout[idx] = PlanSource("/raw.h5", "data",
+                                         (2000, 256, 2048), "uint16")[idx]
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(2004, layout.mapping_count)
+        self.assertLess(peak, 1000000)
+
+
+class ShardRangesTest(unittest.TestCase):
+
+    def setUp(self):
+        # 10 frames from 10 files, one mapping each
+        self.plan = LayoutPlan((10, 2, 2), "int32")
+        for idx in range(10):
+            self.plan[idx] = PlanSource("/raw_{}.h5".format(idx), "data",
+                                        (2, 2), "int32")
+
+    def test_max_mappings(self):
+        self.assertEqual([(0, 4), (4, 8), (8, 10)],
+                         shard_ranges([self.plan], max_mappings=4))
+
+    def test_max_mappings_counts_all_plans(self):
+        self.assertEqual([(0, 2), (2, 4), (4, 6), (6, 8), (8, 10)],
+                         shard_ranges([self.plan, self.plan], max_mappings=4))
+
+    def test_max_frames(self):
+        self.assertEqual([(0, 3), (3, 6), (6, 9), (9, 10)],
+                         shard_ranges([self.plan], max_frames=3))
+
+    def test_max_mappings_blocks_within_budget(self):
+        # Two sources interleaved in blocks of 2 frames - each view cut
+        # through a block maps partial blocks at either end
+        plan = LayoutPlan((40, 2, 2), "int32")
+        for idx in range(2):
+            plan[h5.MultiBlockSlice(idx * 2, 4, 10, 2)] = PlanSource(
+                "/raw_{}.h5".format(idx), "data", (20, 2, 2), "int32")
+
+        ranges = shard_ranges([plan], max_mappings=6)
+
+        self.assertEqual((0, 40), (ranges[0][0], ranges[-1][1]))
+        for start, stop in ranges:
+            self.assertLessEqual(
+                plan.view(slice(start, stop)).selection_count(), 6)
+
+    def test_max_mappings_single_frame_over_budget(self):
+        plan = LayoutPlan((2, 2, 2), "int32")
+        for idx in range(2):
+            plan[0:1, idx:idx + 1] = PlanSource(
+                "/raw_{}.h5".format(idx), "data", (1, 1, 2), "int32")
+        plan[1] = PlanSource("/raw_2.h5", "data", (2, 2), "int32")
+
+        self.assertEqual([(0, 1), (1, 2)],
+                         shard_ranges([plan], max_mappings=1))
@@ -0,0 +1,129 @@
+import os
+import unittest
+
+import numpy as np
+import h5py as h5
+from mock import patch
+
+from vdsgen import materialise
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+from vdsgen.materialise import add_range, remove_range, batch_ranges, \
+    materialise_vds, read_checkpoint, checkpoint_path
+
+from tests import TempDirTestCase
+
+
+class RangesTest(unittest.TestCase):
+
+    def test_add_range(self):
+        self.assertEqual([[0, 6], [8, 10]],
+                         add_range([[0, 2], [4, 6], [8, 10]], 2, 4))
+
+    def test_remove_range(self):
+        self.assertEqual([[0, 2], [4, 6]], remove_range([[0, 6]], 2, 4))
+        self.assertEqual([[0, 2]], remove_range([[0, 2], [4, 6]], 4, 6))
+
+    def test_batch_ranges(self):
+        self.assertEqual([(4, 6), (8, 9)],
+                         batch_ranges(9, 2, [[0, 4], [6, 8]]))
+
+
+class MaterialiseTest(TempDirTestCase):
+
+    def setUp(self):
+        super(MaterialiseTest, self).setUp()
+        rng = np.random.RandomState(0)
+        for idx in range(2):
+            with h5.File(self.file_path("raw_{}.h5".format(idx)), "w") as f:
+                f["data"] = rng.randint(0, 100, (5, 3, 4))
+        InterleaveVDSGenerator(self.directory, prefix="raw_").generate_vds()
+        self.vds = self.file_path("raw_vds.h5")
+        self.output = self.file_path("copy.h5")
+        with h5.File(self.vds, "r") as f:
+            self.expected = f["data"][...]
+
+    def materialise(self, **kwargs):
+        # Batches of 2 frames
+        return materialise_vds(self.vds, self.output,
+                               batch_bytes=2 * 3 * 4 * 8, **kwargs)
+
+    def interrupt(self, batches, **kwargs):
+        write_checkpoint = materialise.write_checkpoint
+        calls = []
+
+        def fail_after_batches(*args):
+            write_checkpoint(*args)
+            calls.append(args)
+            if len(calls) > batches:  # First call is before any batch
+                raise IOError("Node failure")
+
+        with patch.object(materialise, "write_checkpoint",
+                          side_effect=fail_after_batches):
+            with self.assertRaises(IOError):
+                self.materialise(**kwargs)
+
+    def test_materialise(self):
+        self.assertEqual(5, self.materialise())
+
+        with h5.File(self.output, "r") as f:
+            np.testing.assert_array_equal(self.expected, f["data"][...])
+            self.assertFalse(f["data"].is_virtual)
+            self.assertEqual((1, 3, 4), f["data"].chunks)
+        self.assertFalse(os.path.exists(checkpoint_path(self.output)))
+
+    def test_resume(self):
+        self.interrupt(batches=3)
+        self.assertEqual([[0, 6]], read_checkpoint(self.output)["done"])
+
+        self.assertEqual(2, self.materialise())
+
+        with h5.File(self.output, "r") as f:
+            np.testing.assert_array_equal(self.expected, f["data"][...])
+        self.assertFalse(os.path.exists(checkpoint_path(self.output)))
+
+    def test_resume_copies_bad_last_batch_again(self):
+        self.interrupt(batches=2)
+        with h5.File(self.output, "r+") as f:
+            f["data"][3] = 0
+
+        self.assertEqual(4, self.materialise())
+
+        with h5.File(self.output, "r") as f:
+            np.testing.assert_array_equal(self.expected, f["data"][...])
+
+    def test_resume_different_copy_then_error(self):
+        self.interrupt(batches=1)
+
+        with self.assertRaises(IOError):
+            self.materialise(chunks=(2, 3, 4))
+
+    def test_existing_node_without_checkpoint(self):
+        self.materialise()
+
+        with self.assertRaises(IOError):
+            self.materialise()
+        self.assertEqual(5, self.materialise(restart=True))
+
+    def test_statistics_across_resume(self):
+        self.interrupt(batches=2, statistics=True)
+
+        self.assertEqual(3, self.materialise(statistics=True))
+
+        with h5.File(self.output, "r") as f:
+            np.testing.assert_array_equal(self.expected.sum(axis=(1, 2)),
+                                          f["data_sum"])
+            np.testing.assert_array_equal(self.expected.max(axis=(1, 2)),
+                                          f["data_max"])
+            np.testing.assert_array_equal(0, f["data_saturated"])
+
+    def test_resume_creates_missing_statistics(self):
+        with patch.object(materialise, "create_statistics",
+                          side_effect=IOError("Node failure")):
+            with self.assertRaises(IOError):
+                self.materialise(statistics=True)
+
+        self.assertEqual(5, self.materialise(statistics=True))
+
+        with h5.File(self.output, "r") as f:
+            np.testing.assert_array_equal(self.expected.sum(axis=(1, 2)),
+                                          f["data_sum"])
@@ -0,0 +1,83 @@
+import os
+from mock import patch
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.multigenerator import MultiVDSGenerator
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+
+from tests import TempDirTestCase
+
+
+h5py_patch_path = "h5py"
+
+
+class MultiVDSGeneratorTest(TempDirTestCase):
+
+    def setUp(self):
+        super(MultiVDSGeneratorTest, self).setUp()
+        for idx in range(2):
+            with h5.File(os.path.join(self.directory,
+                                      "stripe_{}.h5".format(idx)), "w") as f:
+                f["data"] = np.full((4, 3, 5), idx, "int16")
+
+    def test_prefix_and_files_then_error(self):
+        with self.assertRaises(ValueError):
+            MultiVDSGenerator(self.directory, prefix="stripe_",
+                              files=["stripe_0.h5"])
+
+    def test_add(self):
+        multi = MultiVDSGenerator(self.directory, prefix="stripe_")
+
+        gen = multi.add(SubFrameVDSGenerator, stripe_spacing=1)
+
+        self.assertIsInstance(gen, SubFrameVDSGenerator)
+        self.assertEqual([gen], multi.generators)
+        self.assertEqual(os.path.join(self.directory, "stripe_vds.h5"),
+                         gen.output_file)
+        self.assertEqual(1, gen.stripe_spacing)
+        self.assertEqual(multi.metadata_cache, gen.metadata_cache)
+
+    def test_generate_vds_scans_and_opens_once(self):
+        multi = MultiVDSGenerator(self.directory,
+                                  files=["stripe_0.h5", "stripe_1.h5"])
+        multi.add(SubFrameVDSGenerator, output="vds.h5", target_node="a",
+                  stripe_spacing=0, module_spacing=0)
+        multi.add(SubFrameVDSGenerator, output="vds.h5", target_node="b/c",
+                  stripe_spacing=1, module_spacing=2)
+        multi.add(InterleaveVDSGenerator, output="interleave.h5")
+
+        with patch(h5py_patch_path + ".File", side_effect=h5.File) as \
+                file_mock:
+            outputs = multi.generate_vds()
+
+        vds_path = os.path.join(self.directory, "vds.h5")
+        interleave_path = os.path.join(self.directory, "interleave.h5")
+        self.assertEqual([vds_path, interleave_path], outputs)
+        self.assertEqual([(vds_path, "w"), (interleave_path, "w")],
+                         [call_[0] for call_ in file_mock.call_args_list])
+        self.assertEqual(2, multi.metadata_cache.misses)
+        with h5.File(vds_path, "r") as vds:
+            self.assertEqual((4, 6, 5), vds["a"].shape)
+            self.assertEqual((4, 7, 5), vds["b/c"].shape)
+            self.assertEqual(1, vds["b/c"][0, 6, 0])
+        with h5.File(interleave_path, "r") as vds:
+            self.assertEqual((8, 3, 5), vds["data"].shape)
+
+    def test_generate_vds_same_node_then_error(self):
+        multi = MultiVDSGenerator(self.directory, prefix="stripe_")
+        multi.add(SubFrameVDSGenerator)
+        multi.add(InterleaveVDSGenerator)
+
+        with self.assertRaises(ValueError):
+            multi.generate_vds()
+
+    def test_generate_vds_node_exists_then_error(self):
+        multi = MultiVDSGenerator(self.directory, prefix="stripe_")
+        multi.add(SubFrameVDSGenerator)
+        multi.generate_vds()
+
+        with self.assertRaises(IOError):
+            multi.generate_vds()
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.pipeline import VDSPipeline
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+from vdsgen.reshapevdsgenerator import ReshapeVDSGenerator
+
+from tests import TempDirTestCase
+
+
+class VDSPipelineTest(TempDirTestCase):
+
+    def setUp(self):
+        super(VDSPipelineTest, self).setUp()
+        rng = np.random.RandomState(0)
+        # Two stripes, each with 10 frames interleaved across two files
+        for stripe in range(2):
+            for idx in range(2):
+                with h5.File(self.file_path("stripe{}_{}.h5".format(
+                        stripe, idx)), "w") as f:
+                    f["data"] = rng.randint(0, 100, (5, 3, 4))
+
+    def add_stages(self, add):
+        stripes = [add(InterleaveVDSGenerator, prefix="stripe{}_".format(idx))
+                   for idx in range(2)]
+        frames = add(SubFrameVDSGenerator, files=stripes, output="frames.h5",
+                     stripe_spacing=1, module_spacing=1)
+        return add(ReshapeVDSGenerator, (2, 5), files=[frames],
+                   output="image.h5", alternate=(False, True))
+
+    def test_generate_vds_matches_nested(self):
+        def add_nested(generator_class, *args, **kwargs):
+            gen = generator_class(*args, path=self.directory, **kwargs)
+            gen.generate_vds()
+            return gen.name
+        self.add_stages(add_nested)
+        os.rename(self.file_path("image.h5"), self.file_path("nested.h5"))
+
+        pipeline = VDSPipeline(self.directory)
+        self.assertEqual("image.h5", self.add_stages(pipeline.add))
+        output_file = pipeline.generate_vds()
+
+        self.assertEqual(self.file_path("image.h5"), output_file)
+        with h5.File(self.file_path("nested.h5"), "r") as nested, \
+                h5.File(output_file, "r") as flat:
+            np.testing.assert_array_equal(nested["data"][...],
+                                          flat["data"][...])
+            sources = set(source.file_name
+                          for source in flat["data"].virtual_sources())
+        self.assertEqual(set(self.file_path("stripe{}_{}.h5".format(s, i))
+                             for s in range(2) for i in range(2)), sources)
+
+    def test_stages_not_written(self):
+        pipeline = VDSPipeline(self.directory)
+        self.add_stages(pipeline.add)
+
+        self.assertFalse(os.path.exists(self.file_path("frames.h5")))
+        self.assertFalse(os.path.exists(self.file_path("stripe0_vds.h5")))
+
+    def test_node_mismatch_then_error(self):
+        pipeline = VDSPipeline(self.directory)
+        stripe = pipeline.add(InterleaveVDSGenerator, prefix="stripe0_",
+                              target_node="images")
+
+        with self.assertRaises(ValueError):
+            pipeline.add(ReshapeVDSGenerator, (2, 5), files=[stripe])
+
+    def test_fill_value_mismatch_then_error(self):
+        pipeline = VDSPipeline(self.directory)
+        stripe = pipeline.add(InterleaveVDSGenerator, prefix="stripe0_",
+                              fill_value=7)
+
+        with self.assertRaises(ValueError):
+            pipeline.add(ReshapeVDSGenerator, (2, 5), files=[stripe])
+
+    def test_duplicate_output_then_error(self):
+        pipeline = VDSPipeline(self.directory)
+        pipeline.add(InterleaveVDSGenerator, prefix="stripe0_")
+
+        with self.assertRaises(ValueError):
+            pipeline.add(InterleaveVDSGenerator, prefix="stripe0_")
+
+    def test_no_stages_then_error(self):
+        with self.assertRaises(ValueError):
+            VDSPipeline(self.directory).generate_vds()
@@ -0,0 +1,130 @@
+import os
+import unittest
+
+import numpy as np
+import h5py as h5
+from mock import patch
+
+from vdsgen.layoutplan import LayoutPlan, PlanSource
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+from vdsgen.prefetch import merge_ranges, plan_byte_ranges, prefetch_file, \
+    prefetch_vds, stored_chunks
+
+from tests import TempDirTestCase
+
+
+class MergeRangesTest(unittest.TestCase):
+
+    def test_merge(self):
+        self.assertEqual([(0, 30), (40, 5)],
+                         merge_ranges([(20, 10), (40, 5), (0, 10), (5, 15)]))
+
+
+class PlanByteRangesTest(TempDirTestCase):
+
+    def setUp(self):
+        super(PlanByteRangesTest, self).setUp()
+        self.raw_file = self.file_path("raw.h5")
+        with h5.File(self.raw_file, "w") as f:
+            f.create_dataset("contiguous", data=np.zeros((6, 4, 5), "u2"))
+            f.create_dataset("chunked", data=np.zeros((6, 4, 5), "u2"),
+                             chunks=(2, 2, 5))
+
+    def plan(self, node, key):
+        plan = LayoutPlan((6, 4, 5), "u2")
+        plan[...] = PlanSource(self.raw_file, node, (6, 4, 5), "u2")
+        return plan.view(key)
+
+    def test_contiguous_frames(self):
+        with h5.File(self.raw_file, "r") as f:
+            offset = f["contiguous"].id.get_offset()
+
+        ranges = plan_byte_ranges(self.plan("contiguous",
+                                            (slice(1, 3), slice(None))))
+
+        self.assertEqual({self.raw_file: [(offset + 40, 80)]}, ranges)
+
+    def test_contiguous_roi(self):
+        with h5.File(self.raw_file, "r") as f:
+            offset = f["contiguous"].id.get_offset()
+
+        ranges = plan_byte_ranges(self.plan(
+            "contiguous", (slice(1, 5, 3), slice(1, 3), slice(2, 4))))
+
+        # Rows 1 to 2, columns 2 to 3 of frames 1 and 4
+        self.assertEqual({self.raw_file: [(offset + 40 + 14, 14),
+                                          (offset + 160 + 14, 14)]},
+                         ranges)
+
+    def test_chunked(self):
+        with h5.File(self.raw_file, "r") as f:
+            dataset_id = f["chunked"].id
+            chunks = [dataset_id.get_chunk_info_by_coord(coordinate)
+                      for coordinate in [(2, 2, 0), (4, 2, 0)]]
+
+        ranges = plan_byte_ranges(self.plan(
+            "chunked", (slice(3, 5), slice(2, 4))))
+
+        self.assertEqual({self.raw_file: merge_ranges(
+            [(chunk.byte_offset, chunk.size) for chunk in chunks])}, ranges)
+
+    def test_stored_chunks(self):
+        with h5.File(self.raw_file, "a") as f:
+            dataset = f.create_dataset("sparse", (6, 4, 5), "u2",
+                                       chunks=(2, 2, 5))
+            dataset[2:4, 2:4] = 1
+            info = dataset.id.get_chunk_info_by_coord((2, 2, 0))
+
+            chunks = stored_chunks(dataset)
+
+        self.assertEqual({(2, 2, 0): (info.byte_offset, info.size)}, chunks)
+
+    def test_missing_file_skipped(self):
+        plan = LayoutPlan((6, 4, 5), "u2")
+        plan[...] = PlanSource("/missing.h5", "data", (6, 4, 5), "u2")
+
+        self.assertEqual({}, plan_byte_ranges(plan))
+
+
+class PrefetchTest(TempDirTestCase):
+
+    def setUp(self):
+        super(PrefetchTest, self).setUp()
+        for idx in range(2):
+            with h5.File(os.path.join(self.directory,
+                                      "raw_{}.h5".format(idx)), "w") as f:
+                f.create_dataset("data", data=np.ones((5, 4, 5), "u2"),
+                                 chunks=(1, 4, 5))
+        InterleaveVDSGenerator(self.directory, prefix="raw_").generate_vds()
+        self.vds = os.path.join(self.directory, "raw_vds.h5")
+
+    @patch("os.posix_fadvise", create=True)
+    def test_prefetch_vds_frame_range(self, fadvise_mock):
+        stats = prefetch_vds(self.vds, frame_range=(2, 6, None))
+
+        # Frames 1 and 2 of each file, in adjacent chunks of one frame
+        self.assertEqual(dict(files=2, ranges=2, bytes=4 * 40), stats)
+        self.assertEqual([80, 80], [args[2] for args, _ in
+                                    fadvise_mock.call_args_list])
+
+    def test_prefetch_file_read(self):
+        file_path = os.path.join(self.directory, "bytes")
+        with open(file_path, "wb") as file_:
+            file_.write(b"\0" * 100)
+
+        with patch("os.posix_fadvise", create=True) as fadvise_mock:
+            self.assertEqual(30, prefetch_file(file_path, [(10, 20), (90, 20)],
+                                               read=True))
+        fadvise_mock.assert_not_called()
+
+    @patch("os.posix_fadvise", create=True)
+    def test_prefetch_file_advise(self, fadvise_mock):
+        file_path = os.path.join(self.directory, "bytes")
+        with open(file_path, "wb") as file_:
+            file_.write(b"\0" * 100)
+
+        self.assertEqual(30, prefetch_file(file_path, [(10, 20), (40, 10)]))
+        self.assertEqual([(10, 20, os.POSIX_FADV_WILLNEED),
+                          (40, 10, os.POSIX_FADV_WILLNEED)],
+                         [args[1:] for args, _ in
+                          fadvise_mock.call_args_list])
@@ -0,0 +1,94 @@
+import os
+import unittest
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+from vdsgen.preview import binned_shape, bin_frames, generate_previews, \
+    preview_path
+
+from tests import TempDirTestCase
+
+
+class BinFramesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = np.arange(2 * 5 * 6, dtype="uint16").reshape(2, 5, 6)
+
+    def test_binned_shape(self):
+        self.assertEqual((3, 2, 2), binned_shape((3, 5, 6), 4))
+
+    def test_bin_levels(self):
+        levels = bin_frames(self.frames, [4, 2])
+
+        self.assertEqual([2, 4], sorted(levels))
+        self.assertEqual((2, 3, 3), levels[2].shape)
+        self.assertEqual(np.float32, levels[2].dtype)
+        self.assertEqual(np.mean([0, 1, 6, 7]), levels[2][0, 0, 0])
+        # A partial bin at the edge is the mean of the pixels it covers
+        self.assertEqual(np.mean([24, 25]), levels[2][0, 2, 0])
+        self.assertEqual(np.mean(self.frames[1, 4:, 4:]), levels[4][1, 1, 1])
+
+    def test_bin_levels_not_multiples(self):
+        levels = bin_frames(self.frames, [2, 3])
+
+        self.assertEqual(np.mean(self.frames[0, 3:, 3:]), levels[3][0, 1, 1])
+
+    def test_bin_mask(self):
+        mask = np.ones((5, 6), dtype=bool)
+        mask[:, 2:4] = False
+
+        levels = bin_frames(self.frames, [2, 4], mask, fill_value=-1)
+
+        self.assertEqual(-1, levels[2][0, 0, 1])
+        self.assertEqual(np.mean([0, 1, 6, 7, 12, 13, 18, 19]),
+                         levels[4][0, 0, 0])
+
+
+class GeneratePreviewsTest(TempDirTestCase):
+
+    def setUp(self):
+        super(GeneratePreviewsTest, self).setUp()
+        rng = np.random.RandomState(0)
+        for idx in range(2):
+            with h5.File(os.path.join(self.directory,
+                                      "stripe_{}.h5".format(idx)), "w") as f:
+                f.create_dataset("data",
+                                 data=rng.randint(0, 100, (5, 3, 8), "u2"))
+        SubFrameVDSGenerator(self.directory, prefix="stripe_",
+                             stripe_spacing=2, module_spacing=0,
+                             fill_value=0).generate_vds()
+        self.vds = os.path.join(self.directory, "stripe_vds.h5")
+
+    def test_previews_linked_from_vds(self):
+        nodes = generate_previews(self.vds, factors=[2, 4], processes=2,
+                                  batch_bytes=1)
+
+        self.assertEqual({2: "data_bin2", 4: "data_bin4"}, nodes)
+        self.assertTrue(os.path.exists(preview_path(self.vds)))
+        with h5.File(self.vds, "r") as f:
+            data = f["data"][...]
+            self.assertEqual(h5.ExternalLink,
+                             f.get("data_bin2", getlink=True).__class__)
+            self.assertEqual((5, 4, 4), f["data_bin2"].shape)
+            self.assertEqual(4, f["data_bin4"].attrs["binning"])
+            np.testing.assert_allclose(bin_frames(data, [4])[4],
+                                       f["data_bin4"][...])
+
+    def test_exclude_gaps_and_regenerate(self):
+        generate_previews(self.vds, factors=[2, 8])
+        generate_previews(self.vds, factors=[2], exclude_gaps=True)
+
+        with h5.File(self.vds, "r") as f:
+            data = f["data"][...]
+            # Rows 3 and 4 are the gap between the stripes, so bins of rows 2
+            # to 3 and 4 to 5 are of one row
+            np.testing.assert_allclose(data[:, 2, :2].mean(axis=-1),
+                                       f["data_bin2"][:, 1, 0])
+            np.testing.assert_allclose(data[:, 5, 2:4].mean(axis=-1),
+                                       f["data_bin2"][:, 2, 1])
+
+    def test_invalid_factors(self):
+        with self.assertRaises(ValueError):
+            generate_previews(self.vds, factors=[0, 2])
@@ -0,0 +1,105 @@
+import os
+import unittest
+
+import numpy as np
+import h5py as h5
+
+from vdsgen import rawsourcegenerator
+from vdsgen.rawsourcegenerator import generate_raw_files, \
+    file_frame_indices, frames_per_file
+
+from tests import TempDirTestCase
+
+
+class FrameIndicesTest(unittest.TestCase):
+
+    def test_frames_per_file(self):
+        self.assertEqual([30, 25, 20, 20], frames_per_file(95, 4, 10))
+        self.assertEqual([6], frames_per_file(6, 1, 1))
+        self.assertEqual([1] * 6, frames_per_file(6, 6, 1))
+
+    def test_file_frame_indices(self):
+        np.testing.assert_array_equal(
+            [0, 1, 6, 7, 12], file_frame_indices(0, 13, 3, 2))
+        np.testing.assert_array_equal(
+            [2, 3, 8, 9], file_frame_indices(1, 13, 3, 2))
+        np.testing.assert_array_equal(
+            [4, 5, 10, 11], file_frame_indices(2, 13, 3, 2))
+
+    def test_file_frame_indices_single_file(self):
+        np.testing.assert_array_equal(
+            range(7), file_frame_indices(0, 7, 1, 3))
+
+
+class GenerateRawFilesTest(TempDirTestCase):
+
+    def setUp(self):
+        super(GenerateRawFilesTest, self).setUp()
+        self.prefix = os.path.join(self.directory, "raw")
+
+    def read(self, file_idx, dset="data"):
+        with h5.File("{}_{}.h5".format(self.prefix, file_idx), "r") as f:
+            return f[dset][...], f[dset].chunks, f[dset].compression
+
+    def test_values(self):
+        files = generate_raw_files(self.prefix, 95, 4, 10, 5, 3)
+
+        self.assertEqual(4, len(files))
+        data, chunks, _ = self.read(1)
+        self.assertEqual((25, 3, 5), data.shape)
+        self.assertEqual((1, 3, 5), chunks)
+        np.testing.assert_array_equal(file_frame_indices(1, 95, 4, 10),
+                                      data[:, 2, 4])
+        self.assertTrue((data == data[:, :1, :1]).all())
+
+    def test_multiple_batches(self):
+        original = rawsourcegenerator.BATCH_BYTES
+        rawsourcegenerator.BATCH_BYTES = 3 * 5 * 4 * 7  # 7 frames
+        try:
+            generate_raw_files(self.prefix, 40, 2, 1, 5, 3,
+                               dset="test_data", chunks=(2, 3, 5))
+        finally:
+            rawsourcegenerator.BATCH_BYTES = original
+
+        data, chunks, _ = self.read(0, "test_data")
+        self.assertEqual((20, 3, 5), data.shape)
+        self.assertEqual((2, 3, 5), chunks)
+        np.testing.assert_array_equal(range(0, 40, 2), data[:, 0, 0])
+
+    def test_any_not_written(self):
+        generate_raw_files(self.prefix, 40, 2, 1, 5, 3, any=True)
+
+        data, _, _ = self.read(0)
+        self.assertEqual((20, 3, 5), data.shape)
+        self.assertTrue((data == 1).all())
+        with h5.File(self.prefix + "_0.h5", "r") as f:
+            self.assertEqual(0, f["data"].id.get_storage_size())
+
+    def test_compression(self):
+        generate_raw_files(self.prefix, 10, 1, 1, 5, 3, dtype="uint16",
+                           compression="gzip", compression_opts=1)
+
+        data, _, compression = self.read(0)
+        self.assertEqual("gzip", compression)
+        self.assertEqual(np.uint16, data.dtype)
+        np.testing.assert_array_equal(range(10), data[:, 0, 0])
+
+    def test_contiguous(self):
+        generate_raw_files(self.prefix, 10, 1, 1, 5, 3, contiguous=True)
+
+        data, chunks, _ = self.read(0)
+        self.assertIsNone(chunks)
+        np.testing.assert_array_equal(range(10), data[:, 0, 0])
+
+    def test_contiguous_and_compression_then_error(self):
+        with self.assertRaises(ValueError):
+            generate_raw_files(self.prefix, 10, 1, 1, 5, 3, contiguous=True,
+                               compression="gzip")
+
+    def test_processes(self):
+        generate_raw_files(self.prefix, 12, 3, 2, 5, 3, processes=3)
+
+        for file_idx in range(3):
+            data, _, _ = self.read(file_idx)
+            np.testing.assert_array_equal(
+                file_frame_indices(file_idx, 12, 3, 2), data[:, 0, 0])
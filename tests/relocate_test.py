@@ -0,0 +1,126 @@
+import os
+import shutil
+import unittest
+
+import numpy as np
+import h5py as h5
+from mock import patch
+
+from vdsgen.relocate import relocate_vds, rewrite_path
+from vdsgen.frameindex import FrameIndex
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+
+from tests import TempDirTestCase
+
+
+class RewritePathTest(unittest.TestCase):
+
+    def test_relative(self):
+        self.assertEqual("raw/stripe_1.h5",
+                         rewrite_path("/data/raw/stripe_1.h5", "/data",
+                                      relative=True))
+
+    def test_replace(self):
+        self.assertEqual("/archive/raw/stripe_1.h5",
+                         rewrite_path("/buffer/raw/stripe_1.h5", "/data",
+                                      replace=("/buffer", "/archive")))
+
+    def test_replace_whole_directories(self):
+        self.assertEqual("/buffer2/raw/stripe_1.h5",
+                         rewrite_path("/buffer2/raw/stripe_1.h5", "/data",
+                                      replace=("/buffer", "/archive")))
+        self.assertEqual("/archive/raw/stripe_1.h5",
+                         rewrite_path("/buffer/raw/stripe_1.h5", "/data",
+                                      replace=("/buffer/", "/archive/")))
+        self.assertEqual("/archive/stripe_1.h5",
+                         rewrite_path("/buffer/stripe_1.h5", "/data",
+                                      replace=("/buffer/stripe_1.h5",
+                                               "/archive/stripe_1.h5")))
+
+    def test_same_file_unchanged(self):
+        self.assertEqual(".", rewrite_path(".", "/data", relative=True))
+
+
+class RelocateVDSTest(TempDirTestCase):
+
+    def setUp(self):
+        super(RelocateVDSTest, self).setUp()
+        self.data = os.path.join(self.directory, "data")
+        os.mkdir(self.data)
+        for idx in range(2):
+            with h5.File(os.path.join(self.data, "stripe_{}.h5".format(idx)),
+                         "w") as f:
+                f["data"] = np.arange(3 * 2 * 4).reshape(3, 2, 4) + idx * 100
+
+    def move_data(self):
+        moved = os.path.join(self.directory, "moved")
+        shutil.move(self.data, moved)
+        return moved
+
+    def test_generate_vds_relative_paths(self):
+        gen = InterleaveVDSGenerator(self.data, prefix="stripe_",
+                                     relative_paths=True)
+        gen.generate_vds()
+        with h5.File(gen.output_file, "r") as vds:
+            expected = vds["data"][...]
+
+        moved = self.move_data()
+
+        with h5.File(os.path.join(moved, gen.name), "r") as vds:
+            self.assertEqual(["stripe_0.h5", "stripe_1.h5"],
+                             [v_map.file_name
+                              for v_map in vds["data"].virtual_sources()])
+            np.testing.assert_array_equal(expected, vds["data"][...])
+
+    def test_relocate_vds_relative(self):
+        gen = InterleaveVDSGenerator(self.data, prefix="stripe_",
+                                     frame_index=True)
+        gen.generate_vds()
+        with h5.File(gen.output_file, "r+") as vds:
+            vds["data"].attrs["units"] = "counts"
+            expected = vds["data"][...]
+
+        self.assertEqual(2, relocate_vds(gen.output_file, relative=True))
+        moved = self.move_data()
+
+        with h5.File(os.path.join(moved, gen.name), "r") as vds:
+            np.testing.assert_array_equal(expected, vds["data"][...])
+            self.assertEqual(gen.fill_value, vds["data"].fillvalue)
+            self.assertEqual("counts", vds["data"].attrs["units"])
+            index = FrameIndex.read(vds, "data_frame_index")
+        self.assertEqual(os.path.join(moved, "stripe_1.h5"),
+                         index.lookup(3)[0].file_path)
+
+    def test_relocate_vds_replace(self):
+        gen = InterleaveVDSGenerator(self.data, prefix="stripe_",
+                                     output="../vds.h5")
+        gen.generate_vds()
+        moved = self.move_data()
+
+        relocate_vds(gen.output_file, nodes=["data"],
+                     replace=(self.data, moved))
+
+        with h5.File(gen.output_file, "r") as vds:
+            self.assertEqual(
+                [os.path.join(moved, "stripe_{}.h5".format(idx))
+                 for idx in range(2)],
+                [v_map.file_name for v_map in vds["data"].virtual_sources()])
+            self.assertEqual(100, vds["data"][1, 0, 0])
+
+    def test_relocate_vds_failure_then_file_untouched(self):
+        gen = InterleaveVDSGenerator(self.data, prefix="stripe_",
+                                     frame_index=True)
+        gen.generate_vds()
+        with open(gen.output_file, "rb") as f:
+            original = f.read()
+
+        # Fail after the dataset has been recreated
+        with patch("vdsgen.relocate.relocate_frame_index",
+                   side_effect=IOError("Failed")):
+            with self.assertRaises(IOError):
+                relocate_vds(gen.output_file, relative=True)
+
+        with open(gen.output_file, "rb") as f:
+            self.assertEqual(original, f.read())
+        self.assertEqual(["stripe_0.h5", "stripe_1.h5", gen.name],
+                         sorted(os.listdir(self.data)))
@@ -10,6 +10,7 @@ vdsgen_patch_path = "vdsgen.reshapevdsgenerator"
 VDSGenerator_patch_path = vdsgen_patch_path + ".VDSGenerator"
 Reshape_patch_path = vdsgen_patch_path + ".ReshapeVDSGenerator"
 h5py_patch_path = "h5py"
+layoutplan_patch_path = "vdsgen.layoutplan"
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "h5py"))
 
@@ -81,8 +82,8 @@ class SimpleFunctionsTest(unittest.TestCase):
 
     file_mock = MagicMock()
 
-    @patch(h5py_patch_path + '.VirtualSource')
-    @patch(h5py_patch_path + '.VirtualLayout')
+    @patch(layoutplan_patch_path + '.PlanSource')
+    @patch(layoutplan_patch_path + '.StreamingLayout')
     def test_create_virtual_layout(self, layout_mock, source_mock):
         gen = ReshapeVDSGeneratorTester(
             output_file="/test/path/vds.hdf5",
@@ -100,11 +101,11 @@ class SimpleFunctionsTest(unittest.TestCase):
 
         layout_mock.assert_called_once_with((5, 3, 10, 256, 2048), "uint16")
         source_mock.assert_called_once_with(
-            "raw.h5", dtype="uint16", name="data", shape=(150, 256, 2048)
+            "raw.h5", "data", (150, 256, 2048), "uint16"
         )
 
-    @patch(h5py_patch_path + '.VirtualSource')
-    @patch(h5py_patch_path + '.VirtualLayout')
+    @patch(layoutplan_patch_path + '.PlanSource')
+    @patch(layoutplan_patch_path + '.StreamingLayout')
     @patch(Reshape_patch_path + ".create_alternating_virtual_layout")
     def test_create_virtual_layout_calls_alternating(self, alt_mock,
                                                      layout_mock, source_mock):
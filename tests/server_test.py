@@ -0,0 +1,163 @@
+import os
+import stat
+import socket
+import threading
+import unittest
+from mock import patch, ANY
+
+from vdsgen import server
+from vdsgen.server import VDSServer, remove_stale_socket, send_request
+from vdsgen.vdsgenerator import VDSGenerator
+
+from tests import TempDirTestCase
+
+
+server_patch_path = "vdsgen.server"
+create_generator_patch_path = server_patch_path + ".app.create_generator"
+
+
+class VDSServerTest(TempDirTestCase):
+
+    def setUp(self):
+        super(VDSServerTest, self).setUp()
+        self.socket_path = os.path.join(self.directory, "vdsgen.sock")
+        self.server = VDSServer(self.socket_path, workers=2, queue_size=1,
+                                log_level=3)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_init_leaves_class_metadata_cache(self):
+        self.assertIsNone(VDSGenerator.metadata_cache)
+
+    def test_socket_owner_only(self):
+        mode = stat.S_IMODE(os.stat(self.socket_path).st_mode)
+
+        self.assertEqual(0o600, mode)
+
+    def test_socket_mode(self):
+        socket_path = os.path.join(self.directory, "group.sock")
+        group_server = VDSServer(socket_path, socket_mode=0o660, log_level=3)
+        try:
+            mode = stat.S_IMODE(os.stat(socket_path).st_mode)
+        finally:
+            group_server.close()
+
+        self.assertEqual(0o660, mode)
+
+    @patch(create_generator_patch_path)
+    def test_generate(self, create_mock):
+        gen_mock = create_mock.return_value
+        gen_mock.files = ["/data/stripe_1.h5"]
+        gen_mock.source_metadata = ("frames", 256, 2048, "uint16")
+        gen_mock.up_to_date = False
+        gen_mock.output_file = "/data/stripe_vds.h5"
+
+        response = self.server.generate(["stripe_1.h5", "-p", "stripe_"],
+                                        cwd="/data")
+
+        create_mock.assert_called_once_with(ANY, self.server.metadata_cache)
+        args = create_mock.call_args[0][0]
+        self.assertEqual("/data/stripe_1.h5", args.path)
+        gen_mock.create_target_layout.assert_called_once_with()
+        gen_mock.generate_vds.assert_called_once_with(
+            virtual_layout=gen_mock.create_target_layout.return_value)
+        self.assertEqual("ok", response["status"])
+        self.assertEqual("/data/stripe_vds.h5", response["output"])
+
+    @patch(create_generator_patch_path)
+    def test_generate_twice_then_layout_cached(self, create_mock):
+        gen_mock = create_mock.return_value
+        gen_mock.files = ["/data/stripe_1.h5"]
+        gen_mock.source_metadata = ("frames", 256, 2048, "uint16")
+        gen_mock.up_to_date = False
+
+        self.server.generate(["/data", "-p", "stripe_"])
+        self.server.generate(["/data", "-p", "stripe_"])
+
+        gen_mock.create_target_layout.assert_called_once_with()
+        self.assertEqual(2, gen_mock.generate_vds.call_count)
+
+    @patch(create_generator_patch_path)
+    def test_generate_watch_then_error(self, create_mock):
+        with self.assertRaises(server.RequestError):
+            self.server.generate(["/data", "-p", "stripe_", "-w"])
+
+        create_mock.assert_not_called()
+
+    def test_handle_request_invalid_args_then_error(self):
+        response = self.server.handle_request(b'{"args": ["/data"]}\n')
+
+        self.assertEqual("error", response["status"])
+        self.assertIn("-p/--prefix", response["message"])
+
+    @patch(server_patch_path + ".VDSServer.generate",
+           side_effect=IOError("VDS already has an entry for node data"))
+    def test_handle_request_failure_then_error(self, _):
+        response = self.server.handle_request(b'{"args": ["/data"]}\n')
+
+        self.assertEqual(dict(status="error",
+                              message="VDS already has an entry for node "
+                                      "data"),
+                         response)
+
+    def test_handle_request_queue_full_then_busy(self):
+        for _ in range(3):  # workers + queue_size
+            self.server._slots.acquire()
+
+        response = self.server.handle_request(b'{"args": ["/data"]}\n')
+
+        self.assertEqual("error", response["status"])
+        self.assertIn("busy", response["message"])
+
+    @patch(server_patch_path + ".VDSServer.generate",
+           return_value=dict(status="ok", output="/data/vds.h5", time=0.0))
+    def test_send_request(self, generate_mock):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        try:
+            response = send_request(self.socket_path, ["/data", "-p", "a_"],
+                                    timeout=5)
+        finally:
+            self.server.shutdown()
+            thread.join()
+
+        generate_mock.assert_called_once_with(["/data", "-p", "a_"],
+                                              os.getcwd())
+        self.assertEqual("ok", response["status"])
+
+
+class RemoveStaleSocketTest(TempDirTestCase):
+
+    def setUp(self):
+        super(RemoveStaleSocketTest, self).setUp()
+        self.socket_path = os.path.join(self.directory, "vdsgen.sock")
+
+    def test_stale_socket_removed(self):
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        listener.close()  # Leaves the socket file behind
+
+        remove_stale_socket(self.socket_path)
+
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_live_server_then_error(self):
+        live_server = VDSServer(self.socket_path, log_level=3)
+        self.addCleanup(live_server.close)
+
+        with self.assertRaises(IOError):
+            remove_stale_socket(self.socket_path)
+        self.assertTrue(os.path.exists(self.socket_path))
+
+    def test_no_socket(self):
+        remove_stale_socket(self.socket_path)
+
+
+class RequestParserTest(unittest.TestCase):
+
+    def test_error_raises(self):
+        parser = server.RequestParser()
+
+        with self.assertRaises(server.RequestError):
+            parser.error("Bad arguments")
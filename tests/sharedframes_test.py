@@ -0,0 +1,153 @@
+import time
+import threading
+import unittest
+import multiprocessing
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.sharedframes import FrameRing, SharedFrameReader
+
+from tests import TempDirTestCase
+
+
+def consume(name, condition, consumer, queue):
+    with FrameRing.attach(name, condition) as ring:
+        total = 0
+        indices = []
+        for frame_idx, frame in ring.frames(consumer):
+            indices.append(frame_idx)
+            total += int(frame.sum())
+    queue.put((consumer, indices, total))
+
+
+def consume_one(name, condition):
+    with FrameRing.attach(name, condition) as ring:
+        frames = ring.frames(0)
+        next(frames)
+        frames.close()  # Exit holding the frame
+
+
+class FrameRingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = FrameRing.create((2, 3), "uint16", slots=2, consumers=2)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_attach(self):
+        with FrameRing.attach(self.ring.name, self.ring.condition) as ring:
+            self.assertEqual((2, 3), ring.frame_shape)
+            self.assertEqual(np.dtype("uint16"), ring.dtype)
+            self.assertEqual(2, ring.slots)
+            self.assertEqual(2, ring.consumers)
+            self.assertFalse(ring.owner)
+
+    def test_frames_are_views_of_shared_memory(self):
+        self.ring.publish(7, np.full((2, 3), 5))
+        self.ring.finish()
+
+        with FrameRing.attach(self.ring.name, self.ring.condition) as ring:
+            frames = ring.frames(0)
+            frame_idx, frame = next(frames)
+            self.assertEqual(7, frame_idx)
+            np.testing.assert_array_equal(np.full((2, 3), 5), frame)
+
+            self.ring.reserve()[...] = 9  # Next slot, not the one read
+            np.testing.assert_array_equal(np.full((2, 3), 5), frame)
+            self.assertRaises(StopIteration, next, frames)
+            del frame, frames
+
+    def test_reserve_waits_for_slowest_consumer(self):
+        for frame_idx in range(2):
+            self.ring.publish(frame_idx, np.zeros((2, 3)))
+        frames = [self.ring.frames(0), self.ring.frames(1)]
+        for _ in range(2):
+            next(frames[0])
+        next(frames[1])
+
+        # Consumer 1 still holds frame 0
+        with self.assertRaises(IOError):
+            self.ring.reserve(timeout=0.01)
+
+        next(frames[1])
+        self.ring.reserve(timeout=0.01)
+
+    def test_wait_consumed_timeout(self):
+        self.ring.publish(0, np.zeros((2, 3)))
+
+        with self.assertRaises(IOError):
+            self.ring.wait_consumed(timeout=0.01)
+
+    def test_reserve_consumer_exited_then_error(self):
+        ring = FrameRing.create((2, 3), "uint16", slots=1, consumers=1)
+        self.addCleanup(ring.close)
+        ring.publish(0, np.zeros((2, 3)))
+        process = multiprocessing.Process(target=consume_one,
+                                          args=(ring.name, ring.condition))
+        process.start()
+        process.join()
+
+        start = time.time()
+        with self.assertRaises(IOError):
+            ring.reserve(timeout=30)
+        self.assertLess(time.time() - start, 5)
+
+    def test_frames_timeout(self):
+        with self.assertRaises(IOError):
+            next(self.ring.frames(0, timeout=0.01))
+
+    def test_frames_invalid_consumer(self):
+        with self.assertRaises(ValueError):
+            next(self.ring.frames(2))
+
+
+class SharedFrameReaderTest(TempDirTestCase):
+
+    def setUp(self):
+        super(SharedFrameReaderTest, self).setUp()
+        self.vds_file = self.file_path("image.h5")
+        self.data = np.arange(2 * 5 * 3 * 4, dtype="int32").reshape(
+            2, 5, 3, 4)
+        with h5.File(self.vds_file, "w") as h5_file:
+            h5_file["data"] = self.data
+
+    def test_serve_threads(self):
+        received = []
+
+        with SharedFrameReader(self.vds_file, slots=3) as reader:
+            def consumer():
+                with FrameRing.attach(reader.name, reader.condition) as ring:
+                    for frame_idx, frame in ring.frames(0):
+                        received.append((frame_idx, frame.copy()))
+            thread = threading.Thread(target=consumer)
+            thread.start()
+            frames = reader.serve(timeout=10)
+            thread.join()
+
+        self.assertEqual(10, frames)
+        self.assertEqual(list(range(10)), [idx for idx, _ in received])
+        np.testing.assert_array_equal(self.data.reshape(10, 3, 4),
+                                      [frame for _, frame in received])
+
+    def test_serve_processes(self):
+        queue = multiprocessing.Queue()
+
+        with SharedFrameReader(self.vds_file, slots=2,
+                               consumers=3) as reader:
+            processes = [
+                multiprocessing.Process(target=consume, args=(
+                    reader.name, reader.condition, consumer, queue))
+                for consumer in range(3)]
+            for process in processes:
+                process.start()
+            reader.serve(timeout=30)
+            results = sorted(queue.get(timeout=30) for _ in processes)
+            for process in processes:
+                process.join()
+
+        for consumer, (result_consumer, indices, total) in enumerate(results):
+            self.assertEqual(consumer, result_consumer)
+            self.assertEqual(list(range(10)), indices)
+            self.assertEqual(self.data.sum(), total)
@@ -9,6 +9,7 @@ from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
 vdsgen_patch_path = "vdsgen.subframevdsgenerator"
 VDSGenerator_patch_path = vdsgen_patch_path + ".VDSGenerator"
 h5py_patch_path = "h5py"
+layoutplan_patch_path = "vdsgen.layoutplan"
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "h5py"))
 
@@ -78,8 +79,8 @@ class SimpleFunctionsTest(unittest.TestCase):
     file_mock = MagicMock()
 
     @patch(h5py_patch_path + '.File', return_value=file_mock)
-    @patch(h5py_patch_path + '.VirtualSource')
-    @patch(h5py_patch_path + '.VirtualLayout')
+    @patch(layoutplan_patch_path + '.PlanSource')
+    @patch(layoutplan_patch_path + '.StreamingLayout')
     def test_create_virtual_layout(self, layout_mock, source_mock, file_mock):
         gen = SubFrameVDSGeneratorTester(
             output_file="/test/path/vds.hdf5",
@@ -99,7 +100,6 @@ class SimpleFunctionsTest(unittest.TestCase):
 
         layout_mock.assert_called_once_with((3, 1766, 2048), "uint16")
         source_mock.assert_has_calls(
-            [call("raw{}.h5".format(x),
-                  dtype="uint16", name="data", shape=(3, 256, 2048))
+            [call("raw{}.h5".format(x), "data", (3, 256, 2048), "uint16")
              for x in range(1, 7)])
         # TODO: Pass numpy arrays to check slicing
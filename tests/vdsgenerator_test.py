@@ -6,6 +6,9 @@ from mock import MagicMock, patch, call
 from vdsgen import vdsgenerator
 from vdsgen.vdsgenerator import VDSGenerator
 
+from tests import TempDirTestCase
+
+
 vdsgen_patch_path = "vdsgen.vdsgenerator"
 VDSGenerator_patch_path = vdsgen_patch_path + ".VDSGenerator"
 h5py_patch_path = "h5py"
@@ -201,6 +204,15 @@ class ValidateNodeTest(unittest.TestCase):
 
         self.file_mock.create_group.assert_called_once_with("/entry/detector")
 
+    def test_validate_given_node(self):
+        gen = VDSGeneratorTester(target_node="data")
+        self.file_mock.get.return_value = None
+
+        node = gen.validate_node(self.file_mock, "meta/ts/")
+
+        self.assertEqual("meta/ts", node)
+        self.file_mock.create_group.assert_called_once_with("meta")
+
     def test_validate_node_exists_then_no_op(self):
         gen = VDSGeneratorTester(target_node="entry/detector/detector1")
         self.file_mock.get.return_value = "Group"
@@ -247,8 +259,9 @@ class GenerateVDSTest(unittest.TestCase):
         validate_mock.assert_called_once_with(vds_file_mock)
         h5file_mock.assert_called_once_with(
             "/test/path/vds.hdf5", "w", libver="latest")
-        vds_file_mock.create_virtual_dataset.assert_called_once_with(
-            "full_frame", create_mock.return_value, fillvalue=-1)
+        create_mock.return_value.create_virtual_dataset.\
+            assert_called_once_with(vds_file_mock, "full_frame",
+                                    fill_value=-1, relative_paths=False)
 
     @patch('os.path.isfile', return_value=True)
     @patch(VDSGenerator_patch_path + '.validate_node')
@@ -276,8 +289,9 @@ class GenerateVDSTest(unittest.TestCase):
         h5file_mock.assert_has_calls([
             call("/test/path/vds.hdf5", "r", libver="latest"),
             call("/test/path/vds.hdf5", "a", libver="latest")])
-        vds_file_mock.create_virtual_dataset.assert_called_once_with(
-            "full_frame", create_mock.return_value, fillvalue=-1)
+        create_mock.return_value.create_virtual_dataset.\
+            assert_called_once_with(vds_file_mock, "full_frame",
+                                    fill_value=-1, relative_paths=False)
 
     @patch('os.path.isfile', return_value=True)
     @patch(h5py_patch_path + '.File', return_value=file_mock)
@@ -297,3 +311,417 @@ class GenerateVDSTest(unittest.TestCase):
 
         with self.assertRaises(IOError):
             gen.generate_vds()
+
+    @patch('os.path.isfile', return_value=False)
+    @patch(VDSGenerator_patch_path + '.validate_node',
+           side_effect=lambda vds, node=None: node)
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    @patch(VDSGenerator_patch_path + '.create_node_layout')
+    @patch(VDSGenerator_patch_path + '.create_virtual_layout')
+    def test_generate_vds_nodes(self, create_mock, create_node_mock,
+                                h5file_mock, validate_mock, isfile_mock):
+        node_meta = [vdsgenerator.NodeMeta("fn", (), "int64"),
+                     vdsgenerator.NodeMeta("ts", (2,), "float64")]
+        gen = VDSGeneratorTester(path="/test/path",
+                                 output_file="/test/path/vds.hdf5",
+                                 target_node="full_frame", source_node="data",
+                                 nodes=(("fn", "fn"), ("ts", "meta/ts")),
+                                 node_metadata=tuple(node_meta),
+                                 source_metadata=MagicMock())
+        self.file_mock.reset_mock()
+        vds_file_mock = self.file_mock.__enter__.return_value
+
+        gen.generate_vds()
+
+        h5file_mock.assert_called_once_with(
+            "/test/path/vds.hdf5", "w", libver="latest")
+        create_node_mock.assert_has_calls([call(node_meta[0]),
+                                           call(node_meta[1])])
+        validate_mock.assert_has_calls([
+            call(vds_file_mock), call(vds_file_mock, "fn"),
+            call(vds_file_mock, "meta/ts")])
+        create_mock.return_value.create_virtual_dataset.\
+            assert_called_once_with(vds_file_mock, "full_frame",
+                                    fill_value=-1, relative_paths=False)
+        create_node_mock.return_value.create_virtual_dataset.assert_has_calls(
+            [call(vds_file_mock, "fn", fill_value=-1, relative_paths=False),
+             call(vds_file_mock, "meta/ts", fill_value=-1,
+                  relative_paths=False)])
+
+
+class NodesTest(unittest.TestCase):
+
+    file_mock = dict(data=MagicMock(shape=(3, 256, 2048), dtype="uint16"),
+                     fn=MagicMock(shape=(3,), dtype="int64"),
+                     ts=MagicMock(shape=(3, 2), dtype="float64"),
+                     short=MagicMock(shape=(2,), dtype="int64"))
+
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_read_metadata_nodes(self, h5file_mock):
+        metadata = vdsgenerator.read_metadata("/test/path/stripe.hdf5",
+                                              "data", ("fn", "ts"))
+
+        h5file_mock.assert_called_once_with("/test/path/stripe.hdf5", "r")
+        self.assertEqual((vdsgenerator.NodeMeta("fn", (), "int64"),
+                          vdsgenerator.NodeMeta("ts", (2,), "float64")),
+                         metadata["nodes"])
+        self.assertEqual(256, metadata["height"])
+
+    @patch(h5py_patch_path + '.File', return_value=file_mock)
+    def test_read_metadata_node_frames_mismatch_then_error(self, _):
+        with self.assertRaises(ValueError):
+            vdsgenerator.read_metadata("/test/path/stripe.hdf5", "data",
+                                       ("short",))
+
+    def test_given_nodes_and_source_then_error(self):
+        with self.assertRaises(ValueError):
+            VDSGenerator("/test/path", files=["stripe_1.h5"],
+                         source=dict(shape=(3, 256, 2048), dtype="int16"),
+                         nodes=["fn"])
+
+    def test_create_node_layout_frame_axes(self):
+        source_meta = vdsgenerator.SourceMeta(frames=(3,), height=4,
+                                              width=5, dtype="uint16")
+
+        class StripeTester(VDSGeneratorTester):
+            def create_virtual_layout(self, source_meta):
+                v_layout = self.new_virtual_layout((3, 8, 5), "uint16")
+                for idx, file_ in enumerate(["a.h5", "b.h5"]):
+                    v_source = self.new_virtual_source(
+                        file_, shape=(3, 4, 5), dtype="uint16")
+                    v_layout[:2, idx * 4:(idx + 1) * 4, :] = v_source[1:]
+                return v_layout
+
+        gen = StripeTester(source_node="data", source_metadata=source_meta)
+
+        layout = gen.create_node_layout(
+            vdsgenerator.NodeMeta("ts", (2,), "float64"))
+        plan = layout.to_plan("/test/vds.h5")
+
+        self.assertIsNone(gen._node)
+        self.assertEqual((3, 2), plan.shape)
+        self.assertEqual("float64", plan.dtype)
+        # Second stripe maps the same frames, so is dropped
+        self.assertEqual([("/test/a.h5", "ts", (3, 2))],
+                         [mapping[:3] for mapping in plan.mappings])
+        self.assertEqual([((slice(0, 2), slice(0, 2)),
+                           (slice(1, 3), slice(0, 2)))],
+                         plan.selections(plan.mappings[0]))
+
+    @patch('vdsgen.layoutplan.PlanSource')
+    @patch('vdsgen.layoutplan.StreamingLayout')
+    def test_new_virtual_layout_same_frame_shape(self, layout_mock,
+                                                 source_mock):
+        source_meta = vdsgenerator.SourceMeta(frames=(3,), height=4,
+                                              width=5, dtype="uint16")
+        gen = VDSGeneratorTester(source_node="data",
+                                 source_metadata=source_meta,
+                                 _node=vdsgenerator.NodeMeta(
+                                     "mask", (4, 5), "uint8"))
+
+        v_layout = gen.new_virtual_layout((3, 8, 5), "uint16")
+        v_source = gen.new_virtual_source("a.h5", (3, 4, 5), "uint16")
+
+        self.assertEqual(layout_mock.return_value, v_layout)
+        self.assertEqual(source_mock.return_value, v_source)
+        layout_mock.assert_called_once_with((3, 8, 5), "uint8")
+        source_mock.assert_called_once_with("a.h5", "mask", (3, 4, 5),
+                                            "uint8")
+
+    def test_create_layout_plan(self):
+        source_meta = vdsgenerator.SourceMeta(frames=(3,), height=4,
+                                              width=5, dtype="uint16")
+
+        class PlanTester(VDSGeneratorTester):
+            def create_virtual_layout(self, source_meta):
+                v_layout = self.new_virtual_layout((3, 4, 5), "uint16")
+                v_layout[...] = self.new_virtual_source(
+                    "a.h5", shape=(3, 4, 5), dtype="uint16")
+                return v_layout
+
+        gen = PlanTester(source_node="data", source_metadata=source_meta)
+
+        plan = gen.create_layout_plan()
+
+        self.assertEqual((3, 4, 5), plan.shape)
+        self.assertEqual([("a.h5", "data")],
+                         [mapping[:2] for mapping in plan.mappings])
+        self.assertFalse(gen._planning)
+
+
+class ROITest(unittest.TestCase):
+
+    class StripesTester(VDSGeneratorTester):
+        # Two stripes of 2 x 5, one above the other with a gap of 1
+        def create_virtual_layout(self, source_meta):
+            v_layout = self.new_virtual_layout((3, 5, 5), "uint16")
+            for idx, file_ in enumerate(["a.h5", "b.h5"]):
+                v_layout[:, idx * 3:idx * 3 + 2, :] = self.new_virtual_source(
+                    file_, shape=(3, 2, 5), dtype="uint16")
+            return v_layout
+
+    source_meta = vdsgenerator.SourceMeta(frames=(3,), height=2, width=5,
+                                          dtype="uint16")
+
+    def test_create_layout_plan_roi(self):
+        gen = self.StripesTester(source_node="data", target_node="data",
+                                 output_file="/test/vds.h5", roi=(3, 1, 2, 3),
+                                 source_metadata=self.source_meta)
+
+        plan = gen.create_layout_plan()
+
+        self.assertEqual((3, 2, 3), plan.shape)
+        self.assertEqual(1, len(plan.mappings))
+        mapping = plan.mappings[0]
+        self.assertEqual("b.h5", mapping.file_path)
+        self.assertEqual([0, 1], mapping.axes[0][1].tolist())
+        self.assertEqual([1, 2, 3], mapping.axes[1][1].tolist())
+
+    def test_create_layout_plan_roi_outside_frames_then_error(self):
+        gen = self.StripesTester(source_node="data", target_node="data",
+                                 output_file="/test/vds.h5", roi=(4, 0, 2, 5),
+                                 source_metadata=self.source_meta)
+
+        with self.assertRaises(ValueError):
+            gen.create_layout_plan()
+
+    def test_given_invalid_roi_then_error(self):
+        with self.assertRaises(ValueError):
+            VDSGenerator("/test/path", prefix="stripe_", roi=(0, 0, 0, 5))
+
+
+class FrameRangeTest(unittest.TestCase):
+
+    class InterleaveTester(VDSGeneratorTester):
+        # 8 frames interleaved across two files in blocks of 2
+        def create_virtual_layout(self, source_meta):
+            v_layout = self.new_virtual_layout((8, 4, 5), "uint16")
+            for idx, file_ in enumerate(["a.h5", "b.h5"]):
+                v_layout[idx * 2::4] = self.new_virtual_source(
+                    file_, shape=(4, 4, 5), dtype="uint16")[0::2]
+                v_layout[idx * 2 + 1::4] = self.new_virtual_source(
+                    file_, shape=(4, 4, 5), dtype="uint16")[1::2]
+            return v_layout
+
+    source_meta = vdsgenerator.SourceMeta(frames=(8,), height=4, width=5,
+                                          dtype="uint16")
+
+    def test_create_layout_plan_frame_range(self):
+        gen = self.InterleaveTester(source_node="data", target_node="data",
+                                    output_file="/test/vds.h5",
+                                    frame_range=(1, None, 4),
+                                    source_metadata=self.source_meta)
+
+        plan = gen.create_layout_plan()
+
+        self.assertEqual((2, 4, 5), plan.shape)
+        self.assertEqual([("a.h5", [0, 1], [1, 3])],
+                         [(mapping.file_path, mapping.frames[0].tolist(),
+                           mapping.frames[1].tolist())
+                          for mapping in plan.mappings])
+
+    def test_create_layout_plan_empty_frame_range_then_error(self):
+        gen = self.InterleaveTester(source_node="data", target_node="data",
+                                    output_file="/test/vds.h5",
+                                    frame_range=(8, None, None),
+                                    source_metadata=self.source_meta)
+
+        with self.assertRaises(ValueError):
+            gen.create_layout_plan()
+
+
+class ShardedVDSTest(TempDirTestCase):
+
+    def setUp(self):
+        import numpy as np
+        import h5py as h5
+
+        super(ShardedVDSTest, self).setUp()
+        # 12 frames interleaved across 3 files, with per-frame timestamps
+        for idx in range(3):
+            with h5.File(os.path.join(self.directory,
+                                      "stripe_{}.h5".format(idx)), "w") as f:
+                f["data"] = np.arange(4 * 2 * 3).reshape(4, 2, 3) + idx * 100
+                f["ts"] = np.arange(4) + idx * 100
+
+    def test_generate_sharded_vds(self):
+        import numpy as np
+        import h5py as h5
+        from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+
+        InterleaveVDSGenerator(self.directory, prefix="stripe_",
+                               output="full.h5", nodes=["ts"]).generate_vds()
+        gen = InterleaveVDSGenerator(self.directory, prefix="stripe_",
+                                     nodes=["ts"])
+
+        shard_files = gen.generate_sharded_vds(max_frames=6)
+
+        self.assertEqual([os.path.join(self.directory,
+                                       "stripe_vds_shard{}.h5".format(idx))
+                          for idx in range(2)], shard_files)
+        with h5.File(os.path.join(self.directory, "full.h5"), "r") as full, \
+                h5.File(gen.output_file, "r") as vds:
+            np.testing.assert_array_equal(full["data"][...],
+                                          vds["data"][...])
+            np.testing.assert_array_equal(full["ts"][...], vds["ts"][...])
+            index = vds["data_shards"][...]
+        self.assertEqual([(0, 6, b"stripe_vds_shard0.h5"),
+                          (6, 12, b"stripe_vds_shard1.h5")], index.tolist())
+        with h5.File(shard_files[1], "r") as shard:
+            self.assertEqual((6, 2, 3), shard["data"].shape)
+            self.assertEqual(3, len(shard["data"].virtual_sources()))
+
+    def test_generate_sharded_vds_no_budget_then_error(self):
+        from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+
+        gen = InterleaveVDSGenerator(self.directory, prefix="stripe_")
+
+        with self.assertRaises(ValueError):
+            gen.generate_sharded_vds()
+
+    def generator(self):
+        from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+        return InterleaveVDSGenerator(self.directory, prefix="stripe_",
+                                      skip_unchanged=True)
+
+    def test_unchanged_sharded_vds_then_up_to_date(self):
+        shard_files = self.generator().generate_sharded_vds(max_frames=6)
+
+        gen = self.generator()
+        with patch(h5py_patch_path + ".File.create_dataset") as create_mock:
+            self.assertEqual(shard_files,
+                             gen.generate_sharded_vds(max_frames=6))
+
+        self.assertTrue(gen.up_to_date)
+        create_mock.assert_not_called()
+
+    def test_up_to_date_plain_vds_then_sharded(self):
+        import h5py as h5
+
+        self.generator().generate_vds()
+        gen = self.generator()
+        self.assertTrue(gen.up_to_date)
+
+        shard_files = gen.generate_sharded_vds(max_frames=6)
+
+        self.assertFalse(gen.up_to_date)
+        self.assertEqual(2, len(shard_files))
+        with h5.File(gen.output_file, "r") as vds:
+            self.assertEqual(2, len(vds[gen.shard_index_node]))
+            self.assertEqual(gen.fingerprint,
+                             vds["data"].attrs[VDSGenerator.FINGERPRINT])
+
+    def test_changed_budget_then_shards_replaced(self):
+        old_files = self.generator().generate_sharded_vds(max_frames=6)
+
+        gen = self.generator()
+        shard_files = gen.generate_sharded_vds(max_frames=4)
+
+        self.assertFalse(gen.up_to_date)
+        self.assertEqual(3, len(shard_files))
+        self.assertTrue(all(os.path.isfile(file_) for file_ in shard_files))
+        self.assertFalse(any(os.path.isfile(file_)
+                             for file_ in set(old_files) - set(shard_files)))
+
+    def test_missing_shard_index_then_regenerated(self):
+        import h5py as h5
+
+        self.generator().generate_sharded_vds(max_frames=6)
+        gen = self.generator()
+        with h5.File(gen.output_file, "a") as vds:
+            del vds[gen.shard_index_node]
+
+        shard_files = gen.generate_sharded_vds(max_frames=6)
+
+        self.assertFalse(gen.up_to_date)
+        self.assertEqual(shard_files, gen.read_shard_index())
+
+
+class FingerprintTest(TempDirTestCase):
+
+    def setUp(self):
+        import numpy as np
+        import h5py as h5
+
+        super(FingerprintTest, self).setUp()
+        for idx in range(2):
+            with h5.File(os.path.join(self.directory,
+                                      "stripe_{}.h5".format(idx)), "w") as f:
+                f["data"] = np.zeros((3, 2, 4))
+
+    def generator(self, **kwargs):
+        from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+        return InterleaveVDSGenerator(self.directory, prefix="stripe_",
+                                      skip_unchanged=True, **kwargs)
+
+    def test_generate_vds_stores_fingerprint(self):
+        import h5py as h5
+
+        gen = self.generator()
+        gen.generate_vds()
+
+        with h5.File(gen.output_file, "r") as vds:
+            self.assertEqual(gen.fingerprint,
+                             vds["data"].attrs[VDSGenerator.FINGERPRINT])
+
+    def test_unchanged_then_sources_not_read(self):
+        self.generator().generate_vds()
+
+        with patch(vdsgen_patch_path + ".read_metadata") as read_mock:
+            gen = self.generator()
+            gen.generate_vds()
+
+        self.assertTrue(gen.up_to_date)
+        read_mock.assert_not_called()
+
+    def test_changed_arguments_or_sources_then_not_up_to_date(self):
+        import h5py as h5
+
+        self.generator().generate_vds()
+
+        self.assertFalse(self.generator(block_size=3).up_to_date)
+        with h5.File(os.path.join(self.directory, "stripe_1.h5"), "a") as f:
+            f["extra"] = [1, 2, 3]
+        self.assertFalse(self.generator().up_to_date)
+
+    def test_changed_then_replaced(self):
+        import h5py as h5
+
+        self.generator().generate_vds()
+
+        gen = self.generator(block_size=3)
+        gen.generate_vds()
+
+        with h5.File(gen.output_file, "r") as vds:
+            self.assertEqual(gen.fingerprint,
+                             vds["data"].attrs[VDSGenerator.FINGERPRINT])
+
+    def test_same_options_then_up_to_date(self):
+        from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+
+        self.generator().generate_vds()
+
+        gen = InterleaveVDSGenerator(self.directory, None,
+                                     ["stripe_0.h5", "stripe_1.h5"],
+                                     fill_value=-1, block_size=1,
+                                     skip_unchanged=True)
+        self.assertTrue(gen.up_to_date)
+
+    def test_changed_subclass_option_then_not_up_to_date(self):
+        from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+
+        SubFrameVDSGenerator(self.directory, prefix="stripe_",
+                             skip_unchanged=True).generate_vds()
+
+        self.assertFalse(SubFrameVDSGenerator(
+            self.directory, prefix="stripe_", stripe_spacing=3,
+            skip_unchanged=True).up_to_date)
+
+    def test_signature_is_init(self):
+        import inspect
+
+        arguments = inspect.signature(VDSGenerator).bind(
+            "/test/path", prefix="stripe_").arguments
+
+        self.assertEqual(dict(path="/test/path", prefix="stripe_"),
+                         dict(arguments))
@@ -0,0 +1,144 @@
+import os
+import unittest
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.layoutplan import LayoutPlan, PlanSource
+from vdsgen.interleavevdsgenerator import InterleaveVDSGenerator
+from vdsgen.subframevdsgenerator import SubFrameVDSGenerator
+from vdsgen.reshapevdsgenerator import ReshapeVDSGenerator
+from vdsgen.verify import later_overlaps, mapped_elements, \
+    sample_positions, sample_regions, verify_plan, verify_vds
+
+from tests import TempDirTestCase
+
+
+class SampleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def test_sample_positions_include_ends(self):
+        positions = sample_positions(100, 4, self.rng)
+
+        self.assertEqual(4, len(positions))
+        self.assertEqual([0, 99], [positions[0], positions[-1]])
+
+    def test_sample_positions_all(self):
+        self.assertEqual([0, 1, 2],
+                         sample_positions(3, 4, self.rng).tolist())
+
+    def test_sample_regions(self):
+        plan = LayoutPlan((4, 20, 6), "uint8")
+        plan[:, 2:12] = PlanSource("/raw.h5", "data", (4, 10, 6), "uint8")
+
+        regions = sample_regions(plan.mappings[0], 3, 4, self.rng)
+
+        # First corner, one at random, then last corner
+        self.assertEqual(3, len(regions))
+        self.assertEqual((slice(0, 4), slice(0, 4)), regions[0])
+        self.assertEqual((slice(6, 10), slice(2, 6)), regions[-1])
+
+
+class OverlapTest(unittest.TestCase):
+
+    def setUp(self):
+        plan = LayoutPlan((4, 2, 6), "uint8")
+        plan[0:3, :, 0:4] = PlanSource("/raw_1.h5", "data", (3, 2, 4),
+                                       "uint8")
+        plan[2:4, :, 2:6] = PlanSource("/raw_2.h5", "data", (2, 2, 4),
+                                       "uint8")
+        plan[3, :, 0:2] = PlanSource("/raw_3.h5", "data", (2, 2), "uint8")
+        self.mappings = plan.mappings
+
+    def test_later_overlaps(self):
+        overlaps = later_overlaps(self.mappings)
+
+        self.assertEqual([[self.mappings[1]], [], []], overlaps)
+
+    def test_mapped_elements(self):
+        region = [np.arange(2), np.arange(4)]
+
+        np.testing.assert_array_equal(
+            [[True, True, False, False]] * 2,
+            mapped_elements(2, region, [self.mappings[1]]))
+        np.testing.assert_array_equal(
+            [[True] * 4] * 2, mapped_elements(1, region, [self.mappings[1]]))
+
+
+class VerifyTest(TempDirTestCase):
+
+    def setUp(self):
+        super(VerifyTest, self).setUp()
+        rng = np.random.RandomState(0)
+        for idx in range(2):
+            with h5.File(self.file_path("stripe_{}.h5".format(idx)),
+                         "w") as f:
+                f.create_dataset("data",
+                                 data=rng.randint(0, 100, (6, 10, 12), "u2"))
+        self.generator = SubFrameVDSGenerator(self.directory,
+                                              prefix="stripe_",
+                                              stripe_spacing=3,
+                                              module_spacing=2)
+        self.generator.generate_vds()
+        self.vds = self.file_path("stripe_vds.h5")
+
+    def test_verify_vds(self):
+        self.assertEqual([], verify_vds(self.vds, seed=0))
+
+    def test_verify_nested_vds(self):
+        ReshapeVDSGenerator((2, 3), self.directory, files=["stripe_vds.h5"],
+                            output="nested.h5").generate_vds()
+
+        self.assertEqual([], verify_vds(self.file_path("nested.h5"),
+                                        frames=6, seed=0))
+
+    def test_verify_generator_plan(self):
+        plan = self.generator.layout_plan
+
+        self.assertIsInstance(plan, LayoutPlan)
+        self.assertEqual([], verify_plan(self.vds, plan, seed=0))
+
+    def test_wrong_mapping_then_mismatches(self):
+        # Frames of the stripes in the wrong order
+        InterleaveVDSGenerator(self.directory, prefix="stripe_",
+                               output="interleaved.h5").generate_vds()
+        plan = LayoutPlan((12, 10, 12), "uint16")
+        for idx in range(2):
+            plan[idx * 6:(idx + 1) * 6] = PlanSource(
+                self.file_path("stripe_{}.h5".format(idx)), "data",
+                (6, 10, 12), "uint16")
+
+        mismatches = verify_plan(self.file_path("interleaved.h5"), plan,
+                                 frames=2, regions=1, seed=0)
+
+        # Only the first frame of each stripe is in the right place
+        self.assertEqual(2, len(mismatches))
+        self.assertEqual({"Data differs"},
+                         {mismatch.reason for mismatch in mismatches})
+        self.assertEqual(5, mismatches[0].source[0])
+
+    def test_missing_source_then_mismatch(self):
+        plan = self.generator.create_layout_plan()
+        os.remove(self.file_path("stripe_1.h5"))
+
+        mismatches = verify_plan(self.vds, plan)
+
+        self.assertEqual([(self.file_path("stripe_1.h5"),
+                           "Cannot open source")],
+                         [(mismatch.file_path, mismatch.reason)
+                          for mismatch in mismatches])
+
+    def test_overlapping_mappings(self):
+        plan = LayoutPlan((6, 10, 12), "uint16")
+        for idx in range(2):
+            plan[idx * 2:idx * 2 + 4, :, idx * 5:idx * 5 + 7] = PlanSource(
+                self.file_path("stripe_{}.h5".format(idx)), "data",
+                (6, 10, 12), "uint16")[:4, :, :7]
+        with h5.File(self.file_path("overlap.h5"), "w",
+                     libver="latest") as f:
+            plan.create_virtual_dataset(f, "data")
+
+        self.assertEqual([], verify_plan(self.file_path("overlap.h5"), plan,
+                                         frames=4, regions=4, seed=0))
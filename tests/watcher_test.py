@@ -0,0 +1,267 @@
+import os
+import re
+import time
+import threading
+import unittest
+
+import numpy as np
+import h5py as h5
+from mock import MagicMock, patch
+
+from vdsgen import app
+from vdsgen.watcher import PollingMonitor, InotifyMonitor, VDSWatcher
+from vdsgen.vdsgenerator import VDSGenerator
+
+from tests import TempDirTestCase
+
+
+watcher_patch_path = "vdsgen.watcher"
+VDSWatcher_patch_path = watcher_patch_path + ".VDSWatcher"
+
+
+def touch(file_path, data="data"):
+    with open(file_path, "a") as f:
+        f.write(data)
+
+
+class PollingMonitorTest(TempDirTestCase):
+
+    monitor_class = PollingMonitor
+
+    def setUp(self):
+        super(PollingMonitorTest, self).setUp()
+        self.regex = re.compile(r"stripe_\d+\.h5$")
+
+    def test_wait_existing_files(self):
+        touch(os.path.join(self.directory, "stripe_1.h5"))
+        touch(os.path.join(self.directory, "other_1.h5"))
+        monitor = self.monitor_class(self.directory, self.regex)
+
+        changed, _ = monitor.wait(0.1)
+        monitor.close()
+
+        self.assertEqual({"stripe_1.h5"}, changed)
+
+    def test_wait_new_file(self):
+        monitor = self.monitor_class(self.directory, self.regex, 0.01)
+        monitor.wait(0.01)
+
+        touch(os.path.join(self.directory, "stripe_2.h5"))
+        changed, _ = monitor.wait(1)
+        monitor.close()
+
+        self.assertEqual({"stripe_2.h5"}, changed)
+
+    def test_wait_no_changes_then_timeout(self):
+        monitor = self.monitor_class(self.directory, self.regex, 0.01)
+        monitor.wait(0.01)
+
+        changed, closed = monitor.wait(0.05)
+        monitor.close()
+
+        self.assertEqual(set(), changed)
+        self.assertEqual(set(), closed)
+
+
+@unittest.skipIf(InotifyMonitor.load_libc() is None, "inotify unavailable")
+class InotifyMonitorTest(PollingMonitorTest):
+
+    monitor_class = InotifyMonitor
+
+    def test_wait_closed_file(self):
+        monitor = self.monitor_class(self.directory, self.regex)
+        monitor.wait(0.01)
+
+        touch(os.path.join(self.directory, "stripe_3.h5"))
+        changed, closed = set(), set()
+        deadline = time.time() + 1
+        while "stripe_3.h5" not in closed and time.time() < deadline:
+            new_changed, new_closed = monitor.wait(0.1)
+            changed |= new_changed
+            closed |= new_closed
+        monitor.close()
+
+        self.assertEqual({"stripe_3.h5"}, changed)
+        self.assertEqual({"stripe_3.h5"}, closed)
+
+
+class VDSWatcherTest(TempDirTestCase):
+
+    def setUp(self):
+        super(VDSWatcherTest, self).setUp()
+        self.output_file = os.path.join(self.directory, "stripe_vds.h5")
+        self.factory = MagicMock(side_effect=self.create_generator)
+
+    def create_generator(self, files, metadata_cache):
+        gen_mock = MagicMock(output_file=self.output_file,
+                             target_nodes=["data"])
+
+        def generate_vds():
+            with h5.File(gen_mock.output_file, "w") as f:
+                f.create_dataset("data", data=[len(files)])
+        gen_mock.generate_vds.side_effect = generate_vds
+        return gen_mock
+
+    def test_init_prefix_and_files_then_error(self):
+        with self.assertRaises(ValueError):
+            VDSWatcher(self.directory, "stripe_", self.factory,
+                       files=["stripe_1.h5"], use_inotify=False)
+
+    def test_init_not_incremental_without_expected_then_error(self):
+        with self.assertRaises(ValueError):
+            VDSWatcher(self.directory, "stripe_", self.factory,
+                       incremental=False, use_inotify=False)
+
+    @patch(VDSWatcher_patch_path + ".is_readable", return_value=True)
+    def test_update_closed_then_complete(self, _):
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             settle_time=10, use_inotify=False)
+
+        self.assertFalse(watcher.update({"stripe_1.h5"}, set()))
+        self.assertTrue(watcher.update(set(), {"stripe_1.h5"}))
+
+        self.assertEqual({"stripe_1.h5"}, watcher.complete)
+
+    @patch(VDSWatcher_patch_path + ".is_readable", return_value=True)
+    def test_update_settled_then_complete(self, _):
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             settle_time=0, use_inotify=False)
+
+        self.assertTrue(watcher.update({"stripe_1.h5"}, set()))
+
+    @patch(VDSWatcher_patch_path + ".is_readable", return_value=False)
+    def test_update_unreadable_then_not_complete(self, _):
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             settle_time=0, use_inotify=False)
+
+        self.assertFalse(watcher.update({"stripe_1.h5"}, {"stripe_1.h5"}))
+
+    def test_is_readable_not_hdf5_then_false(self):
+        touch(os.path.join(self.directory, "stripe_1.h5"))
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             use_inotify=False)
+
+        self.assertFalse(
+            watcher.is_readable(os.path.join(self.directory, "stripe_1.h5")))
+
+    def test_generate_writes_temporary_file_and_moves(self):
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             use_inotify=False)
+        watcher.complete = {"stripe_2.h5", "stripe_1.h5"}
+
+        output_file = watcher.generate()
+
+        self.factory.assert_called_once_with(["stripe_1.h5", "stripe_2.h5"],
+                                             watcher.metadata_cache)
+        self.assertEqual(os.path.join(self.directory, "stripe_vds.h5"),
+                         output_file)
+        self.assertEqual(["stripe_vds.h5"], os.listdir(self.directory))
+
+    def test_generate_unchanged_files_then_skip(self):
+        touch(os.path.join(self.directory, "stripe_1.h5"))
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             use_inotify=False)
+        watcher.complete = {"stripe_1.h5"}
+
+        watcher.generate()
+        self.assertIsNone(watcher.generate())
+
+        self.factory.assert_called_once_with(["stripe_1.h5"],
+                                             watcher.metadata_cache)
+
+    def test_generate_files_in_given_order(self):
+        watcher = VDSWatcher(self.directory, None, self.factory,
+                             files=["stripe_2.h5", "stripe_1.h5"],
+                             use_inotify=False)
+        watcher.complete = {"stripe_1.h5", "stripe_2.h5"}
+
+        watcher.generate()
+
+        self.factory.assert_called_once_with(["stripe_2.h5", "stripe_1.h5"],
+                                             watcher.metadata_cache)
+
+    def test_generate_output_with_other_nodes_then_error(self):
+        with h5.File(self.output_file, "w") as f:
+            f.create_dataset("entry/other", data=[1])
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             use_inotify=False)
+        watcher.complete = {"stripe_1.h5"}
+
+        with self.assertRaises(IOError):
+            watcher.generate()
+
+        with h5.File(self.output_file, "r") as f:
+            self.assertIn("entry/other", f)
+
+    @patch(VDSWatcher_patch_path + ".is_readable", return_value=True)
+    def test_watch_incremental(self, _):
+        for idx in range(3):
+            touch(os.path.join(self.directory, "stripe_{}.h5".format(idx)))
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             expected_files=3, settle_time=0.01,
+                             poll_interval=0.01, use_inotify=False)
+
+        output_file = watcher.watch(timeout=5)
+
+        self.factory.assert_called_with(
+            ["stripe_0.h5", "stripe_1.h5", "stripe_2.h5"],
+            watcher.metadata_cache)
+        self.assertEqual(self.output_file, output_file)
+        self.assertIsNone(VDSGenerator.metadata_cache)
+
+    @patch(VDSWatcher_patch_path + ".is_readable", return_value=True)
+    def test_watch_not_incremental_then_generate_once(self, _):
+        files = ["stripe_0.h5", "stripe_1.h5"]
+        watcher = VDSWatcher(self.directory, None, self.factory, files=files,
+                             incremental=False, settle_time=0.01,
+                             poll_interval=0.01, use_inotify=False)
+        touch(os.path.join(self.directory, files[0]))
+        watcher.update(*watcher.monitor.wait(0.01))
+        time.sleep(0.02)
+        watcher.update(*watcher.monitor.wait(0.01))
+        self.factory.assert_not_called()
+
+        touch(os.path.join(self.directory, files[1]))
+        watcher.watch(timeout=5)
+
+        self.factory.assert_called_once_with(files, watcher.metadata_cache)
+
+    @patch(VDSWatcher_patch_path + ".is_readable", return_value=False)
+    def test_watch_timeout_then_error(self, _):
+        watcher = VDSWatcher(self.directory, "stripe_", self.factory,
+                             expected_files=1, settle_time=0.01,
+                             poll_interval=0.01, use_inotify=False)
+
+        with self.assertRaises(IOError):
+            watcher.watch(timeout=0.05)
+
+
+class WatchInterleaveTest(TempDirTestCase):
+
+    def write(self, idx, data):
+        # Write under another name and move into place, so it is complete
+        file_path = self.file_path("stripe_{}.h5".format(idx))
+        with h5.File(file_path + ".tmp", "w") as f:
+            f["data"] = data
+        os.rename(file_path + ".tmp", file_path)
+
+    def test_watch_files_out_of_order(self):
+        data = np.arange(2 * 3 * 2 * 2).reshape(2, 3, 2, 2)
+        args = app.parse_args([self.directory, "-p", "stripe_", "-w",
+                               "--mode", "interleave", "--expected-files",
+                               "2", "--settle-time", "0.05", "--timeout",
+                               "10"])
+        self.write(1, data[1])
+        writer = threading.Timer(0.3, self.write, (0, data[0]))
+        writer.start()
+        self.addCleanup(writer.join)
+
+        with patch("vdsgen.watcher.os.rename", wraps=os.rename) as move:
+            output_file = app.watch(args)
+
+        # Generated once, with each file at its real frames
+        self.assertEqual(1, [call_args[0][1] for call_args in
+                             move.call_args_list].count(output_file))
+        with h5.File(output_file, "r") as f:
+            np.testing.assert_array_equal(
+                data.transpose(1, 0, 2, 3).reshape(6, 2, 2), f["data"])
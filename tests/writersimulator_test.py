@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import h5py as h5
+
+from vdsgen.writersimulator import WriterSimulator, STRIPE
+
+from tests import TempDirTestCase
+
+
+class WriterSimulatorTest(TempDirTestCase):
+
+    def setUp(self):
+        super(WriterSimulatorTest, self).setUp()
+        self.prefix = self.directory + "/raw"
+
+    def read(self, file_path):
+        with h5.File(file_path, "r", swmr=True) as h5_file:
+            return h5_file["data"][...]
+
+    def test_invalid_mode_then_error(self):
+        with self.assertRaises(ValueError):
+            WriterSimulator(self.prefix, 10, 2, mode="tile")
+
+    def test_frame_indices(self):
+        interleave = WriterSimulator(self.prefix, 10, 2, block_size=2)
+        stripe = WriterSimulator(self.prefix, 10, 2, mode=STRIPE)
+
+        np.testing.assert_array_equal([2, 3, 6, 7],
+                                      interleave.frame_indices(1))
+        np.testing.assert_array_equal(range(10), stripe.frame_indices(1))
+
+    def test_dropped_frames_whole_blocks_and_repeatable(self):
+        simulator = WriterSimulator(self.prefix, 100, 2, block_size=5,
+                                    drop_probability=0.5, seed=3)
+
+        dropped = simulator.dropped_frames(0)
+        self.assertEqual(dropped, simulator.dropped_frames(0))
+        self.assertTrue(0 < len(dropped) < 50)
+        for frame in dropped:
+            self.assertIn(frame // 5 * 5, dropped)
+
+    def test_no_drops(self):
+        simulator = WriterSimulator(self.prefix, 10, 2)
+
+        self.assertEqual(set(), simulator.dropped_frames(0))
+
+    def test_write_file_interleave(self):
+        simulator = WriterSimulator(self.prefix, 10, 2, block_size=2,
+                                    x_dim=3, y_dim=2, frame_rate=0,
+                                    flush_interval=3)
+
+        timestamps = simulator.write_file(1, 0)
+
+        data = self.read(simulator.file_paths[1])
+        self.assertEqual((4, 2, 3), data.shape)
+        np.testing.assert_array_equal([2, 3, 6, 7], data[:, 1, 2])
+        self.assertEqual([2, 3, 6, 7], sorted(timestamps))
+        self.assertEqual(timestamps[2], timestamps[6])  # Same flush
+
+    def test_write_file_dropped_blocks_fill(self):
+        simulator = WriterSimulator(self.prefix, 12, 2, block_size=2,
+                                    x_dim=3, y_dim=2, frame_rate=0,
+                                    drop_probability=0.5, seed=1)
+        dropped = simulator.dropped_frames(0)
+
+        timestamps = simulator.write_file(0, 0)
+
+        data = self.read(simulator.file_paths[0])
+        self.assertEqual((6, 2, 3), data.shape)
+        for local_idx, frame in enumerate(simulator.frame_indices(0)):
+            expected = -1 if frame in dropped else frame
+            self.assertEqual(expected, data[local_idx, 0, 0])
+        self.assertFalse(dropped.intersection(timestamps))
+
+    def test_write_file_rate(self):
+        simulator = WriterSimulator(self.prefix, 5, 1, x_dim=3, y_dim=2,
+                                    frame_rate=50)
+
+        start = time.time()
+        timestamps = simulator.write_file(0, start)
+
+        self.assertGreaterEqual(timestamps[4] - start, 4 / 50.0)
+
+    def test_run_stripe(self):
+        simulator = WriterSimulator(self.prefix, 4, 2, mode=STRIPE,
+                                    x_dim=3, y_dim=2, frame_rate=0)
+        simulator.start_delay = 0
+
+        timestamps = simulator.run()
+
+        self.assertEqual([0, 1, 2, 3], sorted(timestamps))
+        self.assertEqual(2, len(timestamps[0]))
+        for file_path in simulator.file_paths:
+            np.testing.assert_array_equal(range(4),
+                                          self.read(file_path)[:, 0, 0])
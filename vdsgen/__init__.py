@@ -1,11 +1,47 @@
-"""Make things easy to import."""
-from .subframevdsgenerator import SubFrameVDSGenerator
-from .interleavevdsgenerator import InterleaveVDSGenerator
-from .excaliburgapfillvdsgenerator import ExcaliburGapFillVDSGenerator
-from .reshapevdsgenerator import ReshapeVDSGenerator
+"""Make things easy to import.
 
-from .rawsourcegenerator import generate_raw_files
+Generators are imported on first access, so that importing the package (or
+running the command line tool) does not pay the h5py/NumPy import cost for
+modes that are never used. This relies on module __getattr__ (PEP 562), so
+before Python 3.7 they are imported up front, as they always were.
+"""
+import sys
+import importlib
+
+_lazy_imports = {
+    "SubFrameVDSGenerator": ".subframevdsgenerator",
+    "InterleaveVDSGenerator": ".interleavevdsgenerator",
+    "ExcaliburGapFillVDSGenerator": ".excaliburgapfillvdsgenerator",
+    "ReshapeVDSGenerator": ".reshapevdsgenerator",
+    "generate_raw_files": ".rawsourcegenerator",
+    "MultiVDSGenerator": ".multigenerator",
+    "VDSPipeline": ".pipeline",
+    "FrameIndex": ".frameindex",
+    "SharedFrameReader": ".sharedframes",
+}
 
 __all__ = ["InterleaveVDSGenerator", "SubFrameVDSGenerator",
            "ReshapeVDSGenerator", "ExcaliburGapFillVDSGenerator",
-           "generate_raw_files"]
+           "generate_raw_files", "MultiVDSGenerator", "VDSPipeline",
+           "FrameIndex", "SharedFrameReader"]
+
+
+def __getattr__(name):
+    """Import the module providing `name` when it is first accessed."""
+    if name not in _lazy_imports:
+        raise AttributeError(
+            "module {} has no attribute {}".format(__name__, name))
+
+    module = importlib.import_module(_lazy_imports[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value  # Cache so __getattr__ is not called again
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_imports))
+
+
+if sys.version_info < (3, 7):  # Module __getattr__ is not called
+    for _name in __all__:
+        __getattr__(_name)
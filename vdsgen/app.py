@@ -1,13 +1,14 @@
+import os
 import sys
 import logging
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter,\
     RawTextHelpFormatter
 
+# Only the base class is imported here, for its defaults - each generator is
+# imported in main once the mode is known, so that the command line only pays
+# the import cost of the selected mode
 from .vdsgenerator import VDSGenerator
-from .interleavevdsgenerator import InterleaveVDSGenerator
-from .subframevdsgenerator import SubFrameVDSGenerator
-from .excaliburgapfillvdsgenerator import ExcaliburGapFillVDSGenerator
-from .reshapevdsgenerator import ReshapeVDSGenerator
+from .utils import frame_range_type
 
 help_message = """
 A script to create a virtual dataset composed of multiple raw HDF5 files.
@@ -22,15 +23,26 @@ flag; you will then need to provide --shape and --data_type, though defaults
 are provided for these.
 """
 
+# Modes whose layout depends on the whole set of files - where each file is
+# mapped depends on how many others there are - so a watched VDS is only
+# generated once all files are complete
+WHOLE_SCAN_MODES = ("sub-frames", "interleave")
+
 
 class Formatter(ArgumentDefaultsHelpFormatter, RawTextHelpFormatter):
     pass
 
 
-def parse_args():
-    """Parse command line arguments."""
-    parser = ArgumentParser(description=help_message,
-                            formatter_class=Formatter)
+def parse_args(argv=None, parser_class=ArgumentParser):
+    """Parse command line arguments.
+
+    Args:
+        argv(list(str)): Arguments to parse - Default is sys.argv[1:]
+        parser_class(type): ArgumentParser (sub)class to parse with
+
+    """
+    parser = parser_class(description=help_message,
+                          formatter_class=Formatter)
     parser.add_argument(
         "path", type=str, help="Root folder of source files and VDS.")
 
@@ -97,6 +109,25 @@ def parse_args():
         help="Whether each axis alternates. List of True/False for each axis. "
              "[reshape]")
 
+    # Arguments for watching a directory for raw files as they are written
+    watch_args = parser.add_argument_group(
+        "Arguments to watch <path> and generate the VDS as files complete"
+    )
+    watch_args.add_argument(
+        "-w", "--watch", action="store_true", dest="watch",
+        help="Watch for raw files and generate the VDS as each completes.")
+    watch_args.add_argument(
+        "--expected-files", type=int, dest="expected_files", default=None,
+        help="Number of raw files to wait for before exiting. Default is the "
+             "number of --files, or to watch until interrupted.")
+    watch_args.add_argument(
+        "--settle-time", type=float, dest="settle_time", default=1.0,
+        help="Seconds without writes before a raw file is complete, if it "
+             "is not seen to be closed.")
+    watch_args.add_argument(
+        "--timeout", type=float, dest="timeout", default=None,
+        help="Seconds to wait for the next file to complete before failing.")
+
     # Arguments that always apply
     other_args = parser.add_argument_group()
     other_args.add_argument(
@@ -113,13 +144,70 @@ def parse_args():
     other_args.add_argument(
         "--target-node", type=str, dest="target_node",
         default=VDSGenerator.target_node, help="Data node in VDS file.")
+    other_args.add_argument(
+        "-N", "--nodes", type=str, nargs="*", dest="nodes", default=None,
+        help="Other nodes in the source files to map in the same pass, with "
+             "the same geometry - '<source>[:<target>]'. Nodes with frames "
+             "of a different shape, e.g. per-frame timestamps, are mapped by "
+             "frame.")
+    other_args.add_argument(
+        "--roi", type=int, nargs=4, dest="roi", default=None,
+        metavar=("Y", "X", "HEIGHT", "WIDTH"),
+        help="Region of the frames of the VDS, after any gaps and stripes, "
+             "to map - only the sources overlapping it are mapped.")
+    other_args.add_argument(
+        "--frame-range", type=frame_range_type, dest="frame_range",
+        default=None, metavar="START:STOP[:STEP]",
+        help="Frames of the VDS to map, as for a slice, e.g. ::10 for every "
+             "tenth frame. Selects along the first axis of --new-shape.")
+    other_args.add_argument(
+        "--shard-mappings", type=int, dest="shard_mappings", default=None,
+        help="Split the VDS into shard files by frame range, each with at "
+             "most this many mappings, with a VDS of the shards and an index "
+             "of them in the output file.")
+    other_args.add_argument(
+        "--shard-frames", type=int, dest="shard_frames", default=None,
+        help="Split the VDS into shard files by frame range, each with at "
+             "most this many frames.")
+    other_args.add_argument(
+        "--skip-unchanged", action="store_true", dest="skip_unchanged",
+        help="Don't rewrite the VDS if the output file already has one "
+             "generated with the same arguments from the same source files "
+             "(by path, size and modification time).")
+    other_args.add_argument(
+        "--frame-index", action="store_true", dest="frame_index",
+        help="Write an index of the source file and frame of each frame of "
+             "the VDS in <target node>_frame_index.")
+    other_args.add_argument(
+        "--relative-paths", action="store_true", dest="relative_paths",
+        help="Store source paths relative to the VDS file, so they can be "
+             "moved together.")
+    other_args.add_argument(
+        "--preview", type=int, nargs="+", dest="preview", default=None,
+        metavar="FACTOR",
+        help="Generate previews of the VDS binned by each factor, e.g. 2 4 "
+             "8, in <output>_preview.h5 and link them from the VDS as "
+             "<target node>_bin<factor>.")
+    other_args.add_argument(
+        "--verify", action="store_true", dest="verify",
+        help="Check the VDS after generating it, by reading samples of each "
+             "mapping through it and directly from the source.")
     other_args.add_argument(
         "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
         default=VDSGenerator.log_level,
         help="Logging level (off=3, info=2, debug=1).")
+    other_args.add_argument(
+        "--server", type=str, dest="server", default=None,
+        help="Socket of a running dls-vds-server.py to send the request to, "
+             "rather than generating the VDS in this process.")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     args.shape = tuple(args.shape)
+    if args.roi is not None:
+        args.roi = tuple(args.roi)
+    if args.nodes is not None:
+        args.nodes = [tuple(node.split(":", 1)) if ":" in node
+                      else (node, node) for node in args.nodes]
 
     if args.empty and args.files is None:
         parser.error(
@@ -132,16 +220,40 @@ def parse_args():
             parser.error("Gap fill can only operate on a single dataset.")
     if args.mode == "reshape" and args.new_shape is None:
         parser.error("Must provide --new-shape for reshape mode")
+    if args.nodes and args.empty:
+        parser.error("Cannot map --nodes when making an --empty VDS")
+    if args.watch and (args.shard_mappings or args.shard_frames):
+        parser.error("Cannot shard the VDS when using --watch")
+    if args.watch and args.empty:
+        parser.error("Cannot --watch for raw files when making an --empty VDS")
+    if args.preview and (args.watch or args.empty):
+        parser.error("Cannot --preview a VDS when using --watch or --empty")
+    if args.verify and (args.watch or args.empty):
+        parser.error("Cannot --verify a VDS when using --watch or --empty")
+    if args.watch and args.mode in WHOLE_SCAN_MODES and \
+            args.files is None and args.expected_files is None:
+        parser.error("Must provide --expected-files to --watch in {} "
+                     "mode".format(args.mode))
 
     return args
 
 
-def main():
-    """Run program."""
-    logging.basicConfig(
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+def create_generator(args, metadata_cache=None):
+    """Create the generator for the mode given in the parsed arguments.
 
-    args = parse_args()
+    Args:
+        args(Namespace): Arguments from parse_args
+        metadata_cache(MetadataCache): Cache to read source metadata through
+            - Default is to read it from the files
+
+    Returns:
+        VDSGenerator: Generator ready to generate the VDS
+
+    """
+    def cached(generator_class):
+        if metadata_cache is None:
+            return generator_class
+        return generator_class.with_metadata_cache(metadata_cache)
 
     if args.empty:
         source_metadata = dict(shape=args.shape, dtype=args.data_type)
@@ -149,7 +261,8 @@ def main():
         source_metadata = None
 
     if args.mode == "interleave":
-        gen = InterleaveVDSGenerator(
+        from .interleavevdsgenerator import InterleaveVDSGenerator
+        gen = cached(InterleaveVDSGenerator)(
             args.path,
             prefix=args.prefix, files=args.files,
             output=args.output,
@@ -158,9 +271,16 @@ def main():
             target_node=args.target_node,
             block_size=args.block_size,
             fill_value=args.fill_value,
-            log_level=args.log_level)
+            log_level=args.log_level,
+            nodes=args.nodes,
+            roi=args.roi,
+            frame_range=args.frame_range,
+            skip_unchanged=args.skip_unchanged,
+            frame_index=args.frame_index,
+            relative_paths=args.relative_paths)
     elif args.mode == "sub-frames":
-        gen = SubFrameVDSGenerator(
+        from .subframevdsgenerator import SubFrameVDSGenerator
+        gen = cached(SubFrameVDSGenerator)(
             args.path,
             prefix=args.prefix, files=args.files,
             output=args.output,
@@ -170,9 +290,17 @@ def main():
             stripe_spacing=args.stripe_spacing,
             module_spacing=args.module_spacing,
             fill_value=args.fill_value,
-            log_level=args.log_level)
+            log_level=args.log_level,
+            nodes=args.nodes,
+            roi=args.roi,
+            frame_range=args.frame_range,
+            skip_unchanged=args.skip_unchanged,
+            frame_index=args.frame_index,
+            relative_paths=args.relative_paths)
     elif args.mode == "gap-fill":
-        gen = ExcaliburGapFillVDSGenerator(
+        from .excaliburgapfillvdsgenerator import \
+            ExcaliburGapFillVDSGenerator
+        gen = cached(ExcaliburGapFillVDSGenerator)(
             args.path,
             prefix=args.prefix, files=args.files,
             output=args.output,
@@ -183,10 +311,17 @@ def main():
             chip_spacing=args.stripe_spacing,
             module_spacing=args.module_spacing,
             fill_value=args.fill_value,
-            log_level=args.log_level
+            log_level=args.log_level,
+            nodes=args.nodes,
+            roi=args.roi,
+            frame_range=args.frame_range,
+            skip_unchanged=args.skip_unchanged,
+            frame_index=args.frame_index,
+            relative_paths=args.relative_paths
         )
     elif args.mode == "reshape":
-        gen = ReshapeVDSGenerator(
+        from .reshapevdsgenerator import ReshapeVDSGenerator
+        gen = cached(ReshapeVDSGenerator)(
             tuple(args.new_shape),
             args.path,
             prefix=args.prefix, files=args.files,
@@ -196,14 +331,128 @@ def main():
             target_node=args.target_node,
             fill_value=args.fill_value,
             log_level=args.log_level,
-            alternate=args.alternate
+            alternate=args.alternate,
+            nodes=args.nodes,
+            roi=args.roi,
+            frame_range=args.frame_range,
+            skip_unchanged=args.skip_unchanged,
+            frame_index=args.frame_index,
+            relative_paths=args.relative_paths
         )
     else:
         raise NotImplementedError("Invalid VDS mode. Must be frames, "
                                   "interleave, sub-frames, gap-fill "
                                   "or reshape.")
 
-    gen.generate_vds()
+    return gen
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+
+    if args.server is not None:
+        from .server import send_request
+        response = send_request(args.server, sys.argv[1:])
+        if response["status"] != "ok":
+            raise IOError(response["message"])
+        return
+
+    if args.watch:
+        watch(args)
+        return
+
+    gen = create_generator(args)
+    if args.shard_mappings or args.shard_frames:
+        gen.generate_sharded_vds(args.shard_mappings, args.shard_frames)
+    else:
+        gen.generate_vds()
+    if args.verify:
+        verify(gen)
+    if args.preview:
+        preview(gen, args.preview)
+
+
+def verify(gen):
+    """Check the VDS of a generator against samples of its sources.
+
+    The VDS is checked against the mappings the generator wrote, or the
+    mappings stored in it if it was unchanged and so not written.
+
+    Args:
+        gen(VDSGenerator): Generator that has generated its VDS
+
+    Raises:
+        IOError: If any samples differ or could not be read
+
+    """
+    from .verify import verify_plan, verify_vds
+
+    if gen.layout_plan is None:
+        mismatches = verify_vds(gen.output_file, gen.target_node)
+    else:
+        mismatches = verify_plan(gen.output_file, gen.layout_plan,
+                                 gen.target_node)
+    if mismatches:
+        raise IOError("VDS at {} does not match its sources at {} "
+                      "samples".format(gen.output_file, len(mismatches)))
+
+
+def preview(gen, factors):
+    """Generate binned previews of the VDS of a generator.
+
+    The previews of an unchanged VDS are only generated if they are missing.
+
+    Args:
+        gen(VDSGenerator): Generator that has generated its VDS
+        factors(list(int)): Binning factors
+
+    """
+    import h5py as h5
+    from .preview import generate_previews, preview_nodes
+
+    if gen.up_to_date:
+        with h5.File(gen.output_file, "r") as h5_file:
+            if all(node in h5_file for node in
+                   preview_nodes(gen.target_node, factors).values()):
+                return
+
+    generate_previews(gen.output_file, gen.target_node, factors)
+
+
+def watch(args):
+    """Watch args.path and generate the VDS as raw files are completed.
+
+    Args:
+        args(Namespace): Arguments from parse_args
+
+    Returns:
+        str: Path of the VDS file
+
+    """
+    from copy import copy
+    from .watcher import VDSWatcher
+
+    def generator_factory(files, metadata_cache):
+        file_args = copy(args)
+        file_args.prefix = None
+        file_args.files = files
+        if file_args.output is None and args.prefix is not None:
+            # Name the VDS after the prefix, not the files found so far
+            file_args.output = "{}vds{}".format(
+                args.prefix, os.path.splitext(files[0])[1])
+        return create_generator(file_args, metadata_cache)
+
+    watcher = VDSWatcher(
+        args.path, args.prefix, generator_factory, files=args.files,
+        expected_files=args.expected_files,
+        incremental=args.mode not in WHOLE_SCAN_MODES,
+        source_node=args.source_node, settle_time=args.settle_time,
+        log_level=args.log_level)
+    return watcher.watch(timeout=args.timeout)
 
 
 if __name__ == "__main__":
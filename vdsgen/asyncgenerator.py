@@ -0,0 +1,215 @@
+"""Run VDS generation from asyncio without blocking the event loop."""
+
+import os
+import asyncio
+import inspect
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import MetadataCache
+from .vdsgenerator import VDSGenerator, find_source_files, read_metadata
+
+
+class AsyncVDSGenerator(object):
+
+    """Wrap the VDSGenerator classes to run them in an executor.
+
+    Each blocking step (file discovery, reading source metadata and writing
+    the VDS) is run in the executor, with at most max_concurrency steps
+    running at once across all generations started from this object. Every
+    method takes a timeout and can be cancelled; cancelling stops waiting for
+    the step, but a step already running in the executor runs to completion,
+    because h5py calls cannot be interrupted.
+
+    Metadata is scanned concurrently for all source files, and cached, so
+    generators created from here do not open the files again.
+
+    Example:
+        async with AsyncVDSGenerator(max_concurrency=8) as runner:
+            await asyncio.gather(*[
+                runner.generate(InterleaveVDSGenerator, path, prefix=prefix)
+                for prefix in prefixes])
+
+    """
+
+    # Default Values
+    max_concurrency = 4  # Blocking steps running at once
+
+    def __init__(self, max_concurrency=None, executor=None):
+        """
+        Args:
+            max_concurrency(int): Number of blocking steps to run at once
+            executor(Executor): Executor to run steps in - Default is a
+                ThreadPoolExecutor with max_concurrency workers, shut down by
+                close
+
+        """
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+
+        self.metadata_cache = MetadataCache()
+
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self._executor = executor
+        self._semaphore = None  # Created in the running loop on first use
+        self._generator_classes = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down the executor, if it was created here."""
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def run(self, func, *args, timeout=None, **kwargs):
+        """Run a blocking function in the executor.
+
+        Args:
+            func(callable): Function to call
+            timeout(float): Seconds to wait, including time spent waiting for
+                the concurrency limit - Default is forever
+
+        Returns:
+            The return value of func
+
+        Raises:
+            asyncio.TimeoutError: If timeout expires
+
+        """
+        return await asyncio.wait_for(self._run(func, *args, **kwargs),
+                                      timeout)
+
+    async def _run(self, func, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs))
+
+    async def find_files(self, path, prefix, timeout=None):
+        """Find HDF5 files in given folder with given prefix.
+
+        Args:
+            path(str): Folder to search
+            prefix(str): Prefix of HDF5 files, followed by an index
+            timeout(float): Seconds to wait - Default is forever
+
+        Returns:
+            list: HDF5 files in folder that have the given prefix
+
+        """
+        return await self.run(find_source_files, path, prefix,
+                              timeout=timeout)
+
+    async def scan(self, files, source_node=None, nodes=None, timeout=None):
+        """Read the metadata of the given files concurrently.
+
+        Args:
+            files(list(str)): Paths to HDF5 files
+            source_node(str): Data node in source HDF5 files
+            nodes(list(str)): Other nodes in source HDF5 files to read the
+                metadata of, as for the nodes of a generator
+            timeout(float): Seconds to wait for all files - Default is forever
+
+        Returns:
+            list(dict): Number of frames, height, width and data type of the
+                dataset in each file, and a NodeMeta for each of nodes
+
+        """
+        if source_node is None:
+            source_node = VDSGenerator.source_node
+        nodes = tuple(nodes or ())
+
+        def grab_metadata(file_path):
+            return self.metadata_cache.get_metadata(
+                file_path, source_node,
+                lambda path_: read_metadata(path_, source_node, nodes),
+                nodes)
+
+        return await asyncio.wait_for(
+            asyncio.gather(*[self._run(grab_metadata, file_)
+                             for file_ in files]),
+            timeout)
+
+    async def create(self, generator_class, *args, timeout=None, **kwargs):
+        """Create a generator, scanning the source metadata concurrently.
+
+        Args:
+            generator_class(type): VDSGenerator subclass to create
+            args, kwargs: Arguments to generator_class
+            timeout(float): Seconds to wait - Default is forever
+
+        Returns:
+            VDSGenerator: Instance of generator_class (via a subclass using
+                the metadata cache)
+
+        """
+        return await asyncio.wait_for(
+            self._create(generator_class, *args, **kwargs), timeout)
+
+    async def _create(self, generator_class, *args, **kwargs):
+        arguments = inspect.signature(generator_class).bind(
+            *args, **kwargs).arguments
+
+        if arguments.get("source") is None:
+            # Scan files concurrently, so the generator hits the cache
+            path = arguments["path"]
+            if arguments.get("files") is not None:
+                files = [os.path.join(path, file_)
+                         for file_ in arguments["files"]]
+            else:
+                files = await self._run(find_source_files, path,
+                                        arguments["prefix"])
+            # Subclasses pass nodes through to VDSGenerator in kwargs
+            nodes = arguments.get("nodes") or \
+                arguments.get("kwargs", {}).get("nodes") or ()
+            nodes = [node if isinstance(node, str) else node[0]
+                     for node in nodes]
+            await self.scan(files, arguments.get("source_node"), nodes)
+
+        return await self._run(self._cached_class(generator_class),
+                               *args, **kwargs)
+
+    def _cached_class(self, generator_class):
+        if generator_class not in self._generator_classes:
+            self._generator_classes[generator_class] = \
+                generator_class.with_metadata_cache(self.metadata_cache)
+        return self._generator_classes[generator_class]
+
+    async def generate_vds(self, generator, timeout=None):
+        """Generate the virtual dataset of a generator.
+
+        Args:
+            generator(VDSGenerator): Generator to generate VDS with
+            timeout(float): Seconds to wait - Default is forever
+
+        """
+        await self.run(generator.generate_vds, timeout=timeout)
+
+    async def generate(self, generator_class, *args, timeout=None, **kwargs):
+        """Create a generator and generate its virtual dataset.
+
+        Args:
+            generator_class(type): VDSGenerator subclass to create
+            args, kwargs: Arguments to generator_class
+            timeout(float): Seconds to wait for both steps - Default is
+                forever
+
+        Returns:
+            VDSGenerator: The generator used
+
+        """
+        async def generate():
+            generator = await self._create(generator_class, *args, **kwargs)
+            await self._run(generator.generate_vds)
+            return generator
+
+        return await asyncio.wait_for(generate(), timeout)
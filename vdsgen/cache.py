@@ -0,0 +1,109 @@
+"""Caches to avoid repeated work when generating many VDS in one process."""
+
+import os
+import threading
+from collections import OrderedDict
+
+
+class LayoutCache(object):
+
+    """A thread safe, least recently used cache of virtual layouts."""
+
+    def __init__(self, max_entries=64):
+        """
+        Args:
+            max_entries(int): Number of layouts to keep before evicting the
+                least recently used
+
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, factory):
+        """Get the value for key, calling factory to create it if missing.
+
+        Args:
+            key: Hashable key describing everything the value depends on
+            factory(callable): Called with no arguments to create the value
+
+        Returns:
+            The cached or newly created value
+
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Create outside the lock so other keys are not blocked
+        value = factory()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return value
+
+
+class MetadataCache(LayoutCache):
+
+    """A thread safe cache of source dataset metadata.
+
+    Entries are keyed on file path, node and any other nodes read with it,
+    and are only used while the inode,
+    size and modification time of the file are unchanged, so a file can be
+    checked with a stat rather than opening it with HDF5.
+
+    """
+
+    def __init__(self, max_entries=4096):
+        """
+        Args:
+            max_entries(int): Number of datasets to keep before evicting the
+                least recently used
+
+        """
+        super(MetadataCache, self).__init__(max_entries)
+
+    @staticmethod
+    def file_signature(file_path):
+        """Get a signature of the file that changes when it is written to.
+
+        Args:
+            file_path(str): Path to file
+
+        Returns:
+            tuple: Inode, size and modification time of file
+
+        """
+        stat = os.stat(file_path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def get_metadata(self, file_path, node, loader, nodes=()):
+        """Get the metadata of node in file_path, loading it if required.
+
+        Args:
+            file_path(str): Path to HDF5 file
+            node(str): Dataset in file
+            loader(callable): Called with file_path to read the metadata
+            nodes(list(str)): Other datasets in file loader reads the
+                metadata of
+
+        Returns:
+            dict: Metadata from loader
+
+        """
+        key = (os.path.abspath(file_path), node, tuple(nodes),
+               self.file_signature(file_path))
+        return self.get(key, lambda: loader(file_path))
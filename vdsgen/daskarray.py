@@ -0,0 +1,339 @@
+"""Read the mappings of a LayoutPlan as a dask array, without a VDS.
+
+Reads through a VDS are resolved one mapping at a time inside libhdf5. A
+dask array of the plan instead reads each block straight from the source
+files, so blocks can be read in parallel by dask workers. Blocks are cut at
+the edges of the mappings and the chunks of the sources, so most blocks read
+from few sources, and blocks that no mapping covers are created with the fill
+value without any I/O.
+
+dask is an optional dependency - install it with the dask extra.
+
+Example:
+    generator = InterleaveVDSGenerator("/scratch/images", prefix="stripe_")
+    data = from_generator(generator)
+    means = data.mean(axis=(-2, -1)).compute()
+
+"""
+
+import bisect
+
+import numpy as np
+
+from .layoutplan import LayoutPlan, hyperslab
+
+BLOCK_BYTES = 128 * 2 ** 20  # Size of blocks to aim for, as in dask
+
+
+def run_boundaries(target, source):
+    """Find where runs of consecutive target and source indexes start and
+    stop.
+
+    Args:
+        target(numpy.ndarray): Target indexes
+        source(numpy.ndarray): Corresponding source indexes
+
+    Returns:
+        numpy.ndarray: Start and stop target index of each run
+
+    """
+    if len(target) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    order = np.argsort(target, kind="stable")
+    target, source = target[order], source[order]
+    breaks = np.flatnonzero((np.diff(target) != 1) |
+                            (np.diff(source) != 1)) + 1
+    return np.concatenate((target[:1], target[breaks],
+                           target[breaks - 1] + 1, target[-1:] + 1))
+
+
+def source_chunk_frames(shape, chunks, frame_axes):
+    """Find the length of a source chunk in flat frame indexes.
+
+    Args:
+        shape(tuple(int)): Shape of source dataset
+        chunks(tuple(int)): Chunk shape of source dataset, or None if it is
+            not chunked
+        frame_axes(int): Number of leading axes that index frames
+
+    Returns:
+        int: Frames in each chunk, or None if chunks do not split frames
+
+    """
+    if chunks is None or frame_axes == 0:
+        return None
+
+    frames = 1
+    for axis in reversed(range(frame_axes)):
+        frames *= chunks[axis]
+        if chunks[axis] != shape[axis]:
+            break
+    return frames
+
+
+def split_axis(length, candidates, limit):
+    """Split an axis into chunks, cutting at candidate boundaries if possible.
+
+    Each chunk is as long as possible up to limit, ending at a candidate
+    boundary. If there is no candidate within limit, the chunk is cut at
+    limit.
+
+    Args:
+        length(int): Length of axis
+        candidates(list(int)): Sorted indexes to prefer to cut at
+        limit(int): Maximum length of a chunk
+
+    Returns:
+        tuple(int): Length of each chunk
+
+    """
+    chunks = []
+    start = 0
+    while start < length:
+        stop = min(start + limit, length)
+        idx = bisect.bisect_right(candidates, stop) - 1
+        if idx >= 0 and candidates[idx] > start:
+            stop = candidates[idx]
+        chunks.append(stop - start)
+        start = stop
+    return tuple(chunks)
+
+
+def plan_chunks(plan, block_bytes=None, source_chunks=None):
+    """Choose the chunks of a dask array of a plan.
+
+    The axes within a frame (height and width) are always cut where the
+    mappings start and stop, e.g. at the edges of stripes. The frame axes are
+    cut into blocks of about block_bytes, at the edges of mappings and source
+    chunks if possible.
+
+    Args:
+        plan(LayoutPlan): Mappings of the array
+        block_bytes(int): Size of blocks to aim for - Default is 128 MiB
+        source_chunks(dict): (File path, node) -> chunk shape of each source
+            to align to - Default is to align to the mappings only
+
+    Returns:
+        tuple(tuple(int)): Chunks of each axis
+
+    """
+    block_bytes = block_bytes or BLOCK_BYTES
+    source_chunks = source_chunks or {}
+    frame_shape = plan.frame_shape
+    trailing = len(plan.shape) - plan.frame_axes
+
+    frame_candidates = [np.array([0, int(np.prod(frame_shape))])]
+    axis_candidates = [[np.array([0, length])]
+                       for length in plan.shape[plan.frame_axes:]]
+    for mapping in plan.mappings:
+        target, source = mapping.frames
+        frame_candidates.append(run_boundaries(target, source))
+        chunk = source_chunk_frames(
+            mapping.shape, source_chunks.get((mapping.file_path,
+                                              mapping.node)),
+            len(mapping.shape) - trailing)
+        if chunk is not None:
+            frame_candidates.append(target[source % chunk == 0])
+        for candidates, axis in zip(axis_candidates, mapping.axes):
+            candidates.append(run_boundaries(*axis))
+    frame_candidates = np.unique(np.concatenate(frame_candidates))
+
+    frame_bytes = int(np.prod(plan.shape[plan.frame_axes:])) * \
+        np.dtype(plan.dtype).itemsize
+    budget = max(1, block_bytes // max(frame_bytes, 1))
+    limits = []
+    for length in reversed(frame_shape):
+        limits.insert(0, max(1, min(length, budget)))
+        budget = max(1, budget // limits[0])
+
+    chunks = []
+    inner = int(np.prod(frame_shape))
+    for axis, length in enumerate(frame_shape):
+        inner //= length
+        candidates = frame_candidates[frame_candidates % inner == 0] // inner
+        candidates = np.unique(np.append(candidates % length, length))
+        chunks.append(split_axis(length, candidates.tolist(), limits[axis]))
+
+    for length, candidates in zip(plan.shape[plan.frame_axes:],
+                                  axis_candidates):
+        boundaries = np.unique(np.concatenate(candidates))
+        chunks.append(tuple(np.diff(boundaries).tolist()))
+
+    return tuple(chunks)
+
+
+def read_source_chunks(plan):
+    """Read the chunk shape of each source of a plan.
+
+    Args:
+        plan(LayoutPlan): Mappings of sources
+
+    Returns:
+        dict: (File path, node) -> chunk shape, or None if not chunked, of
+            each source that can be opened
+
+    """
+    import h5py as h5
+
+    chunks = {}
+    for mapping in plan.mappings:
+        key = (mapping.file_path, mapping.node)
+        if key in chunks:
+            continue
+        try:
+            with h5.File(mapping.file_path, "r") as h5_file:
+                chunks[key] = h5_file[mapping.node].chunks
+        except (IOError, OSError, KeyError):
+            pass
+
+    return chunks
+
+
+def _numpy_selection(selection):
+    # Convert slices and MultiBlockSlices to a selection of a NumPy array
+    if all(isinstance(axis, slice) for axis in selection):
+        return selection
+
+    indices = []
+    for axis in selection:
+        if isinstance(axis, slice):
+            indices.append(np.arange(axis.start, axis.stop))
+        else:
+            indices.append((axis.start + axis.stride *
+                            np.arange(axis.count)[:, np.newaxis] +
+                            np.arange(axis.block)).ravel())
+    return np.ix_(*indices)
+
+
+def read_block(plan, fill_value):
+    """Read the data of a plan from its sources.
+
+    Args:
+        plan(LayoutPlan): Mappings of block
+        fill_value: Value of elements that are not mapped
+
+    Returns:
+        numpy.ndarray: Data of block
+
+    """
+    import h5py as h5
+
+    block = np.full(plan.shape, fill_value, dtype=plan.dtype)
+    for mapping in plan.mappings:
+        with h5.File(mapping.file_path, "r") as h5_file:
+            dataset_id = h5_file[mapping.node].id
+            for target, source in plan.iter_selections(mapping):
+                start, count, stride, block_ = hyperslab(source)
+                file_space = dataset_id.get_space()
+                file_space.select_hyperslab(start, count, stride, block_)
+
+                start, count, stride, block_ = hyperslab(target)
+                data = np.empty(tuple(np.multiply(count, block_)),
+                                dtype=plan.dtype)
+                memory_space = h5.h5s.create_simple(data.shape)
+                dataset_id.read(memory_space, file_space, data)
+                block[_numpy_selection(target)] = data
+
+    return block
+
+
+def from_plan(plan, fill_value=0, block_bytes=None, align_source_chunks=True):
+    """Create a dask array reading the mappings of a plan.
+
+    Args:
+        plan(LayoutPlan): Mappings of array
+        fill_value: Value of elements that are not mapped
+        block_bytes(int): Size of blocks to aim for - Default is 128 MiB
+        align_source_chunks(bool): Open the sources to align blocks to their
+            chunks
+
+    Returns:
+        dask.array.Array: Lazy array of plan
+
+    """
+    import dask.array as da
+    from dask.base import tokenize
+
+    source_chunks = read_source_chunks(plan) if align_source_chunks else None
+    chunks = plan_chunks(plan, block_bytes, source_chunks)
+
+    mappings = [mapping for mapping in plan.mappings
+                if len(mapping.frames[0])]
+    # Target bounds of each mapping - flat frames then each other axis
+    bounds = np.array([[(target.min(), target.max())
+                        for target, _ in (mapping.frames,) + mapping.axes]
+                       for mapping in mappings], dtype=np.int64).reshape(
+        len(mappings), len(plan.shape) - plan.frame_axes + 1, 2)
+
+    name = "vdsgen-" + tokenize(
+        plan.shape, str(np.dtype(plan.dtype)), fill_value, chunks,
+        [(mapping.file_path, mapping.node, bound.tobytes())
+         for mapping, bound in zip(mappings, bounds)])
+    offsets = [np.concatenate(([0], np.cumsum(axis))) for axis in chunks]
+
+    graph = {}
+    for block_idx in np.ndindex(*[len(axis) for axis in chunks]):
+        starts = [int(offsets[axis][idx])
+                  for axis, idx in enumerate(block_idx)]
+        stops = [int(offsets[axis][idx + 1])
+                 for axis, idx in enumerate(block_idx)]
+        shape = tuple(stop - start for start, stop in zip(starts, stops))
+
+        frames = plan.frame_axes
+        low = [np.ravel_multi_index(starts[:frames], plan.frame_shape)
+               if frames else 0] + starts[frames:]
+        high = [np.ravel_multi_index([stop - 1 for stop in stops[:frames]],
+                                     plan.frame_shape)
+                if frames else 0] + [stop - 1 for stop in stops[frames:]]
+        overlaps = np.flatnonzero(
+            np.all((bounds[:, :, 0] <= high) & (bounds[:, :, 1] >= low),
+                   axis=1))
+
+        view = None
+        if len(overlaps):
+            candidates = LayoutPlan(plan.shape, plan.dtype, plan.frame_axes)
+            candidates.mappings = [mappings[idx] for idx in overlaps]
+            view = candidates.view(tuple(
+                slice(start, stop) for start, stop in zip(starts, stops)))
+
+        if view is None or not view.mappings:
+            graph[(name,) + block_idx] = (np.full, shape, fill_value,
+                                          plan.dtype)
+        else:
+            graph[(name,) + block_idx] = (read_block, view, fill_value)
+
+    return da.Array(graph, name, chunks, dtype=plan.dtype)
+
+
+def from_generator(generator, node=None, block_bytes=None,
+                   align_source_chunks=True):
+    """Create a dask array of the layout of a generator.
+
+    The frame range and ROI of the generator are applied, as for the VDS.
+
+    Args:
+        generator(VDSGenerator): Generator with its sources read
+        node(str): Target node of the generator to create - Default is the
+            target node
+        block_bytes(int): Size of blocks to aim for - Default is 128 MiB
+        align_source_chunks(bool): Open the sources to align blocks to their
+            chunks
+
+    Returns:
+        dask.array.Array: Lazy array of layout
+
+    """
+    if generator.up_to_date:
+        raise ValueError("Generator skipped reading its unchanged sources")
+
+    node_meta = None
+    if node is not None and node != generator.target_node:
+        targets = [target for _, target in generator.nodes]
+        if node not in targets:
+            raise ValueError("Generator has no target node {}".format(node))
+        node_meta = generator.node_metadata[targets.index(node)]
+
+    plan = generator.create_layout_plan(node_meta)
+    return from_plan(plan, generator.fill_value, block_bytes,
+                     align_source_chunks)
@@ -9,11 +9,13 @@ class ExcaliburGapFillVDSGenerator(GapFillVDSGenerator):
 
     GRID_X = 8  # All Excalibur sensors are 8 chips wide
     CHIP_SIZE = 256  # Width and height of Excalibur chips is 256 pixels
+    FINGERPRINT_ATTRIBUTES = GapFillVDSGenerator.FINGERPRINT_ATTRIBUTES + (
+        "chip_spacing", "module_spacing")
 
     def __init__(self, path, prefix=None, files=None, output=None, source=None,
                  source_node=None, target_node=None, fill_value=None,
                  modules=1, chip_spacing=3, module_spacing=10,
-                 log_level=None):
+                 log_level=None, **kwargs):
         """
         Args:
             path(str): Root folder to find raw files and create VDS
@@ -31,6 +33,7 @@ class ExcaliburGapFillVDSGenerator(GapFillVDSGenerator):
             module_spacing(int): Spacing between modules
             log_level(int): Logging level (off=3, info=2, debug=1) -
                 Default is info
+            kwargs: Other VDSGenerator arguments, e.g. nodes
 
         """
         if modules == 1:
@@ -47,7 +50,7 @@ class ExcaliburGapFillVDSGenerator(GapFillVDSGenerator):
             path, prefix, files, output, source, source_node, target_node,
             fill_value,
             self.CHIP_SIZE, self.CHIP_SIZE, self.GRID_X, grid_y,
-            log_level)
+            log_level, **kwargs)
 
     def construct_vds_spacing(self):
         """Construct lists of x and y spacings between sub-sections.
@@ -0,0 +1,220 @@
+"""Flatten a VDS built on other VDS files into one that maps raw data only.
+
+Each level of a nested VDS is resolved by libhdf5 on every read, opening
+the intermediate files and intersecting their mappings again. Flattening
+does this once: the mappings of every virtual source are composed into the
+mappings of the VDS that reads it, and the result is written as a new VDS.
+
+"""
+
+import os
+import sys
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from .layoutplan import LayoutPlan
+from .vdsgenerator import VDSGenerator
+
+logger = logging.getLogger("VDSFlatten")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Flatten a VDS that maps other VDS files into a single "
+                    "level VDS that only maps raw data.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "input", type=str, help="VDS file to flatten.")
+    parser.add_argument(
+        "-n", "--node", type=str, dest="node",
+        default=VDSGenerator.target_node, help="Virtual dataset to flatten.")
+    parser.add_argument(
+        "-o", "--output", type=str, dest="output", default=None,
+        help="Output file. Default is the input file with a _flat suffix.")
+    parser.add_argument(
+        "--target-node", type=str, dest="target_node", default=None,
+        help="Node to create in output file. Default is --node.")
+    parser.add_argument(
+        "--relative-paths", action="store_true", dest="relative_paths",
+        help="Store source paths relative to the output file.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def is_virtual(file_path, node):
+    """Check if a dataset is a virtual dataset.
+
+    Args:
+        file_path(str): Path to HDF5 file
+        node(str): Dataset in file
+
+    Returns:
+        bool: True if the dataset is virtual, False if it is not or it cannot
+            be read (it is then left as a source of the flattened VDS)
+
+    """
+    import h5py as h5
+
+    try:
+        with h5.File(file_path, "r") as h5_file:
+            dataset = h5_file.get(node)
+            return isinstance(dataset, h5.Dataset) and dataset.is_virtual
+    except (IOError, OSError):
+        logger.warning("Cannot open %s - leaving it as a source", file_path)
+        return False
+
+
+def same_fill_value(first, second):
+    """Check if two fill values are the same, treating NaN as equal.
+
+    Args:
+        first: Fill value
+        second: Fill value
+
+    Returns:
+        bool: True if they are the same
+
+    """
+    return bool(first == second) or (first != first and second != second)
+
+
+def flatten_plan(file_path, node, fill_value=None, _resolving=()):
+    """Read the mappings of a virtual dataset, resolving virtual sources.
+
+    Elements a virtual source does not map read as its own fill value, which
+    a flattened plan cannot keep, so a fill value can be given to check the
+    virtual sources against.
+
+    Args:
+        file_path(str): Path to HDF5 file
+        node(str): Virtual dataset in file
+        fill_value: Fill value every virtual source must have - Default is
+            not to check
+
+    Returns:
+        tuple(LayoutPlan, int): Mappings from non-virtual sources only, and
+            the number of mappings in the dataset and all of the virtual
+            datasets it maps from
+
+    Raises:
+        ValueError: If a virtual source has a different fill value
+
+    """
+    import h5py as h5
+
+    key = (os.path.abspath(file_path), node)
+    if key in _resolving:
+        raise ValueError("Virtual dataset {} in {} maps from itself".format(
+            node, file_path))
+
+    with h5.File(file_path, "r") as h5_file:
+        dataset = h5_file[node]
+        if not dataset.is_virtual:
+            raise ValueError("{} in {} is not a virtual dataset".format(
+                node, file_path))
+        if _resolving and fill_value is not None and \
+                not same_fill_value(dataset.fillvalue, fill_value):
+            raise ValueError(
+                "Virtual source {} in {} has fill value {}, not {} - the "
+                "elements it does not map would change value".format(
+                    node, file_path, dataset.fillvalue, fill_value))
+        plan = LayoutPlan.from_dataset(dataset)
+        mappings = len(dataset.virtual_sources())
+
+    sources = []
+    for mapping in plan.mappings:
+        source = (mapping.file_path, mapping.node)
+        if source not in sources:
+            sources.append(source)
+
+    plans = {}
+    for source_path, source_node in sources:
+        if is_virtual(source_path, source_node):
+            plans[(source_path, source_node)], source_mappings = \
+                flatten_plan(source_path, source_node, fill_value,
+                             _resolving + (key,))
+            mappings += source_mappings
+
+    return plan.compose(plans), mappings
+
+
+def flatten_vds(input_file, output_file, node=None, target_node=None,
+                relative_paths=False):
+    """Write a single level copy of a virtual dataset.
+
+    The fill value and attributes of the dataset are copied too, except the
+    fingerprint of the generator that created it, which does not describe
+    the copy. Virtual sources must have the same fill value as the dataset.
+
+    Args:
+        input_file(str): Path to VDS file
+        output_file(str): Path to file to create flattened VDS in
+        node(str): Virtual dataset in input_file
+        target_node(str): Node to create in output_file - Default is node
+        relative_paths(bool): Store source paths relative to output_file
+
+    Returns:
+        dict: Number of mappings in the dataset ("before"), including the
+            virtual datasets it maps from ("nested"), and in the flattened
+            dataset ("after")
+
+
+    Raises:
+        ValueError: If a virtual source has a different fill value
+
+    """
+    import h5py as h5
+
+    node = node or VDSGenerator.target_node
+    target_node = target_node or node
+
+    with h5.File(input_file, "r") as h5_file:
+        dataset = h5_file[node]
+        before = len(dataset.virtual_sources()) if dataset.is_virtual else 0
+        fill_value = dataset.fillvalue
+        attributes = dict(dataset.attrs)
+    attributes.pop(VDSGenerator.FINGERPRINT, None)
+
+    plan, nested = flatten_plan(input_file, node, fill_value)
+    after = plan.selection_count()
+
+    with h5.File(output_file, "a", libver="latest") as vds:
+        if vds.get(target_node) is not None:
+            raise IOError("VDS {file} already has an entry for node "
+                          "{node}".format(file=output_file, node=target_node))
+        dataset = plan.create_virtual_dataset(vds, target_node,
+                                              fill_value=fill_value,
+                                              relative_paths=relative_paths)
+        for name, value in attributes.items():
+            dataset.attrs[name] = value
+
+    logger.info("Flattened %s in %s to %s: %s mappings (%s including nested "
+                "VDS) -> %s mappings", node, input_file, output_file, before,
+                nested, after)
+    return dict(before=before, nested=nested, after=after)
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+    logger.setLevel(args.log_level * 10)
+
+    output = args.output
+    if output is None:
+        stem, ext = os.path.splitext(args.input)
+        output = "{}_flat{}".format(stem, ext)
+
+    flatten_vds(args.input, output, args.node, args.target_node,
+                args.relative_paths)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
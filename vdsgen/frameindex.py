@@ -0,0 +1,166 @@
+"""A lookup index of the source file and frame of each frame of a VDS.
+
+Finding the raw file holding a frame of a VDS otherwise means reading the
+mappings of the dataset creation property list and intersecting their
+hyperslabs. The index stores the same information as runs of consecutive
+frames mapped from consecutive frames of one file, for each part of the
+frame (e.g. a stripe), so a frame is found with a binary search per part.
+
+"""
+
+import os
+import numbers
+from collections import namedtuple
+
+import numpy as np
+
+# Source of a part of a frame
+Location = namedtuple("Location", ["part", "file_path", "source_frame"])
+
+RUN_DTYPE = np.dtype([("part", "i4"), ("frame", "i8"), ("count", "i8"),
+                      ("file", "i4"), ("source_frame", "i8")])
+
+
+class FrameIndex(object):
+
+    """Runs of frames of a VDS mapped from each source file."""
+
+    def __init__(self, files, runs, regions, frame_shape):
+        """
+        Args:
+            files(list(str)): Path of each source file
+            runs(numpy.ndarray): Runs of RUN_DTYPE, sorted by part and frame
+            regions(numpy.ndarray): Start and stop of each part of the frame
+                on each axis after the frame axes - shape (parts, 2 * axes)
+            frame_shape(tuple(int)): Shape of the frame axes of the VDS
+
+        """
+        self.files = list(files)
+        self.runs = runs
+        self.regions = regions
+        self.frame_shape = tuple(frame_shape)
+
+        parts = np.arange(len(regions))
+        self._part_starts = np.searchsorted(runs["part"], parts, side="left")
+        self._part_stops = np.searchsorted(runs["part"], parts, side="right")
+
+    @classmethod
+    def from_plan(cls, plan):
+        """Create the index of the mappings of a LayoutPlan.
+
+        Args:
+            plan(LayoutPlan): Mappings of VDS
+
+        Returns:
+            FrameIndex: Index of plan
+
+        """
+        files = []
+        parts = []
+        regions = []
+        runs = []
+        for mapping in plan.mappings:
+            target, source = mapping.frames
+            if not len(target):
+                continue
+
+            if mapping.file_path not in files:
+                files.append(mapping.file_path)
+            part_key = tuple(target_.tobytes() for target_, _ in mapping.axes)
+            if part_key not in parts:
+                parts.append(part_key)
+                regions.append([value for target_, _ in mapping.axes
+                                for value in (target_.min(),
+                                              target_.max() + 1)])
+
+            order = np.argsort(target, kind="stable")
+            target, source = target[order], source[order]
+            starts = np.concatenate(([0], np.flatnonzero(
+                (np.diff(target) != 1) | (np.diff(source) != 1)) + 1))
+            mapping_runs = np.empty(len(starts), dtype=RUN_DTYPE)
+            mapping_runs["part"] = parts.index(part_key)
+            mapping_runs["frame"] = target[starts]
+            mapping_runs["count"] = np.diff(np.append(starts, len(target)))
+            mapping_runs["file"] = files.index(mapping.file_path)
+            mapping_runs["source_frame"] = source[starts]
+            runs.append(mapping_runs)
+
+        runs = np.concatenate(runs) if runs else \
+            np.empty(0, dtype=RUN_DTYPE)
+        runs = runs[np.lexsort((runs["frame"], runs["part"]))]
+        regions = np.array(regions, dtype=np.int64).reshape(
+            len(regions), 2 * (len(plan.shape) - plan.frame_axes))
+        return cls(files, runs, regions, plan.frame_shape)
+
+    @classmethod
+    def read(cls, group, name):
+        """Read an index written with write.
+
+        Args:
+            group(h5py.Group): Group containing index
+            name(str): Name of index dataset
+
+        Returns:
+            FrameIndex: Index, with the absolute path of each file
+
+        """
+        dataset = group[name]
+        directory = os.path.dirname(os.path.abspath(group.file.filename))
+        files = [os.path.join(directory, file_.decode("utf-8")
+                              if isinstance(file_, bytes) else file_)
+                 for file_ in dataset.attrs["files"]]
+        return cls(files, dataset[...], dataset.attrs["regions"],
+                   dataset.attrs["frame_shape"])
+
+    def write(self, group, name, relative_paths=False):
+        """Write the index as a dataset of runs, with the files and regions
+        of the parts as attributes.
+
+        Args:
+            group(h5py.Group): Group to create index in
+            name(str): Name of index dataset
+            relative_paths(bool): Store file paths relative to the file
+                containing group
+
+        """
+        import h5py as h5
+
+        files = self.files
+        if relative_paths:
+            directory = os.path.dirname(os.path.abspath(group.file.filename))
+            files = [os.path.relpath(file_, directory) for file_ in files]
+
+        dataset = group.create_dataset(name, data=self.runs)
+        dataset.attrs.create("files", files, dtype=h5.string_dtype())
+        dataset.attrs["regions"] = self.regions
+        dataset.attrs["frame_shape"] = np.array(self.frame_shape,
+                                                dtype=np.int64)
+
+    def lookup(self, frame):
+        """Find the source file and frame of each part of a frame.
+
+        Args:
+            frame(int or tuple(int)): Index of frame, flat or on each frame
+                axis
+
+        Returns:
+            list(Location): Source of each part of the frame that is mapped
+
+        """
+        if not isinstance(frame, (numbers.Integral, np.integer)):
+            frame = np.ravel_multi_index(tuple(frame), self.frame_shape)
+
+        locations = []
+        for part, (start, stop) in enumerate(zip(self._part_starts,
+                                                 self._part_stops)):
+            idx = start + np.searchsorted(self.runs["frame"][start:stop],
+                                          frame, side="right") - 1
+            if idx < start:
+                continue
+            run = self.runs[idx]
+            if frame < run["frame"] + run["count"]:
+                locations.append(Location(
+                    part, self.files[run["file"]],
+                    int(run["source_frame"] + frame - run["frame"])))
+
+        return locations
@@ -0,0 +1,287 @@
+"""Per-frame sum, maximum and saturated pixel count of a VDS.
+
+The statistics of a batch of frames are reduced with NumPy in one call, so
+they can be computed on the frames of any pass over the data - a scan of the
+VDS, or while it is copied by materialise_vds - without reading it again.
+Pixels of the gaps between modules, which no source maps, can be excluded.
+
+The statistics are stored as datasets next to the dataset, named
+<node>_sum, <node>_max and <node>_saturated, with the shape of its frame
+axes.
+
+"""
+
+import sys
+import time
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .flatten import flatten_plan
+from .vdsgenerator import VDSGenerator
+
+logger = logging.getLogger("VDSFrameStats")
+
+STATISTICS = ("sum", "max", "saturated")
+BATCH_BYTES = 64 * 1024 ** 2  # Size of slabs read in one call
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Compute the sum, maximum and saturated pixel count of "
+                    "each frame of a VDS and store them next to it.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "file", type=str, help="VDS file to scan.")
+    parser.add_argument(
+        "-n", "--node", type=str, dest="node",
+        default=VDSGenerator.target_node, help="Dataset to scan.")
+    parser.add_argument(
+        "--exclude-gaps", action="store_true", dest="exclude_gaps",
+        help="Exclude pixels that no source maps, e.g. gaps between modules.")
+    parser.add_argument(
+        "--saturation", type=float, dest="saturation", default=None,
+        help="Value at or above which a pixel is saturated. Default is the "
+             "maximum of the data type.")
+    parser.add_argument(
+        "-P", "--processes", type=int, dest="processes", default=1,
+        help="Number of processes to scan frames in parallel.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def statistic_nodes(node):
+    """Get the names of the statistics datasets of a node.
+
+    Args:
+        node(str): Dataset the statistics are of
+
+    Returns:
+        dict: Statistic -> name of dataset
+
+    """
+    return {name: "{}_{}".format(node.rstrip("/"), name)
+            for name in STATISTICS}
+
+
+def statistic_dtypes(dtype):
+    """Get the data types of the statistics of data.
+
+    Args:
+        dtype: Data type of data
+
+    Returns:
+        dict: Statistic -> data type
+
+    """
+    dtype = np.dtype(dtype)
+    return dict(sum=np.float64 if dtype.kind in "fc" else np.int64,
+                max=dtype, saturated=np.int64)
+
+
+def default_saturation(dtype):
+    """Get the default saturation value of a data type.
+
+    Args:
+        dtype: Data type of data
+
+    Returns:
+        Maximum value of integer types, or infinity for floats
+
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu":
+        return np.iinfo(dtype).max
+    return np.inf
+
+
+def gap_mask(plan):
+    """Find the pixels of a frame that any mapping of a plan maps.
+
+    Args:
+        plan(LayoutPlan): Mappings of dataset
+
+    Returns:
+        numpy.ndarray: Boolean mask of the axes after the frame axes, True
+            where mapped
+
+    """
+    mask = np.zeros(plan.shape[plan.frame_axes:], dtype=bool)
+    for mapping in plan.mappings:
+        if len(mapping.frames[0]):
+            mask[np.ix_(*[np.unique(target)
+                          for target, _ in mapping.axes])] = True
+    return mask
+
+
+def frame_statistics(frames, mask=None, saturation=None):
+    """Compute the statistics of a batch of frames.
+
+    Args:
+        frames(numpy.ndarray): Frames, with the last two axes the pixels
+        mask(numpy.ndarray): Pixels to include - Default is all
+        saturation: Value at or above which a pixel is saturated - Default is
+            the maximum of the data type
+
+    Returns:
+        dict: Statistic -> array of the shape of the frame axes
+
+    """
+    if saturation is None:
+        saturation = default_saturation(frames.dtype)
+    if mask is None:
+        pixels = frames.reshape(frames.shape[:-2] + (-1,))
+    else:
+        pixels = frames[..., mask]
+
+    dtypes = statistic_dtypes(frames.dtype)
+    if pixels.shape[-1] == 0:
+        lowest = np.iinfo(frames.dtype).min if frames.dtype.kind in "iu" \
+            else -np.inf
+        maximum = np.full(pixels.shape[:-1], lowest, dtype=frames.dtype)
+    else:
+        maximum = pixels.max(axis=-1)
+    return dict(sum=pixels.sum(axis=-1, dtype=dtypes["sum"]), max=maximum,
+                saturated=np.count_nonzero(pixels >= saturation, axis=-1))
+
+
+def create_statistics(group, node, frame_shape, dtype):
+    """Create the statistics datasets of a node, replacing any that exist.
+
+    Args:
+        group(h5py.Group): Group containing node
+        node(str): Dataset the statistics are of
+        frame_shape(tuple(int)): Shape of the frame axes of node
+        dtype: Data type of node
+
+    Returns:
+        dict: Statistic -> dataset
+
+    """
+    datasets = {}
+    dtypes = statistic_dtypes(dtype)
+    for name, stat_node in statistic_nodes(node).items():
+        if stat_node in group:
+            del group[stat_node]
+        datasets[name] = group.create_dataset(stat_node, shape=frame_shape,
+                                              dtype=dtypes[name])
+    return datasets
+
+
+def write_statistics(datasets, start, statistics):
+    """Write the statistics of a batch of frames of the first axis.
+
+    Args:
+        datasets(dict): Statistic -> dataset, from create_statistics
+        start(int): Index of the first frame of batch on the first axis
+        statistics(dict): Statistic -> array, from frame_statistics
+
+    """
+    for name, values in statistics.items():
+        datasets[name][start:start + len(values)] = values
+
+
+def _scan_range(job):
+    file_path, node, start, stop, mask, saturation, batch_frames = job
+
+    import h5py as h5
+
+    results = []
+    with h5.File(file_path, "r") as h5_file:
+        dataset = h5_file[node]
+        buffer = np.empty((min(batch_frames, stop - start),) +
+                          dataset.shape[1:], dtype=dataset.dtype)
+        for batch_start in range(start, stop, batch_frames):
+            batch_stop = min(batch_start + batch_frames, stop)
+            batch = buffer[:batch_stop - batch_start]
+            dataset.read_direct(batch,
+                                source_sel=np.s_[batch_start:batch_stop])
+            results.append((batch_start,
+                            frame_statistics(batch, mask, saturation)))
+    return results
+
+
+def scan_vds(file_path, node=None, exclude_gaps=False, saturation=None,
+             processes=1, batch_bytes=None):
+    """Compute the statistics of each frame of a dataset and store them next
+    to it.
+
+    Args:
+        file_path(str): Path to VDS file
+        node(str): Dataset - Default is data
+        exclude_gaps(bool): Exclude pixels that no source maps
+        saturation: Value at or above which a pixel is saturated - Default is
+            the maximum of the data type
+        processes(int): Number of processes to read frames in parallel
+        batch_bytes(int): Size of batches to read - Default is 64 MiB
+
+    Returns:
+        dict: Statistic -> array of the shape of the frame axes
+
+    """
+    import h5py as h5
+
+    node = node or VDSGenerator.target_node
+    start_time = time.time()
+
+    with h5.File(file_path, "r") as h5_file:
+        dataset = h5_file[node]
+        shape, dtype = dataset.shape, dataset.dtype
+
+    mask = None
+    if exclude_gaps:
+        mask = gap_mask(flatten_plan(file_path, node)[0])
+
+    frame_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+    batch_frames = max((batch_bytes or BATCH_BYTES) // max(frame_bytes, 1),
+                       1)
+    processes = max(min(processes or 1, shape[0]), 1)
+    bounds = np.linspace(0, shape[0], processes + 1).astype(int)
+    jobs = [(file_path, node, int(start), int(stop), mask, saturation,
+             batch_frames)
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_scan_range, jobs))
+    else:
+        results = [_scan_range(job) for job in jobs]
+
+    statistics = {name: np.empty(shape[:-2], dtype=statistic_dtype)
+                  for name, statistic_dtype in
+                  statistic_dtypes(dtype).items()}
+    for start, batch in (result for job_results in results
+                         for result in job_results):
+        for name, values in batch.items():
+            statistics[name][start:start + len(values)] = values
+
+    with h5.File(file_path, "r+", libver="latest") as h5_file:
+        datasets = create_statistics(h5_file, node, shape[:-2], dtype)
+        write_statistics(datasets, 0, statistics)
+
+    logger.info("Computed statistics of %s frames of %s in %.1fs",
+                int(np.prod(shape[:-2])), file_path, time.time() - start_time)
+    return statistics
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+    logger.setLevel(args.log_level * 10)
+
+    scan_vds(args.file, args.node, args.exclude_gaps, args.saturation,
+             args.processes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,5 @@
 """A class for generating virtual dataset frames from sub-frames."""
 
-import h5py as h5
 from .vdsgenerator import VDSGenerator, SourceMeta
 
 
@@ -8,10 +7,13 @@ class GapFillVDSGenerator(VDSGenerator):
 
     """A class to generate a Virtual Dataset with gaps added to the source."""
 
+    FINGERPRINT_ATTRIBUTES = VDSGenerator.FINGERPRINT_ATTRIBUTES + (
+        "sub_width", "sub_height", "grid_x", "grid_y")
+
     def __init__(self, path, prefix=None, files=None, output=None, source=None,
                  source_node=None, target_node=None, fill_value=None,
                  sub_width=256, sub_height=256, grid_x=8, grid_y=2,
-                 log_level=None):
+                 log_level=None, **kwargs):
         """
         Args:
             path(str): Root folder to find raw files and create VDS
@@ -30,6 +32,7 @@ class GapFillVDSGenerator(VDSGenerator):
             grid_y(int): Height of full sensor in sub-sections
             log_level(int): Logging level (off=3, info=2, debug=1) -
                 Default is info
+            kwargs: Other VDSGenerator arguments, e.g. nodes
 
         """
         self.sub_width = sub_width
@@ -39,7 +42,7 @@ class GapFillVDSGenerator(VDSGenerator):
 
         super(GapFillVDSGenerator, self).__init__(
             path, prefix, files, output, source, source_node, target_node,
-            fill_value, log_level)
+            fill_value, log_level, **kwargs)
 
         if len(self.files) > 1:
             raise ValueError("Can only insert gaps with a single dataset")
@@ -94,13 +97,12 @@ class GapFillVDSGenerator(VDSGenerator):
         self.logger.debug("VDS metadata:\n"
                           "  Shape: %s\n", target_shape)
 
-        v_layout = h5.VirtualLayout(target_shape, source_meta.dtype)
+        v_layout = self.new_virtual_layout(target_shape, source_meta.dtype)
 
         source_shape = source_meta.frames + \
             (source_meta.height, source_meta.width)
-        v_source = h5.VirtualSource(
-            self.source_file, name=self.source_node,
-            shape=source_shape, dtype=source_meta.dtype
+        v_source = self.new_virtual_source(
+            self.source_file, shape=source_shape, dtype=source_meta.dtype
         )
 
         map_frames = max(source_meta.frames[0] // 10, 1)
@@ -1,6 +1,5 @@
 """A class for generating virtual dataset frames from sub-frames."""
 
-import h5py as h5
 from .vdsgenerator import VDSGenerator, SourceMeta
 
 
@@ -8,10 +7,13 @@ class InterleaveVDSGenerator(VDSGenerator):
 
     """A class to generate Virtual Dataset frames from sub-frames."""
 
+    FINGERPRINT_ATTRIBUTES = VDSGenerator.FINGERPRINT_ATTRIBUTES + (
+        "block_size",)
+
     def __init__(self, path, prefix=None, files=None, output=None, source=None,
                  source_node=None, target_node=None, fill_value=None,
                  block_size=1,
-                 log_level=None):
+                 log_level=None, **kwargs):
         """
         Args:
             path(str): Root folder to find raw files and create VDS
@@ -27,13 +29,14 @@ class InterleaveVDSGenerator(VDSGenerator):
             block_size(int): Number of contiguous frames per block
             log_level(int): Logging level (off=3, info=2, debug=1) -
                 Default is info
+            kwargs: Other VDSGenerator arguments, e.g. nodes
 
         """
         self.block_size = block_size
 
         super(InterleaveVDSGenerator, self).__init__(
             path, prefix, files, output, source, source_node, target_node,
-            fill_value, log_level)
+            fill_value, log_level, **kwargs)
 
     def process_source_datasets(self):
         """Grab data from the given HDF5 files and check for consistency.
@@ -87,21 +90,22 @@ class InterleaveVDSGenerator(VDSGenerator):
             VirtualLayout: Object describing links between raw data and VDS
 
         """
+        import h5py as h5
+
         total_frames = sum(source_meta.frames)
         target_shape = (total_frames,) + \
                        (source_meta.height, source_meta.width)
         self.logger.debug("VDS metadata:\n"
                           "  Shape: %s\n", target_shape)
 
-        v_layout = h5.VirtualLayout(target_shape, source_meta.dtype)
+        v_layout = self.new_virtual_layout(target_shape, source_meta.dtype)
 
         total_files = len(self.files)
         for file_idx, file_path in enumerate(self.files):
             source_shape = (source_meta.frames[file_idx],) + \
                 (source_meta.height, source_meta.width)
-            v_source = h5.VirtualSource(
-                file_path,
-                name=self.source_node, shape=source_shape, dtype=source_meta.dtype
+            v_source = self.new_virtual_source(
+                file_path, shape=source_shape, dtype=source_meta.dtype
             )
             dataset_frames = v_source.shape[0]
 
@@ -0,0 +1,276 @@
+"""Read frames of a VDS in the order they are stored in the source files.
+
+Reading frames in VDS order makes the disks hop between the source files,
+e.g. between the files of interleaved stripes. An I/O schedule instead
+resolves the frames to reads of runs of consecutive source frames, grouped by
+file and sorted by their offset in it, so each file is read front to back.
+The frames are then put back in the order they were requested.
+
+Example:
+    data = read_vds_frames("/scratch/images/image.h5", [7, 2, 3, 0])
+
+"""
+
+import logging
+import itertools
+from collections import namedtuple
+
+import numpy as np
+
+from .flatten import flatten_plan
+from .layoutplan import regular_runs, frame_pieces, hyperslab
+from .vdsgenerator import VDSGenerator
+
+logger = logging.getLogger("VDSSchedule")
+
+# A read of a source hyperslab - the frames (first axis) of the data read
+# are put in the output at positions, with axes selecting the rest
+Read = namedtuple("Read", ["file_path", "node", "offset", "source", "shape",
+                           "frames", "positions", "axes"])
+
+
+def byte_offset(dataset, coordinate):
+    """Find the offset in its file of an element of a dataset.
+
+    Args:
+        dataset(h5py.Dataset): Dataset
+        coordinate(tuple(int)): Index of element
+
+    Returns:
+        int: Offset of element (or of its chunk, if chunked), or -1 if it is
+            not stored
+
+    """
+    if dataset.chunks is None:
+        offset = dataset.id.get_offset()
+        if offset is None:
+            return -1
+        return offset + int(np.ravel_multi_index(coordinate, dataset.shape)) \
+            * dataset.dtype.itemsize
+
+    info = dataset.id.get_chunk_info_by_coord(tuple(
+        index // chunk * chunk for index, chunk in zip(coordinate,
+                                                       dataset.chunks)))
+    return -1 if info.byte_offset is None else info.byte_offset
+
+
+def _axis_blocks(target, source):
+    # Contiguous (target, source) slices of an axis
+    return [(slice(run.target_start + idx * run.target_stride,
+                   run.target_start + idx * run.target_stride + run.block),
+             slice(run.source_start + idx * run.source_stride,
+                   run.source_start + idx * run.source_stride + run.block))
+            for run in regular_runs(target, source)
+            for idx in range(run.count)]
+
+
+def mapping_reads(mapping, dataset=None):
+    """Split a mapping of frames into reads of consecutive source frames.
+
+    Args:
+        mapping(Mapping): Mapping of a plan with one frame axis, from
+            LayoutPlan.take
+        dataset(h5py.Dataset): Source dataset, to find the offset of each
+            read - Default is to order reads by source frame
+
+    Returns:
+        list(Read): Reads of the mapping
+
+    """
+    positions, source_frames = mapping.frames
+    trailing = len(mapping.axes)
+    source_frame_shape = mapping.shape[:len(mapping.shape) - trailing]
+    axis_blocks = [_axis_blocks(*axis) for axis in mapping.axes]
+
+    unique_frames, inverse = np.unique(source_frames, return_inverse=True)
+    starts = np.concatenate(([0], np.flatnonzero(
+        np.diff(unique_frames) != 1) + 1, [len(unique_frames)]))
+
+    # Sort once by source frame, so each run and piece is a slice of order
+    order = np.argsort(inverse, kind="stable")
+    sorted_frames = inverse[order]
+    bounds = np.searchsorted(sorted_frames, starts)
+
+    reads = []
+    for start, stop, first, last in zip(starts[:-1], starts[1:], bounds[:-1],
+                                        bounds[1:]):
+        run_positions = positions[order[first:last]]
+        run_frames = sorted_frames[first:last] - start
+        length, source_start = int(stop - start), int(unique_frames[start])
+        if len(source_frame_shape) == 1:  # The run is a single hyperslab
+            pieces = [((slice(0, length),),
+                       (slice(source_start, source_start + length),))]
+        else:
+            pieces = frame_pieces(0, source_start, length, (length,),
+                                  source_frame_shape)
+        for target, source in pieces:
+            piece = target[0]
+            in_piece = slice(*np.searchsorted(run_frames,
+                                              (piece.start, piece.stop)))
+            for blocks in itertools.product(*axis_blocks):
+                source_ = source + tuple(source_ for _, source_ in blocks)
+                offset = byte_offset(dataset, tuple(
+                    axis.start for axis in source_)) \
+                    if dataset is not None else -1
+                reads.append(Read(
+                    mapping.file_path, mapping.node, offset, source_,
+                    (piece.stop - piece.start,) + tuple(
+                        axis.stop - axis.start for _, axis in blocks),
+                    run_frames[in_piece] - piece.start,
+                    run_positions[in_piece],
+                    tuple(target_ for target_, _ in blocks)))
+
+    return reads
+
+
+def merge_reads(reads):
+    """Merge reads of consecutive frames of the same part of a source.
+
+    Args:
+        reads(list(Read)): Reads sorted by file, node and source
+
+    Returns:
+        list(Read): Merged reads
+
+    """
+    merged = []
+    for read in reads:
+        last = merged[-1] if merged else None
+        if last is not None and \
+                (last.file_path, last.node, last.axes, last.source[1:]) == \
+                (read.file_path, read.node, read.axes, read.source[1:]) and \
+                len(read.source) - len(read.axes) == 1 and \
+                last.source[0].stop == read.source[0].start:
+            frames = last.shape[0]
+            merged[-1] = last._replace(
+                source=(slice(last.source[0].start, read.source[0].stop),) +
+                last.source[1:],
+                shape=(frames + read.shape[0],) + last.shape[1:],
+                frames=np.concatenate((last.frames, read.frames + frames)),
+                positions=np.concatenate((last.positions, read.positions)))
+        else:
+            merged.append(read)
+    return merged
+
+
+def schedule_reads(plan, frames):
+    """Plan the reads of a list of frames of a plan in source order.
+
+    Args:
+        plan(LayoutPlan): Mappings of the frames
+        frames(list(int)): Flat indexes of frames to read
+
+    Returns:
+        list(Read): Reads, grouped by source file and sorted by offset
+
+    """
+    import h5py as h5
+
+    taken = plan.take(frames)
+    mappings = {}
+    for mapping in taken.mappings:
+        mappings.setdefault(mapping.file_path, []).append(mapping)
+
+    reads = []
+    for file_path in sorted(mappings):
+        file_reads = []
+        try:
+            with h5.File(file_path, "r") as h5_file:
+                for mapping in mappings[file_path]:
+                    file_reads.extend(mapping_reads(mapping,
+                                                    h5_file[mapping.node]))
+        except (IOError, OSError, KeyError):
+            # As for a VDS, frames of missing sources are left as fill value
+            logger.warning("Cannot read %s - skipping it", file_path)
+            continue
+        file_reads.sort(key=lambda read: (read.node, read.offset,
+                                          [(axis.start, axis.stop)
+                                           for axis in read.source]))
+        reads.extend(merge_reads(file_reads))
+
+    return reads
+
+
+def schedule_vds_reads(file_path, frames, node=None):
+    """Plan the reads of a list of frames of a virtual dataset.
+
+    The mappings of any virtual datasets it maps from are resolved, so the
+    reads are of the raw files.
+
+    Args:
+        file_path(str): Path to VDS file
+        frames(list(int)): Flat indexes of frames to read
+        node(str): Virtual dataset - Default is data
+
+    Returns:
+        list(Read): Reads, grouped by source file and sorted by offset
+
+    """
+    plan, _ = flatten_plan(file_path, node or VDSGenerator.target_node)
+    return schedule_reads(plan, frames)
+
+
+def execute_reads(reads, output):
+    """Execute reads into an array of frames.
+
+    Each source file is opened once, and read in the order of reads.
+
+    Args:
+        reads(list(Read)): Reads from schedule_reads
+        output(numpy.ndarray): Array of the frames requested
+
+    """
+    import h5py as h5
+
+    for (file_path, node), file_reads in itertools.groupby(
+            reads, lambda read: (read.file_path, read.node)):
+        with h5.File(file_path, "r") as h5_file:
+            dataset_id = h5_file[node].id
+            for read in file_reads:
+                file_space = dataset_id.get_space()
+                file_space.select_hyperslab(*hyperslab(read.source))
+                data = np.empty(read.shape, dtype=output.dtype)
+                dataset_id.read(h5.h5s.create_simple(read.shape),
+                                file_space, data)
+                output[(read.positions,) + read.axes] = data[read.frames]
+
+
+def read_frames(plan, frames, fill_value=0):
+    """Read a list of frames of a plan in source order.
+
+    Args:
+        plan(LayoutPlan): Mappings of the frames
+        frames(list(int)): Flat indexes of frames to read
+        fill_value: Value of elements that are not mapped
+
+    Returns:
+        numpy.ndarray: Frames, in the order given
+
+    """
+    output = np.full((len(frames),) + plan.shape[plan.frame_axes:],
+                     fill_value, dtype=plan.dtype)
+    execute_reads(schedule_reads(plan, frames), output)
+    return output
+
+
+def read_vds_frames(file_path, frames, node=None):
+    """Read a list of frames of a virtual dataset in source order.
+
+    Args:
+        file_path(str): Path to VDS file
+        frames(list(int)): Flat indexes of frames to read
+        node(str): Virtual dataset - Default is data
+
+    Returns:
+        numpy.ndarray: Frames, in the order given, with the fill value of the
+            dataset where nothing is mapped
+
+    """
+    import h5py as h5
+
+    node = node or VDSGenerator.target_node
+    with h5.File(file_path, "r") as h5_file:
+        fill_value = h5_file[node].fillvalue
+
+    plan, _ = flatten_plan(file_path, node)
+    return read_frames(plan, frames, fill_value)
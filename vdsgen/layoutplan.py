@@ -0,0 +1,920 @@
+"""An in-memory description of the mappings of a virtual dataset.
+
+A LayoutPlan is indexed like an h5py VirtualLayout, so generators create one
+in place of a VirtualLayout to record their mappings without touching h5py.
+Plans can then be composed, so that a VDS built on other (not yet written)
+virtual datasets maps straight to the raw files, and written as a virtual
+dataset.
+
+Each mapping is stored per axis, as pairs of arrays of the indexes of the
+target and source elements that correspond:
+  frames - the flattened index over the frame axes of each dataset, which
+           may have different ranks (e.g. when reshaping)
+  axes   - each remaining axis of the frames (height and width), which
+           correspond one to one
+The elements mapped are the product of these, so every axis can be composed
+and split independently. These arrays grow with the elements mapped, so
+layouts that are just written, with no view or composition, are instead
+made as a StreamingLayout, which passes each mapping straight to HDF5.
+
+"""
+
+import os
+import math
+import numbers
+import itertools
+from collections import namedtuple
+
+import numpy as np
+
+# A mapping from a source dataset - frames and axes are (target, source)
+# pairs of index arrays
+Mapping = namedtuple("Mapping", ["file_path", "node", "shape", "dtype",
+                                 "frames", "axes"])
+
+# Placeholder source of a view of a plan, composed with the plan itself
+_VIEW_SOURCE = "<view>"
+
+# A regular pattern of blocks mapped between a target and source axis
+Run = namedtuple("Run", ["target_start", "target_stride", "source_start",
+                         "source_stride", "count", "block"])
+
+
+def _expand_key(key, shape):
+    # Selection with one entry for each axis of shape
+    if not isinstance(key, tuple):
+        key = (key,)
+    for idx, axis in enumerate(key):
+        if axis is Ellipsis:
+            key = key[:idx] + (slice(None),) * (len(shape) - len(key) + 1) + \
+                key[idx + 1:]
+            break
+    key = key + (slice(None),) * (len(shape) - len(key))
+    if len(key) != len(shape):
+        raise ValueError("Selection {} has too many axes for shape "
+                         "{}".format(key, shape))
+    return key
+
+
+def _axis_index(index, length):
+    # Non-negative index of an int selection of an axis
+    if not -length <= index < length:
+        raise ValueError("Index {} out of range for axis of length "
+                         "{}".format(index, length))
+    return index + length if index < 0 else index
+
+
+def axis_indices(key, shape):
+    """Find the indexes selected on each axis by a selection.
+
+    Args:
+        key: Selection - ints, slices, MultiBlockSlices and Ellipsis
+        shape(tuple(int)): Shape of dataset selected from
+
+    Returns:
+        list(numpy.ndarray): Indexes selected on each axis
+
+    """
+    indices = []
+    for axis, length in zip(_expand_key(key, shape), shape):
+        if isinstance(axis, (numbers.Integral, np.integer)):
+            indices.append(np.array([_axis_index(axis, length)]))
+        elif isinstance(axis, slice):
+            if axis.step is not None and axis.step < 1:
+                raise ValueError("Selections must have a positive step")
+            indices.append(np.arange(length)[axis])
+        elif hasattr(axis, "block"):  # MultiBlockSlice
+            count = axis.count
+            if count is None:
+                count = (length - axis.start - axis.block) // axis.stride + 1
+            blocks = axis.start + np.arange(count) * axis.stride
+            indices.append(
+                (blocks[:, np.newaxis] + np.arange(axis.block)).ravel())
+        else:
+            raise TypeError("Unsupported selection {}".format(axis))
+
+    return indices
+
+
+def flat_indices(indices, shape):
+    """Flatten the product of per-axis indexes, in row-major order.
+
+    Args:
+        indices(list(numpy.ndarray)): Indexes selected on each axis
+        shape(tuple(int)): Shape of axes
+
+    Returns:
+        numpy.ndarray: Flat index of each element selected
+
+    """
+    flat = np.zeros(1, dtype=np.int64)
+    for axis_indices_, length in zip(indices, shape):
+        flat = (flat[:, np.newaxis] * length + axis_indices_).ravel()
+    return flat
+
+
+def compose_axis(outer, inner):
+    """Compose the mapping of an axis of a VDS with that of its source.
+
+    Args:
+        outer(tuple(numpy.ndarray)): Target and source indexes of the VDS
+        inner(tuple(numpy.ndarray)): Target and source indexes of the
+            source, whose targets are the sources of outer
+
+    Returns:
+        tuple(numpy.ndarray): Target indexes of outer and source indexes of
+            inner, for the elements mapped by both
+
+    """
+    outer_target, outer_source = outer
+    inner_target, inner_source = inner
+    if len(inner_target) == 0:  # Inner maps nothing on this axis
+        return (outer_target[:0], inner_source[:0])
+
+    order = np.argsort(inner_target, kind="stable")
+    sorted_target = inner_target[order]
+    positions = np.searchsorted(sorted_target, outer_source)
+    positions = np.minimum(positions, len(sorted_target) - 1)
+    matched = sorted_target[positions] == outer_source
+
+    return (outer_target[matched], inner_source[order[positions[matched]]])
+
+
+def regular_runs(target, source):
+    """Split corresponding indexes into regular patterns of blocks.
+
+    Each run is a block of contiguous target and source indexes, repeated
+    count times at a constant stride, as a MultiBlockSlice selects.
+
+    Args:
+        target(numpy.ndarray): Target indexes
+        source(numpy.ndarray): Corresponding source indexes
+
+    Returns:
+        list(Run): Runs covering all indexes, in target order
+
+    """
+    if len(target) == 0:
+        return []
+
+    order = np.argsort(target, kind="stable")
+    target, source = target[order], source[order]
+
+    contiguous = (np.diff(target) == 1) & (np.diff(source) == 1)
+    starts = np.concatenate([[0], np.nonzero(~contiguous)[0] + 1])
+    lengths = np.diff(np.concatenate([starts, [len(target)]])).tolist()
+    block_targets = target[starts].tolist()
+    block_sources = source[starts].tolist()
+
+    runs = []
+    idx = 0
+    while idx < len(starts):
+        block = lengths[idx]
+        count = 1
+        if idx + 1 < len(starts) and lengths[idx + 1] == block:
+            target_stride = block_targets[idx + 1] - block_targets[idx]
+            source_stride = block_sources[idx + 1] - block_sources[idx]
+            if target_stride >= block and source_stride >= block:
+                while idx + count < len(starts) and \
+                        lengths[idx + count] == block and \
+                        block_targets[idx + count] - \
+                        block_targets[idx + count - 1] == target_stride and \
+                        block_sources[idx + count] - \
+                        block_sources[idx + count - 1] == source_stride:
+                    count += 1
+        if count == 1:
+            target_stride = source_stride = block
+
+        runs.append(Run(block_targets[idx], target_stride, block_sources[idx],
+                        source_stride, count, block))
+        idx += count
+
+    return runs
+
+
+def run_selection(start, stride, count, block):
+    """Create the selection of a run on one axis.
+
+    Returns:
+        slice or MultiBlockSlice: Selection
+
+    """
+    if count == 1:
+        return slice(start, start + block)
+
+    import h5py as h5
+    return h5.MultiBlockSlice(start, stride, count, block)
+
+
+def hyperslab(selection):
+    """Convert a selection from run_selection to hyperslab parameters.
+
+    Args:
+        selection(tuple): slice or MultiBlockSlice on each axis
+
+    Returns:
+        tuple(tuple(int)): Start, count, stride and block on each axis
+
+    """
+    parameters = []
+    for axis in selection:
+        if isinstance(axis, slice):
+            parameters.append((axis.start, 1, 1, axis.stop - axis.start))
+        else:
+            parameters.append((axis.start, axis.count, axis.stride,
+                               axis.block))
+    return tuple(tuple(int(value) for value in parameter)
+                 for parameter in zip(*parameters))
+
+
+def selection_hyperslab(key, shape):
+    """Convert a selection straight to hyperslab parameters.
+
+    Unlike axis_indices, no indexes are expanded, so the cost does not
+    depend on the number of elements selected.
+
+    Args:
+        key: Selection - ints, slices, MultiBlockSlices and Ellipsis
+        shape(tuple(int)): Shape of dataset selected from
+
+    Returns:
+        tuple(tuple(int)): Start, count, stride and block on each axis
+
+    """
+    parameters = []
+    for axis, length in zip(_expand_key(key, shape), shape):
+        if isinstance(axis, (numbers.Integral, np.integer)):
+            parameters.append((_axis_index(axis, length), 1, 1, 1))
+        elif isinstance(axis, slice):
+            if axis.step is not None and axis.step < 1:
+                raise ValueError("Selections must have a positive step")
+            start, stop, step = axis.indices(length)
+            count = len(range(start, stop, step))
+            if step == 1:
+                parameters.append((start, 1, 1, count))
+            else:
+                parameters.append((start, count, step, 1))
+        elif hasattr(axis, "block"):  # MultiBlockSlice
+            start, stride, count, block = axis.indices(length)
+            parameters.append((start, count, stride, block))
+        else:
+            raise TypeError("Unsupported selection {}".format(axis))
+
+    return tuple(tuple(int(value) for value in parameter)
+                 for parameter in zip(*parameters))
+
+
+def _selected_count(parameters):
+    # Number of elements selected by hyperslab parameters
+    _, count, _, block = parameters
+    return int(np.prod([count_ * block_
+                        for count_, block_ in zip(count, block)]))
+
+
+def space_selection(space):
+    """Convert the selection of an HDF5 dataspace to a selection key.
+
+    Args:
+        space(h5py.h5s.SpaceID): Dataspace with a selection
+
+    Returns:
+        Selection of the space, or None if nothing is selected
+
+    """
+    import h5py as h5
+
+    selection_type = space.get_select_type()
+    if selection_type == h5.h5s.SEL_ALL:
+        return Ellipsis
+    elif selection_type == h5.h5s.SEL_NONE:
+        return None
+    elif selection_type == h5.h5s.SEL_HYPERSLABS and \
+            space.is_regular_hyperslab():
+        selection = []
+        for start, stride, count, block in zip(
+                *space.get_regular_hyperslab()):
+            if h5.h5s.UNLIMITED in (count, block):
+                raise ValueError("Unlimited selections are not supported")
+            selection.append(run_selection(start, stride, count, block))
+        return tuple(selection)
+    else:
+        raise ValueError("Only regular hyperslab selections are supported")
+
+
+def _dataset_shape(file_path, node):
+    import h5py as h5
+
+    try:
+        with h5.File(file_path, "r") as h5_file:
+            return h5_file[node].shape
+    except (IOError, OSError, KeyError):
+        raise IOError("Cannot read shape of {} in {}".format(node, file_path))
+
+
+def _hyperslab_lengths(start, shape):
+    # (inner, limit) pairs such that the flat range [start, start + j * inner)
+    # of shape is a hyperslab for 1 <= j <= limit
+    if not shape:
+        return [(1, 1)]
+
+    lengths = []
+    inner = 1
+    for length in reversed(shape):
+        if start % inner != 0:
+            break
+        lengths.append((inner, length - (start // inner) % length))
+        inner *= length
+    return lengths
+
+
+def _hyperslab(start, length, shape):
+    # The selection of the flat range [start, start + length) of shape
+    if not shape:
+        return ()
+
+    inner = 1
+    for axis in reversed(range(len(shape))):
+        if start % inner == 0 and length % inner == 0:
+            coordinate = (start // inner) % shape[axis]
+            if coordinate + length // inner <= shape[axis]:
+                axis_, inner_ = axis, inner
+        inner *= shape[axis]
+
+    coordinates = np.unravel_index(start, shape)
+    return tuple(slice(coordinates[idx], coordinates[idx] + 1)
+                 for idx in range(axis_)) + \
+        (slice(coordinates[axis_], coordinates[axis_] + length // inner_),) + \
+        tuple(slice(0, shape[idx]) for idx in range(axis_ + 1, len(shape)))
+
+
+def frame_pieces(target_start, source_start, length, target_shape,
+                 source_shape):
+    """Split a contiguous range of flat frame indexes into hyperslabs.
+
+    Args:
+        target_start(int): First flat target frame index
+        source_start(int): First flat source frame index
+        length(int): Number of frames
+        target_shape(tuple(int)): Frame axes of target
+        source_shape(tuple(int)): Frame axes of source
+
+    Returns:
+        list(tuple): Target and source selections of each piece
+
+    """
+    pieces = []
+    while length > 0:
+        piece = 0
+        for target_inner, target_limit in _hyperslab_lengths(target_start,
+                                                             target_shape):
+            for source_inner, source_limit in _hyperslab_lengths(
+                    source_start, source_shape):
+                step = target_inner * source_inner // \
+                    math.gcd(target_inner, source_inner)
+                piece = max(piece, min(length, target_inner * target_limit,
+                                       source_inner * source_limit) //
+                            step * step)
+
+        pieces.append((_hyperslab(target_start, piece, target_shape),
+                       _hyperslab(source_start, piece, source_shape)))
+        target_start += piece
+        source_start += piece
+        length -= piece
+
+    return pieces
+
+
+def shard_ranges(plans, max_mappings=None, max_frames=None):
+    """Split the first axis of plans into ranges within a budget.
+
+    The hyperslab mappings of the plans are generated once, and each counts
+    towards every range of frames it overlaps - three times if it is a
+    regular pattern of blocks, which a range may cut into a partial block at
+    each end and the pattern between. The ranges are then found with
+    cumulative sums of these counts over the first axis, rather than by
+    viewing the plans for each range tried.
+
+    Args:
+        plans(list(LayoutPlan)): Plans with the same length of first axis
+        max_mappings(int): Maximum total hyperslab mappings of the plans in
+            each range - a single frame over budget gets a range of its own
+        max_frames(int): Maximum length of each range
+
+    Returns:
+        list(tuple(int, int)): Start and stop of each range
+
+    """
+    length = plans[0].shape[0]
+    max_frames = min(max_frames or length, length)
+
+    if max_mappings is not None:
+        # Count of mappings starting before / ending by each frame
+        starts = np.zeros(length + 1, dtype=np.int64)
+        ends = np.zeros(length + 1, dtype=np.int64)
+        for plan in plans:
+            for mapping in plan.mappings:
+                for target, _ in plan.iter_selections(mapping):
+                    axis = target[0]
+                    if isinstance(axis, slice):
+                        first, stop, count = axis.start, axis.stop, 1
+                    else:
+                        first = axis.start
+                        stop = first + axis.stride * (axis.count - 1) + \
+                            axis.block
+                        count = 3 if axis.block > 1 else 1
+                    starts[first + 1] += count
+                    ends[stop] += count
+        starts = np.cumsum(starts)
+        ends = np.cumsum(ends)
+
+    ranges = []
+    start = 0
+    while start < length:
+        stop = min(start + max_frames, length)
+        if max_mappings is not None:
+            # Longest range within budget, from one frame up
+            within = int(np.searchsorted(starts, ends[start] + max_mappings,
+                                         side="right")) - 1
+            stop = max(start + 1, min(stop, within))
+        ranges.append((start, stop))
+        start = stop
+
+    return ranges
+
+
+def _virtual_property_list():
+    import h5py as h5
+
+    dcpl = h5.h5p.create(h5.h5p.DATASET_CREATE)
+    dcpl.set_layout(h5.h5d.VIRTUAL)
+    return dcpl
+
+
+def _create_virtual_dataset(group, name, shape, dtype, dcpl, fill_value):
+    import h5py as h5
+
+    if "/" in name.strip("/"):
+        parent, name = name.rstrip("/").rsplit("/", 1)
+        group = group.require_group(parent)
+
+    if fill_value is not None:
+        dcpl.set_fill_value(np.array([fill_value]))
+    dataset_id = h5.h5d.create(
+        group.id, name=name.encode("utf-8"),
+        tid=h5.h5t.py_create(np.dtype(dtype), logical=1),
+        space=h5.h5s.create_simple(shape), dcpl=dcpl)
+    return h5.Dataset(dataset_id)
+
+
+class PlanSource(object):
+
+    """A source dataset of a LayoutPlan, indexed like a VirtualSource."""
+
+    def __init__(self, file_path, name, shape, dtype, key=Ellipsis):
+        """
+        Args:
+            file_path(str): Path to source HDF5 file
+            name(str): Dataset in file
+            shape(tuple(int)): Shape of dataset
+            dtype: Data type of dataset
+            key: Selection of dataset
+
+        """
+        self.file_path = file_path
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.key = key
+
+    def __getitem__(self, key):
+        if self.key is not Ellipsis:
+            raise ValueError("Cannot select from a selection of a source")
+        return PlanSource(self.file_path, self.name, self.shape, self.dtype,
+                          key)
+
+
+class LayoutPlan(object):
+
+    """The mappings of a virtual dataset, indexed like a VirtualLayout."""
+
+    def __init__(self, shape, dtype, frame_axes=None):
+        """
+        Args:
+            shape(tuple(int)): Shape of virtual dataset
+            dtype: Data type of virtual dataset
+            frame_axes(int): Number of leading axes that index frames -
+                Default is all but the last two
+
+        """
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        if frame_axes is None:
+            frame_axes = max(len(self.shape) - 2, 0)
+        self.frame_axes = frame_axes
+        self.mappings = []
+
+    @classmethod
+    def from_dataset(cls, dataset):
+        """Read the mappings of an existing virtual dataset.
+
+        Sources are given absolute paths, resolving relative paths against
+        the directory of the file containing dataset. HDF5 does not store the
+        shape of sources mapped in full, so those sources are opened to read
+        it.
+
+        Args:
+            dataset(h5py.Dataset): Virtual dataset
+
+        Returns:
+            LayoutPlan: Plan with the mappings of dataset
+
+        """
+        return cls.from_property_list(
+            dataset.id.get_create_plist(), dataset.shape, dataset.dtype,
+            os.path.abspath(dataset.file.filename))
+
+    @classmethod
+    def from_property_list(cls, dcpl, shape, dtype, file_path):
+        """Read the mappings of a virtual dataset creation property list.
+
+        Args:
+            dcpl(h5py.h5p.PropDCID): Property list with virtual mappings
+            shape(tuple(int)): Shape of virtual dataset
+            dtype: Data type of virtual dataset
+            file_path(str): Path of the file containing the dataset, to
+                resolve relative source paths against
+
+        Returns:
+            LayoutPlan: Plan with the mappings of dcpl
+
+        """
+        plan = cls(shape, dtype)
+        for idx in range(dcpl.get_virtual_count()):
+            source_space = dcpl.get_virtual_srcspace(idx)
+            target = space_selection(dcpl.get_virtual_vspace(idx))
+            source = space_selection(source_space)
+            if target is None or source is None:
+                continue  # Selects nothing
+
+            source_node = dcpl.get_virtual_dsetname(idx)
+            source_path = dcpl.get_virtual_filename(idx)
+            if source_path == ".":
+                source_path = file_path
+            else:
+                source_path = os.path.join(os.path.dirname(file_path),
+                                           source_path)
+
+            source_path = os.path.abspath(source_path)
+            source_shape = source_space.shape
+            if not source_shape:
+                source_shape = _dataset_shape(source_path, source_node)
+
+            plan[target] = PlanSource(source_path, source_node,
+                                      source_shape, dtype)[source]
+
+        return plan
+
+    @property
+    def frame_shape(self):
+        """tuple(int): Shape of the frame axes."""
+        return self.shape[:self.frame_axes]
+
+    def __setitem__(self, key, source):
+        target_indices = axis_indices(key, self.shape)
+        source_indices = axis_indices(source.key, source.shape)
+
+        trailing = len(self.shape) - self.frame_axes
+        source_frame_axes = len(source.shape) - trailing
+        if source_frame_axes < 0:
+            raise ValueError("Source shape {} has fewer axes than the frames "
+                             "of {}".format(source.shape, self.shape))
+
+        frames = (flat_indices(target_indices[:self.frame_axes],
+                               self.frame_shape),
+                  flat_indices(source_indices[:source_frame_axes],
+                               source.shape[:source_frame_axes]))
+        axes = tuple(zip(target_indices[self.frame_axes:],
+                         source_indices[source_frame_axes:]))
+        for target_, source_ in (frames,) + axes:
+            if len(target_) != len(source_):
+                raise ValueError("Target selection {} does not match source "
+                                 "selection {}".format(key, source.key))
+
+        self.mappings.append(Mapping(source.file_path, source.name,
+                                     source.shape, source.dtype,
+                                     frames, axes))
+
+    def compose(self, plans):
+        """Replace mappings from virtual datasets with their own mappings.
+
+        Args:
+            plans(dict): (Absolute file path, node) -> LayoutPlan of each
+                virtual dataset that mappings may be from
+
+        Returns:
+            LayoutPlan: New plan mapping only from the sources of plans, and
+                any other sources of this plan
+
+        """
+        composed = LayoutPlan(self.shape, self.dtype, self.frame_axes)
+        for mapping in self.mappings:
+            plan = plans.get((os.path.abspath(mapping.file_path),
+                              mapping.node))
+            if plan is None:
+                composed.mappings.append(mapping)
+                continue
+            if plan.shape != mapping.shape:
+                raise ValueError("Mapping from {} expects shape {}, but it "
+                                 "has shape {}".format(mapping.file_path,
+                                                       mapping.shape,
+                                                       plan.shape))
+
+            for inner in plan.mappings:
+                frames = compose_axis(mapping.frames, inner.frames)
+                axes = tuple(compose_axis(outer_axis, inner_axis)
+                             for outer_axis, inner_axis in
+                             zip(mapping.axes, inner.axes))
+                if any(len(target) == 0 for target, _ in (frames,) + axes):
+                    continue
+
+                composed.mappings.append(Mapping(
+                    inner.file_path, inner.node, inner.shape, inner.dtype,
+                    frames, axes))
+
+        return composed
+
+    def view(self, key):
+        """Create a plan of a selection of this plan.
+
+        Args:
+            key: Selection of slices and MultiBlockSlices, as for a
+                VirtualLayout - each axis is kept
+
+        Returns:
+            LayoutPlan: Plan of just the elements selected, mapping only from
+                the parts of the sources they are mapped from
+
+        """
+        shape = tuple(len(indices)
+                      for indices in axis_indices(key, self.shape))
+        view = LayoutPlan(shape, self.dtype, self.frame_axes)
+        view[...] = PlanSource(_VIEW_SOURCE, None, self.shape,
+                               self.dtype)[key]
+        return view.compose({(os.path.abspath(_VIEW_SOURCE), None): self})
+
+    def take(self, frames):
+        """Create a plan of a list of frames of this plan.
+
+        Args:
+            frames(list(int)): Flat indexes of frames, in any order and with
+                repeats
+
+        Returns:
+            LayoutPlan: Plan with one frame axis of the frames given, mapping
+                only from the parts of the sources they are mapped from
+
+        """
+        frames = np.asarray(frames, dtype=np.int64).ravel()
+        frame_count = int(np.prod(self.frame_shape))
+        if len(frames) and (frames.min() < 0 or frames.max() >= frame_count):
+            raise ValueError("Frames must be from 0 to {}".format(
+                frame_count - 1))
+
+        axes_shape = self.shape[self.frame_axes:]
+        taken = LayoutPlan((len(frames),) + axes_shape, self.dtype, 1)
+        taken.mappings.append(Mapping(
+            _VIEW_SOURCE, None, self.shape, self.dtype,
+            (np.arange(len(frames)), frames),
+            tuple((np.arange(length), np.arange(length))
+                  for length in axes_shape)))
+        return taken.compose({(os.path.abspath(_VIEW_SOURCE), None): self})
+
+    def selection_count(self):
+        """Count the hyperslab mappings to_virtual_layout will create.
+
+        Returns:
+            int: Number of mappings in the VirtualLayout of this plan
+
+        """
+        return sum(1 for mapping in self.mappings
+                   for _ in self.iter_selections(mapping))
+
+    def selections(self, mapping):
+        """Split a mapping into hyperslab selections of target and source.
+
+        Args:
+            mapping(Mapping): Mapping of this plan
+
+        Returns:
+            list(tuple): Target and source selection pairs
+
+        """
+        return list(self.iter_selections(mapping))
+
+    def iter_selections(self, mapping):
+        """Generate the hyperslab selections of a mapping one at a time.
+
+        Args:
+            mapping(Mapping): Mapping of this plan
+
+        Yields:
+            tuple: Target and source selection pair
+
+        """
+        axis_selections = [
+            [(run_selection(run.target_start, run.target_stride,
+                            run.count, run.block),
+              run_selection(run.source_start, run.source_stride,
+                            run.count, run.block))
+             for run in regular_runs(*axis)]
+            for axis in mapping.axes]
+
+        for target, source in self._frame_selections(mapping):
+            for axes in itertools.product(*axis_selections):
+                yield (target + tuple(target_ for target_, _ in axes),
+                       source + tuple(source_ for _, source_ in axes))
+
+    def _frame_selections(self, mapping):
+        trailing = len(self.shape) - self.frame_axes
+        source_frame_shape = mapping.shape[:len(mapping.shape) - trailing]
+
+        for run in regular_runs(*mapping.frames):
+            if len(self.frame_shape) == 1 and len(source_frame_shape) == 1:
+                yield ((run_selection(run.target_start, run.target_stride,
+                                      run.count, run.block),),
+                       (run_selection(run.source_start, run.source_stride,
+                                      run.count, run.block),))
+                continue
+            for idx in range(run.count):
+                for piece in frame_pieces(
+                        run.target_start + idx * run.target_stride,
+                        run.source_start + idx * run.source_stride,
+                        run.block, self.frame_shape, source_frame_shape):
+                    yield piece
+
+    def create_virtual_dataset(self, group, name, fill_value=None,
+                               relative_paths=False):
+        """Create a virtual dataset with the mappings of this plan.
+
+        Rather than building a VirtualLayout, which keeps a VirtualSource and
+        selection for every hyperslab until the dataset is created, each
+        hyperslab is set straight into the dataset creation property list
+        with the low level API as it is generated, reusing one dataspace for
+        the target and one for each source shape. The index arrays of the
+        plan itself are still all held until then.
+
+        Args:
+            group(h5py.Group): Group to create the dataset in
+            name(str): Name of dataset, relative to group
+            fill_value: Value of elements that are not mapped
+            relative_paths(bool): Store source paths relative to the file
+                containing group
+
+        Returns:
+            h5py.Dataset: Virtual dataset
+
+        """
+        import h5py as h5
+
+        dcpl = _virtual_property_list()
+        target_space = h5.h5s.create_simple(self.shape)
+        source_spaces = {}
+        file_path = os.path.abspath(group.file.filename)
+        directory = os.path.dirname(file_path)
+        for mapping in self.mappings:
+            if mapping.shape not in source_spaces:
+                source_spaces[mapping.shape] = h5.h5s.create_simple(
+                    mapping.shape)
+            source_space = source_spaces[mapping.shape]
+            if mapping.file_path == file_path:
+                source_file = b"."
+            elif relative_paths:
+                source_file = os.fsencode(
+                    os.path.relpath(mapping.file_path, directory))
+            else:
+                source_file = os.fsencode(mapping.file_path)
+            source_node = mapping.node.encode("utf-8")
+
+            for target, source in self.iter_selections(mapping):
+                target_space.select_hyperslab(*hyperslab(target))
+                source_space.select_hyperslab(*hyperslab(source))
+                dcpl.set_virtual(target_space, source_file, source_node,
+                                 source_space)
+
+        return _create_virtual_dataset(group, name, self.shape, self.dtype,
+                                       dcpl, fill_value)
+
+    def to_virtual_layout(self):
+        """Create a VirtualLayout with the mappings of this plan.
+
+        Returns:
+            VirtualLayout: Layout to create a virtual dataset with
+
+        """
+        import h5py as h5
+
+        v_layout = h5.VirtualLayout(self.shape, self.dtype)
+
+        v_sources = {}
+        for mapping in self.mappings:
+            source_key = (mapping.file_path, mapping.node, mapping.shape,
+                          str(mapping.dtype))
+            if source_key not in v_sources:
+                v_sources[source_key] = h5.VirtualSource(
+                    mapping.file_path, name=mapping.node,
+                    shape=mapping.shape, dtype=mapping.dtype)
+            v_source = v_sources[source_key]
+
+            for target, source in self.iter_selections(mapping):
+                v_layout[target] = v_source[source]
+
+        return v_layout
+
+
+class StreamingLayout(object):
+
+    """A VirtualLayout that sets each mapping as soon as it is made.
+
+    Generators index it like a VirtualLayout, with PlanSources. Each
+    selection is converted straight to hyperslab parameters and set into a
+    virtual dataset creation property list, reusing one dataspace for the
+    target and one for each source shape. Nothing is kept per mapping in
+    Python, and nothing per element, so memory is bounded however many
+    mappings and frames there are. Generators whose mappings are regular
+    make only a few MultiBlockSlice mappings, whatever the number of frames.
+
+    """
+
+    def __init__(self, shape, dtype):
+        """
+        Args:
+            shape(tuple(int)): Shape of virtual dataset
+            dtype: Data type of virtual dataset
+
+        """
+        import h5py as h5
+
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.dcpl = _virtual_property_list()
+        self._target_space = h5.h5s.create_simple(self.shape)
+        self._source_spaces = {}
+
+    def __setitem__(self, key, source):
+        import h5py as h5
+
+        target = selection_hyperslab(key, self.shape)
+        selection = selection_hyperslab(source.key, source.shape)
+        if _selected_count(target) != _selected_count(selection):
+            raise ValueError("Target selection {} does not match source "
+                             "selection {}".format(key, source.key))
+        if _selected_count(target) == 0:
+            return  # Maps nothing
+
+        if source.shape not in self._source_spaces:
+            self._source_spaces[source.shape] = h5.h5s.create_simple(
+                source.shape)
+        source_space = self._source_spaces[source.shape]
+
+        self._target_space.select_hyperslab(*target)
+        source_space.select_hyperslab(*selection)
+        self.dcpl.set_virtual(self._target_space,
+                              os.fsencode(source.file_path),
+                              source.name.encode("utf-8"), source_space)
+
+    @property
+    def mapping_count(self):
+        """int: Number of mappings set."""
+        return self.dcpl.get_virtual_count()
+
+    def create_virtual_dataset(self, group, name, fill_value=None,
+                               relative_paths=False):
+        """Create a virtual dataset with the mappings set.
+
+        Args:
+            group(h5py.Group): Group to create the dataset in
+            name(str): Name of dataset, relative to group
+            fill_value: Value of elements that are not mapped
+            relative_paths(bool): Unused - source paths are set as given,
+                when they are mapped
+
+        Returns:
+            h5py.Dataset: Virtual dataset
+
+        """
+        return _create_virtual_dataset(group, name, self.shape, self.dtype,
+                                       self.dcpl, fill_value)
+
+    def to_plan(self, file_path):
+        """Create a LayoutPlan of the mappings set.
+
+        Args:
+            file_path(str): Path of the VDS file, to resolve relative source
+                paths against
+
+        Returns:
+            LayoutPlan: Plan with the mappings of this layout
+
+        """
+        return LayoutPlan.from_property_list(
+            self.dcpl, self.shape, self.dtype, os.path.abspath(file_path))
@@ -0,0 +1,353 @@
+"""Copy a VDS to a real dataset, resuming from a checkpoint after a failure.
+
+The copy is made in batches of whole output chunks along the first axis.
+After each batch is written and flushed, its range is recorded in a
+checkpoint file next to the output, replaced atomically so it is never left
+half written. If the copy stops, running it again continues from the ranges
+recorded - after reading back the last batch recorded and comparing it with
+the VDS, in case it was not fully written to disk. The checkpoint is removed
+when the copy is complete.
+
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import numpy as np
+
+from .flatten import flatten_plan
+from .framestats import gap_mask, frame_statistics, create_statistics, \
+    write_statistics, statistic_nodes
+from .vdsgenerator import VDSGenerator
+
+logger = logging.getLogger("VDSMaterialise")
+
+BATCH_BYTES = 64 * 1024 ** 2  # Size of slabs copied in one call
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Copy a VDS to a real dataset, resuming an interrupted "
+                    "copy from its checkpoint.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "input", type=str, help="VDS file to copy.")
+    parser.add_argument(
+        "-o", "--output", type=str, dest="output", required=True,
+        help="File to create dataset in.")
+    parser.add_argument(
+        "-n", "--node", type=str, dest="node",
+        default=VDSGenerator.target_node, help="Virtual dataset to copy.")
+    parser.add_argument(
+        "--target-node", type=str, dest="target_node", default=None,
+        help="Node to create in output file. Default is --node.")
+    parser.add_argument(
+        "--chunks", type=int, nargs="+", dest="chunks", default=None,
+        help="Chunk shape of dataset. Default is one frame per chunk.")
+    parser.add_argument(
+        "--compression", type=str, dest="compression", default=None,
+        help="Compression filter of dataset, e.g. gzip or lzf.")
+    parser.add_argument(
+        "--statistics", action="store_true", dest="statistics",
+        help="Store the sum, maximum and saturated pixel count of each "
+             "frame next to the dataset.")
+    parser.add_argument(
+        "--exclude-gaps", action="store_true", dest="exclude_gaps",
+        help="Exclude pixels that no source maps from the statistics.")
+    parser.add_argument(
+        "--saturation", type=float, dest="saturation", default=None,
+        help="Value at or above which a pixel is saturated. Default is the "
+             "maximum of the data type.")
+    parser.add_argument(
+        "--restart", action="store_true", dest="restart",
+        help="Ignore any checkpoint and copy from the start.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def checkpoint_path(output_file):
+    """Get the path of the checkpoint of a copy to output_file.
+
+    Args:
+        output_file(str): Path to output file
+
+    Returns:
+        str: Path to checkpoint file
+
+    """
+    return output_file + CHECKPOINT_SUFFIX
+
+
+def read_checkpoint(output_file):
+    """Read the checkpoint of a copy.
+
+    Args:
+        output_file(str): Path to output file
+
+    Returns:
+        dict: Checkpoint, or None if there is no checkpoint
+
+    """
+    try:
+        with open(checkpoint_path(output_file)) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except (IOError, OSError):
+        return None
+
+
+def write_checkpoint(output_file, checkpoint):
+    """Replace the checkpoint of a copy.
+
+    The checkpoint is written to a temporary file that is then renamed, so it
+    is replaced whole or not at all.
+
+    Args:
+        output_file(str): Path to output file
+        checkpoint(dict): Checkpoint
+
+    """
+    path = checkpoint_path(output_file)
+    temporary = path + ".tmp"
+    with open(temporary, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary, path)
+
+
+def add_range(ranges, start, stop):
+    """Add a range to a list of ranges, merging ranges that touch.
+
+    Args:
+        ranges(list(list(int))): Sorted start and stop of each range
+        start(int): Start of range to add
+        stop(int): Stop of range to add
+
+    Returns:
+        list(list(int)): Sorted, merged ranges
+
+    """
+    merged = []
+    for range_start, range_stop in sorted(ranges + [[start, stop]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_stop)
+        else:
+            merged.append([range_start, range_stop])
+    return merged
+
+
+def remove_range(ranges, start, stop):
+    """Remove a range from a list of ranges.
+
+    Args:
+        ranges(list(list(int))): Sorted start and stop of each range
+        start(int): Start of range to remove
+        stop(int): Stop of range to remove
+
+    Returns:
+        list(list(int)): Sorted ranges, without start to stop
+
+    """
+    remaining = []
+    for range_start, range_stop in ranges:
+        if range_start < start:
+            remaining.append([range_start, min(range_stop, start)])
+        if range_stop > stop:
+            remaining.append([max(range_start, stop), range_stop])
+    return remaining
+
+
+def batch_ranges(length, batch_frames, done=()):
+    """Split the first axis into batches, leaving out those already done.
+
+    Args:
+        length(int): Length of first axis
+        batch_frames(int): Length of each batch
+        done(list(list(int))): Ranges already copied
+
+    Returns:
+        list(tuple(int, int)): Start and stop of each batch to copy
+
+    """
+    batches = []
+    for start in range(0, length, batch_frames):
+        stop = min(start + batch_frames, length)
+        if not any(done_start <= start and stop <= done_stop
+                   for done_start, done_stop in done):
+            batches.append((start, stop))
+    return batches
+
+
+def verify_batch(source, target, start, stop):
+    """Check that a batch of the output matches the VDS.
+
+    Args:
+        source(h5py.Dataset): Virtual dataset
+        target(h5py.Dataset): Output dataset
+        start(int): Start of batch
+        stop(int): Stop of batch
+
+    Returns:
+        bool: True if the batch matches
+
+    """
+    return np.array_equal(source[start:stop], target[start:stop],
+                          equal_nan=source.dtype.kind in "fc")
+
+
+def materialise_vds(input_file, output_file, node=None, target_node=None,
+                    chunks=None, compression=None, restart=False,
+                    batch_bytes=None, statistics=False, exclude_gaps=False,
+                    saturation=None):
+    """Copy a virtual dataset to a real dataset, resuming if interrupted.
+
+    The per-frame statistics of framestats can be computed from the batches
+    as they are copied, and stored next to the dataset.
+
+    Args:
+        input_file(str): Path to VDS file
+        output_file(str): Path to file to create dataset in
+        node(str): Virtual dataset in input_file - Default is data
+        target_node(str): Node to create in output_file - Default is node
+        chunks(tuple(int)): Chunk shape of dataset - Default is one frame
+        compression(str): Compression filter of dataset
+        restart(bool): Ignore any checkpoint and copy from the start
+        batch_bytes(int): Size of batches to aim for - Default is 64 MiB
+        statistics(bool): Store the statistics of each frame
+        exclude_gaps(bool): Exclude pixels that no source maps from the
+            statistics
+        saturation: Value at or above which a pixel is saturated - Default is
+            the maximum of the data type
+
+    Returns:
+        int: Number of batches copied
+
+    """
+    import h5py as h5
+
+    node = node or VDSGenerator.target_node
+    target_node = target_node or node
+    start_time = time.time()
+
+    mask = None
+    if statistics and exclude_gaps:
+        mask = gap_mask(flatten_plan(input_file, node)[0])
+
+    with h5.File(input_file, "r") as vds:
+        source = vds[node]
+        shape, dtype = source.shape, source.dtype
+        if chunks is None:
+            chunks = (1,) + shape[1:]
+        chunks = tuple(chunks)
+
+        frame_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+        batch_frames = max((batch_bytes or BATCH_BYTES) // frame_bytes, 1)
+        batch_frames = max(batch_frames - batch_frames % chunks[0],
+                           chunks[0])
+
+        description = dict(input=os.path.abspath(input_file), node=node,
+                           target_node=target_node, shape=list(shape),
+                           dtype=dtype.str, chunks=list(chunks),
+                           batch_frames=batch_frames, statistics=statistics,
+                           exclude_gaps=exclude_gaps,
+                           saturation=None if saturation is None
+                           else float(saturation))
+        checkpoint = None if restart else read_checkpoint(output_file)
+        if checkpoint is not None and \
+                checkpoint["description"] != description:
+            raise IOError("Checkpoint of {} is for a different copy - use "
+                          "restart to start again".format(output_file))
+
+        with h5.File(output_file, "a", libver="latest") as h5_file:
+            if checkpoint is None:
+                if target_node in h5_file:
+                    if not restart:
+                        raise IOError("{} already has an entry for node {} "
+                                      "and no checkpoint".format(
+                                          output_file, target_node))
+                    del h5_file[target_node]
+                checkpoint = dict(description=description, done=[],
+                                  last=None)
+                write_checkpoint(output_file, checkpoint)
+            if target_node not in h5_file:
+                h5_file.create_dataset(
+                    target_node, shape=shape, dtype=dtype, chunks=chunks,
+                    compression=compression, fillvalue=source.fillvalue)
+                checkpoint.update(done=[], last=None)
+            if statistics and not all(
+                    stat_node in h5_file for stat_node
+                    in statistic_nodes(target_node).values()):
+                # New, or interrupted before they were all created - so the
+                # statistics of any batches done are lost, and they are
+                # copied again
+                create_statistics(h5_file, target_node, shape[:-2], dtype)
+                checkpoint.update(done=[], last=None)
+            target = h5_file[target_node]
+            stat_datasets = {name: h5_file[stat_node] for name, stat_node
+                             in statistic_nodes(target_node).items()} \
+                if statistics else None
+
+            last = checkpoint["last"]
+            if last is not None and \
+                    not verify_batch(source, target, *last):
+                logger.warning("Last batch %s of %s does not match - "
+                               "copying it again", last, output_file)
+                checkpoint["done"] = remove_range(checkpoint["done"],
+                                                  *last)
+
+            batches = batch_ranges(shape[0], batch_frames,
+                                   checkpoint["done"])
+            logger.info("Copying %s of %s batches of %s to %s",
+                        len(batches), len(batch_ranges(shape[0],
+                                                       batch_frames)),
+                        input_file, output_file)
+
+            buffer = np.empty((batch_frames,) + shape[1:], dtype=dtype)
+            for start, stop in batches:
+                batch = buffer[:stop - start]
+                source.read_direct(batch, source_sel=np.s_[start:stop])
+                target.write_direct(batch, dest_sel=np.s_[start:stop])
+                if statistics:
+                    write_statistics(stat_datasets, start, frame_statistics(
+                        batch, mask, saturation))
+                h5_file.flush()
+                os.fsync(h5_file.id.get_vfd_handle())
+
+                checkpoint["done"] = add_range(checkpoint["done"], start,
+                                               stop)
+                checkpoint["last"] = [start, stop]
+                write_checkpoint(output_file, checkpoint)
+
+    os.remove(checkpoint_path(output_file))
+    logger.info("Copied %s batches of %s to %s in %.1fs", len(batches),
+                input_file, output_file, time.time() - start_time)
+    return len(batches)
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+    logger.setLevel(args.log_level * 10)
+
+    materialise_vds(args.input, args.output, args.node, args.target_node,
+                    args.chunks, args.compression, args.restart,
+                    statistics=args.statistics,
+                    exclude_gaps=args.exclude_gaps,
+                    saturation=args.saturation)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Generate several virtual datasets from one scan of the raw files."""
+
+import os
+import logging
+from collections import OrderedDict
+
+from .cache import MetadataCache
+from .vdsgenerator import VDSGenerator, find_source_files
+
+
+class MultiVDSGenerator(object):
+
+    """Generate several VDS from the same raw files in one session.
+
+    The raw files are found once and the metadata of each is read once, then
+    shared by every generator added. All of the layouts are created before
+    any file is written, and each output file is opened once to create all
+    of the nodes written to it.
+
+    Example:
+        multi = MultiVDSGenerator("/scratch/images", prefix="stripe_")
+        multi.add(SubFrameVDSGenerator, target_node="stacked")
+        multi.add(SubFrameVDSGenerator, target_node="spaced",
+                  stripe_spacing=3, module_spacing=123)
+        multi.add(ReshapeVDSGenerator, (10, 5), output="stripe_grid.h5")
+        multi.generate_vds()
+
+    """
+
+    def __init__(self, path, prefix=None, files=None, source_node=None,
+                 log_level=None):
+        """
+        Args:
+            path(str): Root folder to find raw files and create VDS
+            prefix(str): Prefix of HDF5 files to generate from
+                e.g. image_ for image_1.hdf5, image_2.hdf5, image_3.hdf5
+            files(list(str)): List of HDF5 files to generate from
+            source_node(str): Data node in source HDF5 files
+            log_level(int): Logging level (off=3, info=2, debug=1) -
+                Default is info
+
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel((log_level or VDSGenerator.log_level) * 10)
+
+        if (prefix is None) == (files is None):
+            raise ValueError("One, and only one, of prefix or files required.")
+
+        self.path = path
+        self.prefix = prefix
+        self.source_node = source_node
+        self.log_level = log_level
+
+        if files is None:
+            files = [os.path.basename(file_)
+                     for file_ in find_source_files(path, prefix)]
+        self.files = list(files)
+
+        self.metadata_cache = MetadataCache()
+        self.generators = []
+        self._generator_classes = {}
+
+    def add(self, generator_class, *args, **kwargs):
+        """Add a generator for the raw files.
+
+        Args:
+            generator_class(type): VDSGenerator subclass to create
+            args, kwargs: Arguments to generator_class, other than path,
+                files and (by default) source_node and log_level
+
+        Returns:
+            VDSGenerator: Instance of generator_class (via a subclass using
+                the shared metadata)
+
+        """
+        kwargs.setdefault("source_node", self.source_node)
+        kwargs.setdefault("log_level", self.log_level)
+        if kwargs.get("output") is None and self.prefix is not None:
+            # Name the VDS after the prefix, as if the files were found
+            kwargs["output"] = "{}vds{}".format(
+                self.prefix, os.path.splitext(self.files[0])[1])
+
+        if generator_class not in self._generator_classes:
+            self._generator_classes[generator_class] = \
+                generator_class.with_metadata_cache(self.metadata_cache)
+        gen = self._generator_classes[generator_class](
+            *args, path=self.path, files=self.files, **kwargs)
+
+        self.generators.append(gen)
+        return gen
+
+    def generate_vds(self):
+        """Generate the virtual datasets of all generators added.
+
+        Generators with skip_unchanged whose VDS is up to date are skipped.
+
+        Returns:
+            list(str): Paths of the VDS files written
+
+        """
+        import h5py as h5
+
+        outputs = OrderedDict()
+        for gen in self.generators:
+            if not gen.up_to_date:
+                outputs.setdefault(gen.output_file, []).append(gen)
+
+        for output_file, generators in outputs.items():
+            targets = [target for gen in generators
+                       for target in gen.target_nodes]
+            duplicates = sorted(set(target for target in targets
+                                    if targets.count(target) > 1))
+            if duplicates:
+                raise ValueError("Multiple generators write node {node} in "
+                                 "{file}".format(node=duplicates[0],
+                                                 file=output_file))
+
+            mode = VDSGenerator.CREATE
+            if os.path.isfile(output_file):
+                with h5.File(output_file, VDSGenerator.READ,
+                             libver="latest") as vds:
+                    existing = [target for target in targets
+                                if vds.get(target) is not None]
+                if existing:
+                    raise IOError("VDS {file} already has an entry for node "
+                                  "{node}".format(file=output_file,
+                                                  node=existing[0]))
+                mode = VDSGenerator.APPEND
+
+            layouts = [(gen, gen.create_layouts()) for gen in generators]
+
+            self.logger.info("Creating %s at %s", ", ".join(targets),
+                             output_file)
+            with h5.File(output_file, mode, libver="latest") as vds:
+                for gen, gen_layouts in layouts:
+                    gen.write_layouts(vds, gen_layouts)
+
+        return list(outputs)
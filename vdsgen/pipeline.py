@@ -0,0 +1,159 @@
+"""Compose generators into one flat VDS, rather than a VDS of VDS files."""
+
+import os
+import logging
+
+from .cache import MetadataCache
+from .flatten import same_fill_value
+from .vdsgenerator import VDSGenerator
+
+
+class _PipelineStage(object):
+
+    """Mixin for generators reading from the outputs of earlier stages."""
+
+    pipeline = None
+
+    def create_fingerprint(self):
+        return None  # Inputs may not exist, and depend on earlier stages
+
+    def check_files(self):
+        for file_ in self.files:
+            if os.path.abspath(file_) not in self.pipeline.plans:
+                super(_PipelineStage, self).check_files()
+
+    def grab_metadata(self, file_path):
+        plan = self.pipeline.plans.get(os.path.abspath(file_path))
+        if plan is None:
+            return super(_PipelineStage, self).grab_metadata(file_path)
+
+        target_node = self.pipeline.target_nodes[os.path.abspath(file_path)]
+        if self.source_node != target_node:
+            raise ValueError("Stage reads node {} of {}, but the stage "
+                             "creating it writes node {}".format(
+                                 self.source_node, file_path, target_node))
+
+        fill_value = self.pipeline.fill_values[os.path.abspath(file_path)]
+        if not same_fill_value(self.fill_value, fill_value):
+            raise ValueError(
+                "Stage has fill value {}, but the stage creating {} has fill "
+                "value {} - the elements it does not map would change "
+                "value".format(self.fill_value, file_path, fill_value))
+
+        frames, height, width = self.parse_shape(plan.shape)
+        return dict(frames=frames, height=height, width=width,
+                    dtype=plan.dtype)
+
+
+class VDSPipeline(object):
+
+    """Chain generators in memory and write one VDS of the raw files.
+
+    Each stage is a generator whose files are raw files, or the outputs of
+    earlier stages. Stages are not written; instead the mappings of each
+    stage are composed with those of the stages it reads from, so the VDS of
+    the last stage maps straight to the raw files. Reading it then only
+    resolves one level of mappings and only opens raw files. Elements a stage
+    does not map then read as the fill value of the last stage, so all stages
+    must have the same fill value.
+
+    Example:
+        pipeline = VDSPipeline("/scratch/images")
+        stripes = [pipeline.add(InterleaveVDSGenerator, block_size=10,
+                                prefix="stripe{}_".format(idx))
+                   for idx in range(6)]
+        frames = pipeline.add(SubFrameVDSGenerator, files=stripes)
+        gaps = pipeline.add(ExcaliburGapFillVDSGenerator, files=[frames],
+                            modules=3)
+        pipeline.add(ReshapeVDSGenerator, (10, 100), files=[gaps],
+                     output="image.h5")
+        pipeline.generate_vds()
+
+    """
+
+    def __init__(self, path, log_level=None):
+        """
+        Args:
+            path(str): Root folder to find raw files and create VDS
+            log_level(int): Logging level (off=3, info=2, debug=1) -
+                Default is info
+
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel((log_level or VDSGenerator.log_level) * 10)
+
+        self.path = path
+        self.log_level = log_level
+        self.metadata_cache = MetadataCache()
+        self.plans = {}  # Output file -> composed LayoutPlan of each stage
+        self.target_nodes = {}  # Output file -> target node of each stage
+        self.fill_values = {}  # Output file -> fill value of each stage
+        self.generators = []
+        self._generator_classes = {}
+
+    def add(self, generator_class, *args, **kwargs):
+        """Add a stage.
+
+        Args:
+            generator_class(type): VDSGenerator subclass to create
+            args, kwargs: Arguments to generator_class, other than path -
+                files may include the names returned by earlier calls
+
+        Returns:
+            str: Name of the (virtual) output file of the stage, to pass as
+                files to later stages
+
+        """
+        kwargs.setdefault("log_level", self.log_level)
+        if kwargs.get("nodes"):
+            raise ValueError("Cannot map nodes in a pipeline")
+        if kwargs.get("skip_unchanged"):
+            raise ValueError("Cannot skip unchanged stages in a pipeline")
+
+        if generator_class not in self._generator_classes:
+            self._generator_classes[generator_class] = type(
+                generator_class.__name__,
+                (_PipelineStage, generator_class),
+                dict(pipeline=self, metadata_cache=self.metadata_cache,
+                     __doc__=generator_class.__doc__))
+        gen = self._generator_classes[generator_class](
+            *args, path=self.path, **kwargs)
+
+        if gen.output_file in self.plans:
+            raise ValueError("A stage already creates {}".format(gen.name))
+
+        plan = gen.create_layout_plan().compose(dict(
+            ((output_file, self.target_nodes[output_file]), plan_)
+            for output_file, plan_ in self.plans.items()))
+        self.logger.debug("Stage %s: %s mappings", gen.name,
+                          len(plan.mappings))
+
+        self.plans[gen.output_file] = plan
+        self.target_nodes[gen.output_file] = gen.target_node
+        self.fill_values[gen.output_file] = gen.fill_value
+        self.generators.append(gen)
+        return gen.name
+
+    def generate_vds(self):
+        """Write the VDS of the last stage, mapping straight to raw files.
+
+        Returns:
+            str: Path of the VDS file
+
+        """
+        import h5py as h5
+
+        if not self.generators:
+            raise ValueError("No stages added")
+
+        gen = self.generators[-1]
+        plan = self.plans[gen.output_file]
+        gen.check_output()
+        layouts = [(gen.target_node, plan)]
+
+        self.logger.info("Creating VDS at %s with %s mappings",
+                         gen.output_file, len(plan.mappings))
+        with h5.File(gen.output_file, gen.mode, libver="latest") as vds:
+            gen.write_layouts(vds, layouts)
+
+        return gen.output_file
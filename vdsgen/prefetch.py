@@ -0,0 +1,302 @@
+"""Warm the page cache with the source data of a frame range of a VDS.
+
+The first read of a freshly archived dataset is dominated by cold reads from
+disk. Prefetching resolves the frames through the mappings of the VDS (and
+any virtual datasets it maps from) to the byte ranges of the source files
+that hold them, and asks the kernel to read those ranges ahead - so later
+reads of those frames come from the page cache.
+
+"""
+
+import os
+import sys
+import time
+import logging
+import itertools
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .flatten import flatten_plan
+from .utils import frame_range_type
+from .vdsgenerator import VDSGenerator
+
+logger = logging.getLogger("VDSPrefetch")
+
+READ_SIZE = 2 ** 20  # Bytes read at a time when reading ranges
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Warm the page cache with the source data of a frame "
+                    "range of a VDS.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "file", type=str, help="VDS file to prefetch.")
+    parser.add_argument(
+        "-n", "--node", type=str, dest="node",
+        default=VDSGenerator.target_node, help="Virtual dataset to prefetch.")
+    parser.add_argument(
+        "--frame-range", type=frame_range_type, dest="frame_range",
+        default=None, metavar="START:STOP[:STEP]",
+        help="Frames of the first axis to prefetch. Default is all frames.")
+    parser.add_argument(
+        "-w", "--workers", type=int, dest="workers", default=4,
+        help="Number of source files to prefetch at once.")
+    parser.add_argument(
+        "--read", action="store_true", dest="read",
+        help="Read the byte ranges instead of passing readahead hints, for "
+             "file systems that ignore posix_fadvise.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def merge_ranges(ranges):
+    """Sort byte ranges by offset and merge those that overlap or touch.
+
+    Args:
+        ranges(list(tuple(int, int))): Offset and length of each range
+
+    Returns:
+        list(tuple(int, int)): Merged ranges, in offset order
+
+    """
+    merged = []
+    for offset, length in sorted(ranges):
+        if merged and offset <= merged[-1][0] + merged[-1][1]:
+            start = merged[-1][0]
+            merged[-1] = (start, max(merged[-1][1], offset + length - start))
+        else:
+            merged.append((offset, length))
+    return merged
+
+
+def stored_chunks(dataset):
+    """Find the byte range of every stored chunk of a chunked dataset.
+
+    The chunk index is read in one pass, rather than looking up each chunk
+    by its coordinates.
+
+    Args:
+        dataset(h5py.Dataset): Chunked dataset
+
+    Returns:
+        dict: Offset of each chunk (the coordinates of its first element) ->
+            offset and length of its bytes
+
+    """
+    chunks = {}
+
+    def visit(info):
+        chunks[tuple(info.chunk_offset)] = (info.byte_offset, info.size)
+
+    if hasattr(dataset.id, "chunk_iter"):  # HDF5 1.10.10 or 1.12.3 on
+        dataset.id.chunk_iter(visit)
+    else:
+        for idx in range(dataset.id.get_num_chunks()):
+            visit(dataset.id.get_chunk_info(idx))
+    return chunks
+
+
+def mapping_byte_ranges(dataset, mapping, trailing, chunks=None):
+    """Find the byte ranges of a source dataset that a mapping reads.
+
+    For chunked datasets these are the stored chunks the mapping selects
+    from. For contiguous datasets they are the span of each frame from the
+    first to the last element selected.
+
+    Args:
+        dataset(h5py.Dataset): Source dataset
+        mapping(Mapping): Mapping of a LayoutPlan from dataset
+        trailing(int): Number of axes after the frame axes
+        chunks(dict): Stored chunks of dataset, from stored_chunks - Default
+            is to read them
+
+    Returns:
+        list(tuple(int, int)): Offset and length of each range
+
+    """
+    _, source_frames = mapping.frames
+    source_axes = [np.unique(source) for _, source in mapping.axes]
+    frame_shape = dataset.shape[:len(dataset.shape) - trailing]
+    axes_shape = dataset.shape[len(dataset.shape) - trailing:]
+    coordinates = np.unravel_index(np.unique(source_frames), frame_shape)
+
+    if dataset.chunks is None:
+        offset = dataset.id.get_offset()
+        if offset is None:
+            return []  # Not allocated, or not stored in the file
+        itemsize = dataset.dtype.itemsize
+        frame_elements = int(np.prod(axes_shape))
+        first = np.ravel_multi_index([axis.min() for axis in source_axes],
+                                     axes_shape) if trailing else 0
+        last = np.ravel_multi_index([axis.max() for axis in source_axes],
+                                    axes_shape) if trailing else 0
+        frames = np.ravel_multi_index(coordinates, frame_shape) \
+            if frame_shape else np.zeros(1, dtype=np.int64)
+        starts = offset + (frames * frame_elements + first) * itemsize
+        return [(int(start), int((last - first + 1) * itemsize))
+                for start in starts]
+
+    if chunks is None:
+        chunks = stored_chunks(dataset)
+    frame_chunks = dataset.chunks[:len(frame_shape)]
+    axes_chunks = dataset.chunks[len(frame_shape):]
+    chunked_frames = np.unique(np.stack(
+        [coordinate // chunk for coordinate, chunk in zip(coordinates,
+                                                          frame_chunks)],
+        axis=-1), axis=0) if frame_shape else [()]
+    chunked_axes = [np.unique(axis // chunk)
+                    for axis, chunk in zip(source_axes, axes_chunks)]
+
+    ranges = []
+    for chunk_idx in itertools.product(chunked_frames, *chunked_axes):
+        chunk_idx = tuple(chunk_idx[0]) + chunk_idx[1:]
+        chunk_offset = tuple(int(idx) * chunk
+                             for idx, chunk in zip(chunk_idx, dataset.chunks))
+        if chunk_offset in chunks:  # Else not written
+            ranges.append(chunks[chunk_offset])
+    return ranges
+
+
+def plan_byte_ranges(plan):
+    """Find the byte ranges of each source file that a plan reads.
+
+    Args:
+        plan(LayoutPlan): Mappings to read
+
+    Returns:
+        dict: File path -> merged byte ranges, in offset order
+
+    """
+    import h5py as h5
+
+    trailing = len(plan.shape) - plan.frame_axes
+    mappings = {}
+    for mapping in plan.mappings:
+        if len(mapping.frames[0]):
+            mappings.setdefault(mapping.file_path, []).append(mapping)
+
+    ranges = {}
+    for file_path in sorted(mappings):
+        file_ranges = []
+        try:
+            with h5.File(file_path, "r") as h5_file:
+                chunks = {}
+                for mapping in mappings[file_path]:
+                    dataset = h5_file[mapping.node]
+                    if dataset.chunks is not None and \
+                            mapping.node not in chunks:
+                        chunks[mapping.node] = stored_chunks(dataset)
+                    file_ranges.extend(mapping_byte_ranges(
+                        dataset, mapping, trailing, chunks.get(mapping.node)))
+        except (IOError, OSError, KeyError):
+            logger.warning("Cannot read %s - skipping it", file_path)
+            continue
+        ranges[file_path] = merge_ranges(file_ranges)
+
+    return ranges
+
+
+def prefetch_file(file_path, ranges, read=False):
+    """Ask the kernel to read ahead byte ranges of a file.
+
+    Args:
+        file_path(str): Path to file
+        ranges(list(tuple(int, int))): Offset and length of each range
+        read(bool): Read the ranges, rather than passing POSIX_FADV_WILLNEED
+            hints - as is done anyway where posix_fadvise is not available
+
+    Returns:
+        int: Number of bytes prefetched
+
+    """
+    total = 0
+    if not read and hasattr(os, "posix_fadvise"):
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            for offset, length in ranges:
+                os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+                total += length
+        finally:
+            os.close(fd)
+        return total
+
+    buffer = bytearray(READ_SIZE)
+    with open(file_path, "rb", buffering=0) as file_:
+        for offset, length in ranges:
+            file_.seek(offset)
+            while length > 0:
+                count = file_.readinto(
+                    memoryview(buffer)[:min(length, READ_SIZE)])
+                if not count:
+                    break
+                total += count
+                length -= count
+    return total
+
+
+def prefetch_vds(file_path, node=None, frame_range=None, workers=None,
+                 read=False):
+    """Prefetch the source data of a frame range of a virtual dataset.
+
+    Files are prefetched in parallel, with the ranges of each file in offset
+    order.
+
+    Args:
+        file_path(str): Path to VDS file
+        node(str): Virtual dataset - Default is data
+        frame_range(tuple(int)): start, stop and step of the frames of the
+            first axis - Default is all frames
+        workers(int): Number of files to prefetch at once - Default is 4
+        read(bool): Read the ranges, rather than passing readahead hints
+
+    Returns:
+        dict: Number of source files ("files"), byte ranges ("ranges") and
+            bytes ("bytes") prefetched
+
+    """
+    node = node or VDSGenerator.target_node
+    start = time.time()
+
+    plan, _ = flatten_plan(file_path, node)
+    if frame_range is not None:
+        key = (slice(*frame_range),) + (slice(None),) * (len(plan.shape) - 1)
+        plan = plan.view(key)
+
+    ranges = plan_byte_ranges(plan)
+    with ThreadPoolExecutor(max_workers=workers or 4) as executor:
+        totals = list(executor.map(
+            lambda path: prefetch_file(path, ranges[path], read),
+            sorted(ranges)))
+
+    stats = dict(files=len(ranges),
+                 ranges=sum(len(file_ranges)
+                            for file_ranges in ranges.values()),
+                 bytes=sum(totals))
+    logger.info("Prefetched %s bytes in %s ranges of %s files for %s in "
+                "%.1fs", stats["bytes"], stats["ranges"], stats["files"],
+                file_path, time.time() - start)
+    return stats
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+    logger.setLevel(args.log_level * 10)
+
+    prefetch_vds(args.file, args.node, args.frame_range, args.workers,
+                 args.read)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
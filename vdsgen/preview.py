@@ -0,0 +1,272 @@
+"""Binned preview pyramids of a VDS, for quick-look viewers.
+
+Each frame of the VDS is binned by a set of factors, e.g. 2, 4 and 8, taking
+the mean of each factor x factor block of pixels as float32. The frames are
+read once, in batches of the first axis, by a pool of processes - each batch
+is binned to the smallest factor and each larger level is binned from the
+last one it is a multiple of - and the levels are written as the batches
+complete. Pixels that no source maps, e.g. the gaps between modules, can be
+left out of the means; a bin with no pixels left is the fill value of the
+VDS.
+
+The previews are stored in a file next to the VDS, <name>_preview.h5, as
+<node>_bin<factor>, and linked from the VDS file with the same names, so a
+viewer opening the VDS can read them in place of the frames.
+
+"""
+
+import os
+import sys
+import time
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .flatten import flatten_plan
+from .framestats import gap_mask
+from .vdsgenerator import VDSGenerator
+
+logger = logging.getLogger("VDSPreview")
+
+FACTORS = (2, 4, 8)
+BATCH_BYTES = 64 * 1024 ** 2  # Size of slabs read in one call
+PREVIEW_SUFFIX = "_preview"
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Generate binned previews of the frames of a VDS and "
+                    "link them from it.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "file", type=str, help="VDS file to preview.")
+    parser.add_argument(
+        "-n", "--node", type=str, dest="node",
+        default=VDSGenerator.target_node, help="Dataset to preview.")
+    parser.add_argument(
+        "-f", "--factors", type=int, nargs="+", dest="factors",
+        default=list(FACTORS), help="Binning factors of the previews.")
+    parser.add_argument(
+        "--exclude-gaps", action="store_true", dest="exclude_gaps",
+        help="Exclude pixels that no source maps, e.g. gaps between modules.")
+    parser.add_argument(
+        "-P", "--processes", type=int, dest="processes", default=1,
+        help="Number of processes to bin frames in parallel.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def preview_path(file_path):
+    """Get the path of the file of the previews of a VDS.
+
+    Args:
+        file_path(str): Path to VDS file
+
+    Returns:
+        str: Path to preview file
+
+    """
+    root, extension = os.path.splitext(file_path)
+    return root + PREVIEW_SUFFIX + extension
+
+
+def preview_nodes(node, factors):
+    """Get the names of the preview datasets of a node.
+
+    Args:
+        node(str): Dataset the previews are of
+        factors(list(int)): Binning factors
+
+    Returns:
+        dict: Factor -> name of dataset
+
+    """
+    return {factor: "{}_bin{}".format(node.rstrip("/"), factor)
+            for factor in factors}
+
+
+def binned_shape(shape, factor):
+    """Get the shape of data binned by a factor.
+
+    Args:
+        shape(tuple(int)): Shape of data, with the last two axes the pixels
+        factor(int): Binning factor
+
+    Returns:
+        tuple(int): Shape of binned data - a partial bin at the edge is kept
+
+    """
+    return tuple(shape[:-2]) + tuple(-(-length // factor)
+                                     for length in shape[-2:])
+
+
+def bin_sum(data, factor):
+    """Sum factor x factor blocks of the last two axes of data.
+
+    The last two axes are padded with zeros to a multiple of factor.
+
+    Args:
+        data(numpy.ndarray): Data to bin
+        factor(int): Binning factor
+
+    Returns:
+        numpy.ndarray: Sum of each block, as float64
+
+    """
+    height, width = data.shape[-2:]
+    padding = ((0, 0),) * (data.ndim - 2) + \
+        ((0, -height % factor), (0, -width % factor))
+    if any(after for _, after in padding):
+        data = np.pad(data, padding)
+    blocks = data.reshape(data.shape[:-2] + (
+        data.shape[-2] // factor, factor, data.shape[-1] // factor, factor))
+    return blocks.sum(axis=(-3, -1), dtype=np.float64)
+
+
+def bin_frames(frames, factors, mask=None, fill_value=0):
+    """Bin a batch of frames by each of a set of factors.
+
+    Args:
+        frames(numpy.ndarray): Frames, with the last two axes the pixels
+        factors(list(int)): Binning factors
+        mask(numpy.ndarray): Pixels to include - Default is all
+        fill_value: Value of bins with no pixels included
+
+    Returns:
+        dict: Factor -> mean of each bin of each frame, as float32
+
+    """
+    if mask is None:
+        mask = np.ones(frames.shape[-2:], dtype=bool)
+    else:
+        frames = np.where(mask, frames, 0)
+
+    levels = {}
+    binned = {1: (frames, mask)}
+    for factor in sorted(set(factors)):
+        base = max(level for level in binned if factor % level == 0)
+        sums, counts = binned[base]
+        sums = bin_sum(sums, factor // base)
+        counts = bin_sum(counts, factor // base)
+        binned[factor] = sums, counts
+        with np.errstate(invalid="ignore", divide="ignore"):
+            levels[factor] = np.where(counts > 0, sums / counts,
+                                      fill_value).astype(np.float32)
+    return levels
+
+
+def _bin_batch(job):
+    file_path, node, start, stop, factors, mask, fill_value = job
+
+    import h5py as h5
+
+    with h5.File(file_path, "r") as h5_file:
+        frames = h5_file[node][start:stop]
+    return start, bin_frames(frames, factors, mask, fill_value)
+
+
+def generate_previews(file_path, node=None, factors=FACTORS,
+                      exclude_gaps=False, processes=1, batch_bytes=None):
+    """Bin the frames of a dataset and link the previews from its file.
+
+    Args:
+        file_path(str): Path to VDS file
+        node(str): Dataset - Default is data
+        factors(list(int)): Binning factors
+        exclude_gaps(bool): Exclude pixels that no source maps
+        processes(int): Number of processes to bin frames in parallel
+        batch_bytes(int): Size of batches to read - Default is 64 MiB
+
+    Returns:
+        dict: Factor -> name of preview dataset
+
+    """
+    import h5py as h5
+
+    node = node or VDSGenerator.target_node
+    factors = sorted(set(factors))
+    if not factors or min(factors) < 1:
+        raise ValueError("Binning factors must be positive, got {}".format(
+            factors))
+    start_time = time.time()
+
+    with h5.File(file_path, "r") as h5_file:
+        dataset = h5_file[node]
+        shape, dtype = dataset.shape, dataset.dtype
+        fill_value = dataset.fillvalue
+    if len(shape) < 3:
+        raise ValueError("{} of {} has no frames to bin".format(
+            node, file_path))
+
+    mask = None
+    if exclude_gaps:
+        mask = gap_mask(flatten_plan(file_path, node)[0])
+
+    frame_bytes = int(np.prod(shape[1:])) * dtype.itemsize
+    batch_frames = max((batch_bytes or BATCH_BYTES) // max(frame_bytes, 1),
+                       1)
+    jobs = [(file_path, node, start, min(start + batch_frames, shape[0]),
+             factors, mask, fill_value)
+            for start in range(0, shape[0], batch_frames)]
+
+    nodes = preview_nodes(node, factors)
+    preview_file = preview_path(file_path)
+    pool = ProcessPoolExecutor(max_workers=processes) \
+        if processes > 1 and len(jobs) > 1 else None
+    try:
+        with h5.File(preview_file, "a", libver="latest") as h5_file:
+            datasets = {}
+            for factor, preview_node in nodes.items():
+                if preview_node in h5_file:
+                    del h5_file[preview_node]
+                level_shape = binned_shape(shape, factor)
+                datasets[factor] = h5_file.create_dataset(
+                    preview_node, shape=level_shape, dtype=np.float32,
+                    chunks=(1,) * (len(shape) - 2) + level_shape[-2:],
+                    fillvalue=fill_value)
+                datasets[factor].attrs["binning"] = factor
+
+            # Write each batch as it is binned, rather than after the pass
+            results = pool.map(_bin_batch, jobs) if pool is not None \
+                else (_bin_batch(job) for job in jobs)
+            for start, levels in results:
+                for factor, level in levels.items():
+                    datasets[factor][start:start + len(level)] = level
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Relative to the VDS file, so they can be moved together
+    link_file = os.path.basename(preview_file)
+    with h5.File(file_path, "r+") as h5_file:
+        for preview_node in nodes.values():
+            if h5_file.get(preview_node, getlink=True) is not None:
+                del h5_file[preview_node]
+            h5_file[preview_node] = h5.ExternalLink(link_file, preview_node)
+
+    logger.info("Binned %s frames of %s by %s in %.1fs", shape[0],
+                file_path, factors, time.time() - start_time)
+    return nodes
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+    logger.setLevel(args.log_level * 10)
+
+    generate_previews(args.file, args.node, args.factors, args.exclude_gaps,
+                      args.processes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
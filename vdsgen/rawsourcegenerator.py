@@ -1,8 +1,13 @@
-import numpy as np
-import h5py
+"""Generate raw HDF5 files of synthetic frames to create VDS files from."""
 
 import sys
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import h5py
+
+BATCH_BYTES = 64 * 1024 ** 2  # Size of slabs written in one call
 
 
 def parse_args():
@@ -15,62 +20,181 @@ def parse_args():
     parser.add_argument(
         "files", type=int, help="Number of files to spread frames across.")
     parser.add_argument(
-        "block_size", type=int, default=1,
+        "block_size", type=int, nargs="?", default=1,
         help="Size of contiguous blocks of frames.")
     parser.add_argument(
-        "x_dim", type=int, default=100,
+        "x_dim", type=int, nargs="?", default=100,
         help="Width of frame")
     parser.add_argument(
-        "y_dim", type=int, default=100,
+        "y_dim", type=int, nargs="?", default=100,
         help="Height of frame")
     parser.add_argument(
-        "dset", type=str, default="data",
+        "dset", type=str, nargs="?", default="data",
         help="Dataset name")
+    parser.add_argument(
+        "--any", action="store_true", dest="any",
+        help="Fill frames with ones, rather than the frame index, without "
+             "writing them.")
+    parser.add_argument(
+        "-t", "--data-type", type=str, dest="dtype", default="int32",
+        help="Data type of datasets.")
+    parser.add_argument(
+        "-c", "--chunks", type=int, nargs=3, dest="chunks", default=None,
+        help="Chunk shape - '<frames> <height> <width>'. Default is one "
+             "frame per chunk.")
+    parser.add_argument(
+        "-C", "--compression", type=str, dest="compression", default=None,
+        help="Compression filter, e.g. gzip or lzf.")
+    parser.add_argument(
+        "--compression-opts", type=int, dest="compression_opts",
+        default=None, help="Options for compression filter, e.g. gzip level.")
+    parser.add_argument(
+        "--contiguous", action="store_true", dest="contiguous",
+        help="Use contiguous layout rather than chunked.")
+    parser.add_argument(
+        "-P", "--processes", type=int, dest="processes", default=1,
+        help="Number of processes to write files in parallel.")
 
     return parser.parse_args()
 
 
+def frames_per_file(frames, files, block_size):
+    """Calculate the number of frames written to each file.
+
+    Args:
+        frames(int): Total number of frames
+        files(int): Number of files to spread frames across
+        block_size(int): Number of contiguous frames in each block
+
+    Returns:
+        list(int): Number of frames in each file
+
+    """
+    cycle = files * block_size
+    full_cycles, remainder = divmod(frames, cycle)
+    return [full_cycles * block_size +
+            min(max(remainder - file_idx * block_size, 0), block_size)
+            for file_idx in range(files)]
+
+
+def file_frame_indices(file_idx, frames, files, block_size):
+    """Calculate the global index of each frame written to a file.
+
+    Frames are spread across the files in blocks of block_size, in turn.
+
+    Args:
+        file_idx(int): Index of file
+        frames(int): Total number of frames
+        files(int): Number of files to spread frames across
+        block_size(int): Number of contiguous frames in each block
+
+    Returns:
+        numpy.ndarray: Global frame index of each frame in the file
+
+    """
+    count = frames_per_file(frames, files, block_size)[file_idx]
+    local = np.arange(count)
+    blocks, offsets = np.divmod(local, block_size)
+    return (blocks * files + file_idx) * block_size + offsets
+
+
 def generate_raw_files(prefix, frames, files, block_size, x_dim, y_dim,
-                       any=False, dset="data"):
-
-    values = []
-    for _ in range(files):
-        values.append(list())
-
-    for frame_idx in range(frames):
-        if files > 1:
-            block_idx = frame_idx // block_size
-            file_idx = block_idx % files
-        else:
-            file_idx = 0
-        values[file_idx].append(frame_idx)
-
-    for file_idx, file_values in enumerate(values):
-        with h5py.File(prefix + "_{}.h5".format(file_idx), mode="w") as f:
-            f.create_dataset(dset,
-                             shape=(len(file_values), y_dim, x_dim),
-                             chunks=(1, y_dim, x_dim),
-                             dtype="int32")
-            if not any:
-                for idx, value in enumerate(file_values):
-                    f[dset][idx] = np.full((y_dim, x_dim),
-                                           value, dtype="int32")
-            else:
-                chunk_size = min(100, frames)
-                chunk_data = np.full((chunk_size, y_dim, x_dim),
-                                     1, dtype="int32")
-                for chunk_idx in range(0, len(file_values), chunk_size):
-                    start = chunk_idx * chunk_size
-                    end = start + chunk_size
-                    f[dset][start:end] = chunk_data
+                       any=False, dset="data", dtype="int32", chunks=None,
+                       compression=None, compression_opts=None,
+                       contiguous=False, processes=1):
+    """Write raw files with frames spread across them in blocks.
+
+    Each file is <prefix>_<index>.h5, with every pixel of each frame set to
+    the global index of the frame. Frames are written in slabs of up to
+    BATCH_BYTES, aligned to chunks. If any is True, frames are not written at
+    all - the datasets have a fill value of 1 instead - so files of any size
+    can be created for timing VDS creation without filling the disk.
+
+    Args:
+        prefix(str): Path and name prefix of files
+        frames(int): Total number of frames
+        files(int): Number of files to spread frames across
+        block_size(int): Number of contiguous frames in each block
+        x_dim(int): Width of frame
+        y_dim(int): Height of frame
+        any(bool): Fill frames with ones, rather than the frame index,
+            without writing them
+        dset(str): Dataset name
+        dtype(str): Data type of datasets
+        chunks(tuple(int)): Chunk shape - Default is one frame per chunk
+        compression(str): Compression filter, e.g. gzip or lzf
+        compression_opts: Options for compression filter
+        contiguous(bool): Use contiguous layout rather than chunked
+        processes(int): Number of processes to write files in parallel
+
+    Returns:
+        list(str): Paths of files written
+
+    """
+    if contiguous and (chunks is not None or compression is not None):
+        raise ValueError("Contiguous layout cannot be chunked or compressed")
+
+    jobs = [(prefix + "_{}.h5".format(file_idx), file_idx, frames, files,
+             block_size, x_dim, y_dim, any, dset, dtype, chunks, compression,
+             compression_opts, contiguous)
+            for file_idx in range(files)]
+
+    if processes > 1 and files > 1:
+        with ProcessPoolExecutor(max_workers=min(processes, files)) as pool:
+            list(pool.map(_write_file, jobs))
+    else:
+        for job in jobs:
+            _write_file(job)
+
+    return [job[0] for job in jobs]
+
+
+def _write_file(job):
+    (file_path, file_idx, frames, files, block_size, x_dim, y_dim, any, dset,
+     dtype, chunks, compression, compression_opts, contiguous) = job
+
+    values = file_frame_indices(file_idx, frames, files, block_size)
+    frame_shape = (y_dim, x_dim)
+    if contiguous:
+        chunks = None
+    elif chunks is None:
+        chunks = (1,) + frame_shape
+    else:
+        chunks = tuple(chunks)
+
+    with h5py.File(file_path, mode="w") as f:
+        dataset = f.create_dataset(
+            dset, shape=(len(values),) + frame_shape, dtype=dtype,
+            chunks=chunks, compression=compression,
+            compression_opts=compression_opts, fillvalue=1 if any else None)
+        if any:
+            return  # Unwritten frames read as the fill value
+
+        # Write whole chunks in each batch, so no chunk is written twice
+        frame_bytes = y_dim * x_dim * np.dtype(dtype).itemsize
+        batch_frames = max(BATCH_BYTES // frame_bytes, 1)
+        if chunks is not None and batch_frames > chunks[0]:
+            batch_frames -= batch_frames % chunks[0]
+        batch_frames = max(min(batch_frames, len(values)), 1)
+
+        buffer = np.empty((batch_frames,) + frame_shape, dtype=dtype)
+        for start in range(0, len(values), batch_frames):
+            end = min(start + batch_frames, len(values))
+            batch = buffer[:end - start]
+            batch[...] = values[start:end, np.newaxis, np.newaxis]
+            dataset.write_direct(batch, dest_sel=np.s_[start:end])
 
 
 def main():
     """Run program."""
     args = parse_args()
 
-    generate_raw_files(args.prefix, args.files, args.frames, args.block_size,
-                       args.x_dim, args.y_dim, args.dset)
+    generate_raw_files(args.prefix, args.frames, args.files, args.block_size,
+                       args.x_dim, args.y_dim, any=args.any, dset=args.dset,
+                       dtype=args.dtype, chunks=args.chunks,
+                       compression=args.compression,
+                       compression_opts=args.compression_opts,
+                       contiguous=args.contiguous, processes=args.processes)
 
 
 if __name__ == "__main__":
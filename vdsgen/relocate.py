@@ -0,0 +1,246 @@
+"""Rewrite the source paths of existing VDS files in place.
+
+The mappings of a virtual dataset are fixed when it is created, so each
+dataset is recreated with the same mappings, fill value and attributes, and
+new source file paths. Only metadata is written - the sources are not opened.
+The datasets are recreated in a temporary copy of the file, which is then
+moved into place, so a failure part way leaves the original file untouched
+and readers see either the old file or the new one.
+
+Use --relative before moving a VDS and its sources together, or --replace
+to update absolute paths after the sources have been moved.
+
+"""
+
+import os
+import sys
+import shutil
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import numpy as np
+
+from .vdsgenerator import VDSGenerator
+
+logger = logging.getLogger("VDSRelocate")
+
+FRAME_INDEX_SUFFIX = "_frame_index"
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Rewrite the source file paths of virtual datasets in "
+                    "place, to make them relative or move them.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "files", type=str, nargs="+", help="VDS files to rewrite.")
+    parser.add_argument(
+        "-n", "--nodes", type=str, nargs="*", dest="nodes", default=None,
+        help="Virtual datasets to rewrite. Default is all of them.")
+    parser.add_argument(
+        "-r", "--relative", action="store_true", dest="relative",
+        help="Make absolute source paths relative to the VDS file.")
+    parser.add_argument(
+        "--replace", type=str, nargs=2, dest="replace", default=None,
+        metavar=("OLD", "NEW"),
+        help="Replace the directory OLD of source paths with NEW.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    args = parser.parse_args()
+    if not args.relative and args.replace is None:
+        parser.error("Must give --relative and/or --replace")
+
+    return args
+
+
+def rewrite_path(path, directory, relative=False, replace=None):
+    """Rewrite a source path.
+
+    Args:
+        path(str): Source path, as stored in the VDS
+        directory(str): Directory of the VDS file
+        relative(bool): Make an absolute path relative to directory
+        replace(tuple(str, str)): Replace the prefix replace[0] of path with
+            replace[1] - the prefix must be path itself or a directory of it
+
+    Returns:
+        str: New source path
+
+    """
+    if path == ".":
+        return path  # Same file as the VDS
+
+    if replace is not None:
+        old, new = replace
+        prefix = old.rstrip("/")
+        if path in (old, prefix):
+            path = new
+        elif path.startswith(prefix + "/"):
+            path = new.rstrip("/") + path[len(prefix):]
+    if relative and os.path.isabs(path):
+        path = os.path.relpath(path, directory)
+
+    return path
+
+
+def find_virtual_datasets(h5_file):
+    """Find the virtual datasets in a file.
+
+    Args:
+        h5_file(h5py.File): Open file
+
+    Returns:
+        list(str): Names of virtual datasets
+
+    """
+    import h5py as h5
+
+    names = []
+
+    def visit(name, item):
+        if isinstance(item, h5.Dataset) and item.is_virtual:
+            names.append(name)
+    h5_file.visititems(visit)
+
+    return names
+
+
+def relocate_dataset(h5_file, name, relative=False, replace=None):
+    """Recreate a virtual dataset with rewritten source paths.
+
+    Args:
+        h5_file(h5py.File): File open for writing
+        name(str): Name of virtual dataset
+        relative(bool): Make absolute source paths relative to the VDS file
+        replace(tuple(str, str)): Replace the prefix replace[0] of source
+            paths with replace[1]
+
+    Returns:
+        int: Number of mappings with a new source path
+
+    """
+    import h5py as h5
+
+    directory = os.path.dirname(os.path.abspath(h5_file.filename))
+    dataset = h5_file[name]
+    old_dcpl = dataset.id.get_create_plist()
+
+    dcpl = h5.h5p.create(h5.h5p.DATASET_CREATE)
+    dcpl.set_layout(h5.h5d.VIRTUAL)
+    dcpl.set_fill_value(np.array([dataset.fillvalue], dtype=dataset.dtype))
+
+    changed = 0
+    for idx in range(old_dcpl.get_virtual_count()):
+        path = old_dcpl.get_virtual_filename(idx)
+        new_path = rewrite_path(path, directory, relative, replace)
+        changed += new_path != path
+        dcpl.set_virtual(old_dcpl.get_virtual_vspace(idx),
+                         os.fsencode(new_path),
+                         old_dcpl.get_virtual_dsetname(idx).encode("utf-8"),
+                         old_dcpl.get_virtual_srcspace(idx))
+
+    if not changed:
+        return 0
+
+    attributes = dict(dataset.attrs)
+    type_id, space_id = dataset.id.get_type(), dataset.id.get_space()
+    parent = dataset.parent
+    base_name = name.rstrip("/").split("/")[-1]
+
+    del parent[base_name]
+    h5.h5d.create(parent.id, name=base_name.encode("utf-8"), tid=type_id,
+                  space=space_id, dcpl=dcpl)
+    for attribute, value in attributes.items():
+        parent[base_name].attrs[attribute] = value
+
+    return changed
+
+
+def relocate_frame_index(h5_file, name, relative=False, replace=None):
+    """Rewrite the file paths of a FrameIndex.
+
+    Args:
+        h5_file(h5py.File): File open for writing
+        name(str): Name of frame index dataset
+        relative(bool): Make absolute paths relative to the VDS file
+        replace(tuple(str, str)): Replace the prefix replace[0] of paths with
+            replace[1]
+
+    """
+    import h5py as h5
+
+    directory = os.path.dirname(os.path.abspath(h5_file.filename))
+    attrs = h5_file[name].attrs
+    files = [file_.decode("utf-8") if isinstance(file_, bytes) else file_
+             for file_ in attrs["files"]]
+    attrs.create("files", [rewrite_path(file_, directory, relative, replace)
+                           for file_ in files], dtype=h5.string_dtype())
+
+
+def relocate_vds(file_path, nodes=None, relative=False, replace=None):
+    """Rewrite the source paths of the virtual datasets in a file.
+
+    Frame indexes written with the datasets are updated too.
+
+    Args:
+        file_path(str): Path to VDS file
+        nodes(list(str)): Virtual datasets to rewrite - Default is all
+        relative(bool): Make absolute source paths relative to the VDS file
+        replace(tuple(str, str)): Replace the prefix replace[0] of source
+            paths with replace[1]
+
+    Returns:
+        int: Number of mappings with a new source path
+
+    """
+    import h5py as h5
+
+    # Rewrite a copy in the same directory, so relative paths are the same
+    directory, name = os.path.split(os.path.abspath(file_path))
+    temp_file = os.path.join(directory, ".{}.tmp".format(name))
+    shutil.copy2(file_path, temp_file)
+
+    changed = 0
+    try:
+        with h5.File(temp_file, "r+", libver="latest") as h5_file:
+            if nodes is None:
+                nodes = find_virtual_datasets(h5_file)
+
+            for node in nodes:
+                node_changed = relocate_dataset(h5_file, node, relative,
+                                                replace)
+                logger.debug("Rewrote %s source paths of %s", node_changed,
+                             node)
+                changed += node_changed
+
+                index = node.rstrip("/") + FRAME_INDEX_SUFFIX
+                if index in h5_file:
+                    relocate_frame_index(h5_file, index, relative, replace)
+    except BaseException:
+        os.remove(temp_file)
+        raise
+
+    os.rename(temp_file, file_path)
+
+    logger.info("Rewrote %s source paths in %s", changed, file_path)
+    return changed
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+    logger.setLevel(args.log_level * 10)
+
+    for file_path in args.files:
+        relocate_vds(file_path, args.nodes, args.relative, args.replace)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,6 @@
 
 import logging
 
-import h5py as h5
 from .vdsgenerator import VDSGenerator, SourceMeta
 
 
@@ -10,26 +9,30 @@ class ReshapeVDSGenerator(VDSGenerator):
     """A class to generate an ND Virtual Dataset from a 1D raw dataset."""
 
     logger = logging.getLogger("ReshapeVDSGenerator")
+    FINGERPRINT_ATTRIBUTES = VDSGenerator.FINGERPRINT_ATTRIBUTES + (
+        "dimensions", "alternate")
 
     def __init__(self, shape,
                  path, prefix=None, files=None, output=None, source=None,
                  source_node=None, target_node=None, fill_value=None,
                  log_level=None,
-                 alternate=None):
+                 alternate=None, **kwargs):
         """
         Args:
             shape(tuple(int)): Shape of output dataset
             alternate(tuple(bool)): Whether each axis alternates
+            kwargs: Other VDSGenerator arguments, e.g. nodes
 
         """
+        self.alternate = alternate
+        self.dimensions = shape
+
         super(ReshapeVDSGenerator, self).__init__(
             path, prefix, files, output, source, source_node, target_node,
-            fill_value, log_level)
+            fill_value, log_level, **kwargs)
 
         self.total_frames = 0
         self.periods = []
-        self.alternate = alternate
-        self.dimensions = shape
         self.source_file = self.files[0]  # Reshape only has one raw file
 
     def process_source_datasets(self):
@@ -82,13 +85,12 @@ class ReshapeVDSGenerator(VDSGenerator):
         vds_shape = self.dimensions + (source_meta.height, source_meta.width)
         self.logger.debug("VDS metadata:\n"
                           "  Shape: %s\n", vds_shape)
-        v_layout = h5.VirtualLayout(vds_shape, source_meta.dtype)
+        v_layout = self.new_virtual_layout(vds_shape, source_meta.dtype)
 
         source_shape = source_meta.frames + \
             (source_meta.height, source_meta.width)
-        v_source = h5.VirtualSource(
-            self.source_file, name=self.source_node,
-            shape=source_shape, dtype=source_meta.dtype
+        v_source = self.new_virtual_source(
+            self.source_file, shape=source_shape, dtype=source_meta.dtype
         )
 
         if self.alternate is not None:
@@ -0,0 +1,317 @@
+"""A local service to generate VDS files without process startup costs.
+
+The server listens on a Unix socket and accepts the same arguments as the
+dls-vds-gen.py command line tool. It keeps h5py loaded and caches source
+metadata and virtual layouts between requests, so regenerating a VDS once the
+last raw file is closed costs a stat of each source file and a VDS write.
+
+Requests and responses are single lines of JSON:
+
+    > {"args": ["/scratch/images", "-p", "stripe_"], "cwd": "/home/user"}
+    < {"status": "ok", "output": "/scratch/images/stripe_vds.h5", "time": 0.01}
+
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn, UnixStreamServer, \
+    StreamRequestHandler
+
+from . import app
+from .cache import LayoutCache, MetadataCache
+from .vdsgenerator import VDSGenerator
+
+
+class RequestError(ValueError):
+
+    """An invalid request, to be reported back to the client."""
+
+
+class RequestParser(ArgumentParser):
+
+    """An ArgumentParser that raises for invalid requests, not exits."""
+
+    def error(self, message):
+        raise RequestError(message)
+
+    def exit(self, status=0, message=None):
+        raise RequestError(message or "Parser exited with status {}".format(
+            status))
+
+
+class _UnixServer(ThreadingMixIn, UnixStreamServer):
+
+    daemon_threads = True
+    vds_server = None
+
+
+class _RequestHandler(StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        response = self.server.vds_server.handle_request(line)
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class VDSServer(object):
+
+    """A server to generate VDS files on request from a local socket."""
+
+    # Default Values
+    workers = 4  # Requests processed concurrently
+    queue_size = 16  # Requests waiting for a worker before rejecting more
+    socket_mode = 0o600  # Permissions of the socket - owner only
+
+    def __init__(self, socket_path, workers=None, queue_size=None,
+                 socket_mode=None, log_level=None):
+        """
+        Args:
+            socket_path(str): Path of Unix socket to listen on
+            workers(int): Number of requests to process concurrently
+            queue_size(int): Number of requests to queue when all workers
+                are busy - any more are rejected
+            socket_mode(int): Permissions of the socket, e.g. 0o660 to let
+                the group send requests
+            log_level(int): Logging level (off=3, info=2, debug=1) -
+                Default is info
+
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel((log_level or VDSGenerator.log_level) * 10)
+
+        if workers is not None:
+            self.workers = workers
+        if queue_size is not None:
+            self.queue_size = queue_size
+        if socket_mode is not None:
+            self.socket_mode = socket_mode
+
+        self.socket_path = socket_path
+        self.metadata_cache = MetadataCache()
+        self.layout_cache = LayoutCache()
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(
+            self.workers + self.queue_size)
+        self._output_locks = {}
+        self._output_locks_lock = threading.Lock()
+
+        # Clients can write files anywhere this process can, so by default
+        # only the owner may connect - set before listening
+        self._server = _UnixServer(socket_path, _RequestHandler,
+                                   bind_and_activate=False)
+        self._server.vds_server = self
+        try:
+            self._server.server_bind()
+            os.chmod(socket_path, self.socket_mode)
+            self._server.server_activate()
+        except Exception:
+            self._server.server_close()
+            raise
+
+    def serve_forever(self):
+        """Handle requests until shutdown is called."""
+        self.logger.info("Listening on %s", self.socket_path)
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop serve_forever - must be called from another thread."""
+        self._server.shutdown()
+
+    def close(self):
+        """Release the socket and worker threads."""
+        self._server.server_close()
+        self._executor.shutdown(wait=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def handle_request(self, line):
+        """Process a request and create the response to send back.
+
+        Args:
+            line(bytes): JSON encoded request
+
+        Returns:
+            dict: Response with status "ok" or "error"
+
+        """
+        if not self._slots.acquire(False):
+            return dict(status="error",
+                        message="Server busy - {} requests already "
+                                "queued".format(self.queue_size))
+        try:
+            request = json.loads(line.decode("utf-8"))
+            future = self._executor.submit(
+                self.generate, request["args"], request.get("cwd"))
+            return future.result()
+        except Exception as error:
+            self.logger.error("Request %s failed: %s", line, error)
+            return dict(status="error", message=str(error))
+        finally:
+            self._slots.release()
+
+    def generate(self, argv, cwd=None):
+        """Generate a VDS from command line arguments.
+
+        Args:
+            argv(list(str)): Arguments, as for dls-vds-gen.py
+            cwd(str): Directory to resolve a relative path against
+
+        Returns:
+            dict: Response with the output file and time taken
+
+        """
+        start = time.time()
+        args = app.parse_args(argv, parser_class=RequestParser)
+        if args.watch:
+            raise RequestError("Cannot --watch in a server request")
+        if cwd is not None:
+            args.path = os.path.join(cwd, args.path)
+
+        gen = app.create_generator(args, self.metadata_cache)
+
+        # The layout only depends on the arguments and the source metadata
+        key = (repr(sorted(vars(args).items())), tuple(gen.files),
+               gen.source_metadata)
+        with self._output_lock(gen.output_file):
+            if gen.up_to_date:
+                pass
+            elif args.shard_mappings or args.shard_frames:
+                gen.generate_sharded_vds(args.shard_mappings,
+                                         args.shard_frames)
+            else:
+                virtual_layout = self.layout_cache.get(
+                    key, gen.create_target_layout)
+                gen.generate_vds(virtual_layout=virtual_layout)
+            if args.verify:
+                app.verify(gen)
+            if args.preview:
+                app.preview(gen, args.preview)
+
+        elapsed = time.time() - start
+        self.logger.info("Created %s in %.1fms", gen.output_file,
+                         elapsed * 1000)
+        return dict(status="ok", output=gen.output_file, time=elapsed)
+
+    def _output_lock(self, output_file):
+        # Serialise requests writing to the same VDS file
+        with self._output_locks_lock:
+            return self._output_locks.setdefault(output_file,
+                                                 threading.Lock())
+
+
+def send_request(socket_path, argv, timeout=None):
+    """Send a request to a running VDSServer and wait for the response.
+
+    Args:
+        socket_path(str): Path of Unix socket the server is listening on
+        argv(list(str)): Arguments, as for dls-vds-gen.py
+        timeout(float): Seconds to wait for the response - Default is forever
+
+    Returns:
+        dict: Response with status "ok" or "error"
+
+    """
+    request = dict(args=list(argv), cwd=os.getcwd())
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        response = b""
+        while not response.endswith(b"\n"):
+            data = client.recv(4096)
+            if not data:
+                break
+            response += data
+    finally:
+        client.close()
+
+    return json.loads(response.decode("utf-8"))
+
+
+def remove_stale_socket(socket_path):
+    """Remove a socket left behind by a server that is no longer running.
+
+    Args:
+        socket_path(str): Path of Unix socket to listen on
+
+    Raises:
+        IOError: If a server is still listening on the socket
+
+    """
+    if not os.path.exists(socket_path):
+        return
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)  # Nothing listening
+        return
+    finally:
+        client.close()
+    raise IOError("A server is already listening on {}".format(socket_path))
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Serve VDS generation requests on a Unix socket. Send "
+                    "requests with dls-vds-gen.py --server <socket> ...",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "socket", type=str, help="Path of Unix socket to listen on.")
+    parser.add_argument(
+        "-w", "--workers", type=int, dest="workers",
+        default=VDSServer.workers,
+        help="Number of requests to process concurrently.")
+    parser.add_argument(
+        "-q", "--queue-size", type=int, dest="queue_size",
+        default=VDSServer.queue_size,
+        help="Number of requests to queue when all workers are busy.")
+    parser.add_argument(
+        "-m", "--socket-mode", type=lambda value: int(value, 8),
+        dest="socket_mode", default=oct(VDSServer.socket_mode),
+        help="Permissions of the socket, in octal.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+
+    # Import h5py now rather than in the first request
+    import h5py  # noqa: F401
+
+    remove_stale_socket(args.socket)
+
+    server = VDSServer(args.socket, workers=args.workers,
+                       queue_size=args.queue_size,
+                       socket_mode=args.socket_mode, log_level=args.log_level)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
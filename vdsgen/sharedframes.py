@@ -0,0 +1,556 @@
+"""Read the frames of a VDS once and share them with many processes.
+
+A SharedFrameReader reads each frame through the VDS once, straight into a
+slot of a FrameRing - a ring buffer in shared memory. Consumer processes
+attach to the ring and get every frame as a NumPy view of its slot, without
+copying or reading the VDS themselves. A slot is only reused once every
+consumer has moved past it, so the reader is held back by the slowest
+consumer rather than overwriting frames it has not seen.
+
+The control block of the ring is only accessed while holding a
+multiprocessing Condition, which orders the frame data before the count of
+frames published. The Condition cannot be looked up by name, so consumers
+must be started by the process that creates the ring, and given it.
+
+Example:
+    # Service
+    with SharedFrameReader("/scratch/images/image.h5", consumers=4) as reader:
+        start_workers(reader.name, reader.condition, 4)
+        reader.serve()
+
+    # Worker idx
+    with FrameRing.attach(name, condition) as ring:
+        for frame_idx, frame in ring.frames(idx):
+            process(frame)
+
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import importlib
+import multiprocessing
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from .vdsgenerator import VDSGenerator
+
+HEADER_BYTES = 4096  # JSON description of the ring, padded
+# Control fields, followed by the cursor and then the process id of each
+# consumer
+PUBLISHED, CLOSED, READER = 0, 1, 2
+CONTROL_FIELDS = 3
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Read the frames of a VDS once into a shared memory ring "
+                    "buffer, and pass every frame to each of a number of "
+                    "consumer processes.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "file", type=str, help="VDS file to read.")
+    parser.add_argument(
+        "consumer", type=str,
+        help="Function to call with the index and data of every frame, in "
+             "each consumer process, as module:function.")
+    parser.add_argument(
+        "-n", "--node", type=str, dest="node",
+        default=VDSGenerator.target_node, help="Dataset to read.")
+    parser.add_argument(
+        "-c", "--consumers", type=int, dest="consumers",
+        default=SharedFrameReader.consumers,
+        help="Number of consumer processes to start.")
+    parser.add_argument(
+        "-s", "--slots", type=int, dest="slots",
+        default=SharedFrameReader.slots,
+        help="Number of frames in the ring buffer.")
+    parser.add_argument(
+        "--name", type=str, dest="name", default=None,
+        help="Name of shared memory. Default is a random name.")
+    parser.add_argument(
+        "--timeout", type=float, dest="timeout", default=FrameRing.timeout,
+        help="Seconds to wait for the slowest consumer before failing.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def attach_memory(name):
+    """Attach to existing shared memory without tracking it.
+
+    Before Python 3.13 the resource tracker of a process unlinks all of the
+    shared memory it has seen when the process exits - including memory it
+    only attached to, which other consumers are still using. So the memory
+    is unregistered from the tracker again once attached.
+
+    Args:
+        name(str): Name of shared memory
+
+    Returns:
+        SharedMemory: Shared memory
+
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    memory = shared_memory.SharedMemory(name=name)
+    if os.name == "posix":
+        # Registered under the name with a leading /
+        resource_tracker.unregister("/" + memory.name, "shared_memory")
+    return memory
+
+
+def process_exists(pid):
+    """Check if a process is running.
+
+    Args:
+        pid(int): Process id
+
+    Returns:
+        bool: True if the process exists
+
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, but owned by another user
+    return True
+
+
+class FrameRing(object):
+
+    """A ring buffer of frames in shared memory, read by every consumer.
+
+    The shared memory holds a JSON header describing the ring, an int64
+    control block (frames published, closed flag, process id of the reader,
+    and the number of frames each consumer has finished with and its
+    process id), the frame index in each slot and then the slots themselves.
+    The control block and frame indices are only accessed with the
+    condition held.
+
+    """
+
+    # Default Values
+    timeout = 60.0  # Seconds to wait for the other side of the ring
+    poll_interval = 0.1  # Seconds between checks that processes are alive
+
+    def __init__(self, memory, condition, frame_shape, dtype, slots,
+                 consumers, owner=False):
+        """
+        Args:
+            memory(SharedMemory): Shared memory of ring
+            condition(multiprocessing.Condition): Condition guarding the
+                control block
+            frame_shape(tuple(int)): Shape of each frame
+            dtype: Data type of frames
+            slots(int): Number of frames in ring
+            consumers(int): Number of consumers
+            owner(bool): Whether to unlink the memory when closed
+
+        """
+        self.memory = memory
+        self.condition = condition
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.consumers = consumers
+        self.owner = owner
+
+        control_size = CONTROL_FIELDS + 2 * consumers
+        self._control = np.ndarray(control_size, dtype=np.int64,
+                                   buffer=memory.buf, offset=HEADER_BYTES)
+        self._cursors = self._control[CONTROL_FIELDS:][:consumers]
+        self._pids = self._control[CONTROL_FIELDS + consumers:]
+        offset = HEADER_BYTES + self._control.nbytes
+        self._frame_indices = np.ndarray(slots, dtype=np.int64,
+                                         buffer=memory.buf, offset=offset)
+        offset += self._frame_indices.nbytes
+        self._data = np.ndarray((slots,) + self.frame_shape,
+                                dtype=self.dtype, buffer=memory.buf,
+                                offset=offset)
+
+    @property
+    def name(self):
+        """str: Name of the shared memory, for consumers to attach to."""
+        return self.memory.name
+
+    @classmethod
+    def create(cls, frame_shape, dtype, slots, consumers, name=None):
+        """Create a ring in new shared memory.
+
+        Args:
+            frame_shape(tuple(int)): Shape of each frame
+            dtype: Data type of frames
+            slots(int): Number of frames in ring
+            consumers(int): Number of consumers
+            name(str): Name of shared memory - Default is a random name
+
+        Returns:
+            FrameRing: Ring owning the memory, with a new condition
+
+        """
+        dtype = np.dtype(dtype)
+        header = json.dumps(dict(frame_shape=list(frame_shape),
+                                 dtype=dtype.str, slots=slots,
+                                 consumers=consumers)).encode("utf-8")
+        if len(header) >= HEADER_BYTES:
+            raise ValueError("Frame description too long")
+
+        size = HEADER_BYTES + \
+            8 * (CONTROL_FIELDS + 2 * consumers + slots) + \
+            slots * int(np.prod(frame_shape)) * dtype.itemsize
+        memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        memory.buf[:len(header)] = header
+        memory.buf[len(header):HEADER_BYTES] = \
+            b"\0" * (HEADER_BYTES - len(header))
+
+        ring = cls(memory, multiprocessing.Condition(), frame_shape, dtype,
+                   slots, consumers, owner=True)
+        with ring.condition:
+            ring._control[...] = 0
+            ring._control[READER] = os.getpid()
+        return ring
+
+    @classmethod
+    def attach(cls, name, condition):
+        """Attach to the ring in existing shared memory.
+
+        Args:
+            name(str): Name of shared memory
+            condition(multiprocessing.Condition): Condition of the ring, from
+                the process that created it
+
+        Returns:
+            FrameRing: Ring, not owning the memory
+
+        """
+        memory = attach_memory(name)
+        header = json.loads(bytes(memory.buf[:HEADER_BYTES])
+                            .rstrip(b"\0").decode("utf-8"))
+        return cls(memory, condition, header["frame_shape"], header["dtype"],
+                   header["slots"], header["consumers"])
+
+    def _wait(self, done, deadline, description):
+        # Wait, with the condition held, for done() - failing if a process
+        # waited for exits
+        while not done():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise IOError("Timed out waiting for {}".format(description))
+            self.condition.wait(min(remaining, self.poll_interval))
+
+    def _check_consumers(self, position):
+        # Fail if a consumer that has not reached position has exited
+        for consumer in range(self.consumers):
+            pid = int(self._pids[consumer])
+            if self._cursors[consumer] < position and pid and \
+                    not process_exists(pid):
+                raise IOError("Consumer {} (process {}) exited after {} "
+                              "frames".format(consumer, pid,
+                                              self._cursors[consumer]))
+
+    def reserve(self, timeout=None):
+        """Wait for a free slot, for the next frame.
+
+        Args:
+            timeout(float): Seconds to wait for the slowest consumer -
+                Default is FrameRing.timeout
+
+        Returns:
+            numpy.ndarray: View of slot to write the frame into
+
+        Raises:
+            IOError: If a consumer exits, or the timeout is reached
+
+        """
+        deadline = time.time() + (timeout or self.timeout)
+        with self.condition:
+            published = int(self._control[PUBLISHED])
+
+            def free():
+                self._check_consumers(published - self.slots + 1)
+                return published - self._cursors.min() < self.slots
+
+            self._wait(free, deadline, "consumers to free a slot")
+
+        return self._data[published % self.slots]
+
+    def commit(self, frame_index):
+        """Publish the frame written to the slot from reserve.
+
+        Args:
+            frame_index(int): Index of frame in VDS
+
+        """
+        with self.condition:
+            published = self._control[PUBLISHED]
+            self._frame_indices[published % self.slots] = frame_index
+            self._control[PUBLISHED] = published + 1
+            self.condition.notify_all()
+
+    def publish(self, frame_index, frame, timeout=None):
+        """Copy a frame into the next slot and publish it.
+
+        Args:
+            frame_index(int): Index of frame in VDS
+            frame(numpy.ndarray): Frame
+            timeout(float): Seconds to wait for the slowest consumer -
+                Default is FrameRing.timeout
+
+        """
+        self.reserve(timeout)[...] = frame
+        self.commit(frame_index)
+
+    def finish(self):
+        """Tell consumers that no more frames will be published."""
+        with self.condition:
+            self._control[CLOSED] = 1
+            self.condition.notify_all()
+
+    def wait_consumed(self, timeout=None):
+        """Wait for every consumer to finish with every frame published.
+
+        Args:
+            timeout(float): Seconds to wait - Default is FrameRing.timeout
+
+        Raises:
+            IOError: If a consumer exits, or the timeout is reached
+
+        """
+        deadline = time.time() + (timeout or self.timeout)
+        with self.condition:
+            published = int(self._control[PUBLISHED])
+
+            def consumed():
+                self._check_consumers(published)
+                return self._cursors.min() >= published
+
+            self._wait(consumed, deadline, "consumers to finish")
+
+    def frames(self, consumer, timeout=None):
+        """Iterate over the frames published, as views of the shared memory.
+
+        Each view is valid until the next frame is requested, when its slot
+        is released to the reader.
+
+        Args:
+            consumer(int): Id of consumer, from 0 to consumers - 1
+            timeout(float): Seconds to wait for each frame - Default is
+                FrameRing.timeout
+
+        Yields:
+            tuple(int, numpy.ndarray): Index of frame in VDS, and frame
+
+        Raises:
+            IOError: If the reader exits, or the timeout is reached
+
+        """
+        if not 0 <= consumer < self.consumers:
+            raise ValueError("Consumer must be from 0 to {}, got {}".format(
+                self.consumers - 1, consumer))
+
+        with self.condition:
+            self._pids[consumer] = os.getpid()
+            reader = int(self._control[READER])
+
+        while True:
+            with self.condition:
+                position = int(self._cursors[consumer])
+
+                def ready():
+                    if not process_exists(reader):
+                        raise IOError("Reader (process {}) exited after {} "
+                                      "frames".format(reader, position))
+                    return position < self._control[PUBLISHED] or \
+                        self._control[CLOSED]
+
+                self._wait(ready, time.time() + (timeout or self.timeout),
+                           "frame {}".format(position))
+                if position >= self._control[PUBLISHED]:
+                    return  # Closed, and every frame read
+                slot = position % self.slots
+                frame_idx = int(self._frame_indices[slot])
+
+            yield frame_idx, self._data[slot]
+            with self.condition:
+                self._cursors[consumer] = position + 1
+                self.condition.notify_all()
+
+    def close(self):
+        """Detach from the shared memory, and unlink it if owned."""
+        # Views must be released before the memory can be closed
+        del self._control, self._cursors, self._pids, self._frame_indices, \
+            self._data
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_consumer(target, name, condition, consumer, timeout=None):
+    """Pass every frame of a ring to a function.
+
+    Args:
+        target(str): Function to call with the index and data of each frame,
+            as module:function
+        name(str): Name of shared memory of ring
+        condition(multiprocessing.Condition): Condition of ring
+        consumer(int): Id of consumer
+        timeout(float): Seconds to wait for each frame - Default is
+            FrameRing.timeout
+
+    """
+    module, function = target.split(":")
+    function = getattr(importlib.import_module(module), function)
+    with FrameRing.attach(name, condition) as ring:
+        for frame_idx, frame in ring.frames(consumer, timeout):
+            function(frame_idx, frame)
+
+
+class SharedFrameReader(object):
+
+    """Read the frames of a VDS into a FrameRing for consumer processes."""
+
+    logger = logging.getLogger("SharedFrameReader")
+
+    # Default Values
+    slots = 8  # Frames in ring buffer
+    consumers = 1  # Processes reading every frame
+
+    def __init__(self, file_path, node=None, slots=None, consumers=None,
+                 name=None, log_level=None):
+        """
+        Args:
+            file_path(str): Path to VDS file
+            node(str): Dataset to read - Default is data
+            slots(int): Frames in ring buffer
+            consumers(int): Number of consumers that will attach
+            name(str): Name of shared memory - Default is a random name
+            log_level(int): Logging level (off=3, info=2, debug=1) -
+                Default is info
+
+        """
+        import h5py as h5
+
+        self.logger.setLevel((log_level or VDSGenerator.log_level) * 10)
+
+        # Overwrite default values with arguments, if given
+        if slots is not None:
+            self.slots = slots
+        if consumers is not None:
+            self.consumers = consumers
+
+        self.file_path = file_path
+        self.node = node or VDSGenerator.target_node
+
+        with h5.File(file_path, "r") as h5_file:
+            dataset = h5_file[self.node]
+            shape, dtype = dataset.shape, dataset.dtype
+        frames, height, width = VDSGenerator.parse_shape(shape)
+        self.frame_shape = tuple(frames)
+
+        self.ring = FrameRing.create((height, width), dtype, self.slots,
+                                     self.consumers, name=name)
+
+    @property
+    def name(self):
+        """str: Name of the shared memory, for consumers to attach to."""
+        return self.ring.name
+
+    @property
+    def condition(self):
+        """multiprocessing.Condition: Condition to give consumers."""
+        return self.ring.condition
+
+    def serve(self, timeout=None):
+        """Read every frame into the ring and wait for consumers to finish.
+
+        Args:
+            timeout(float): Seconds to wait for the slowest consumer -
+                Default is FrameRing.timeout
+
+        Returns:
+            int: Number of frames published
+
+        Raises:
+            IOError: If a consumer exits, or the timeout is reached
+
+        """
+        import h5py as h5
+
+        frames = int(np.prod(self.frame_shape))
+        start = time.time()
+        with h5.File(self.file_path, "r") as h5_file:
+            dataset = h5_file[self.node]
+            for frame_idx in range(frames):
+                slot = self.ring.reserve(timeout)
+                dataset.read_direct(slot, source_sel=np.unravel_index(
+                    frame_idx, self.frame_shape))
+                self.ring.commit(frame_idx)
+
+        self.ring.finish()
+        self.ring.wait_consumed(timeout)
+        self.logger.info("Shared %s frames of %s with %s consumers in %.1fs",
+                         frames, self.file_path, self.consumers,
+                         time.time() - start)
+        return frames
+
+    def close(self):
+        """Release the shared memory."""
+        self.ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+
+    with SharedFrameReader(args.file, args.node, slots=args.slots,
+                           consumers=args.consumers, name=args.name,
+                           log_level=args.log_level) as reader:
+        processes = [
+            multiprocessing.Process(target=run_consumer, args=(
+                args.consumer, reader.name, reader.condition, consumer,
+                args.timeout))
+            for consumer in range(args.consumers)]
+        for process in processes:
+            process.start()
+        try:
+            reader.serve(timeout=args.timeout)
+        except BaseException:
+            for process in processes:
+                process.terminate()
+            raise
+        finally:
+            for process in processes:
+                process.join()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
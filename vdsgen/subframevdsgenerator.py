@@ -1,7 +1,5 @@
 """A class for generating virtual dataset frames from sub-frames."""
 
-import h5py as h5
-
 from .vdsgenerator import VDSGenerator, SourceMeta
 
 
@@ -9,6 +7,9 @@ class SubFrameVDSGenerator(VDSGenerator):
 
     """A class to generate Virtual Dataset frames from sub-frames."""
 
+    FINGERPRINT_ATTRIBUTES = VDSGenerator.FINGERPRINT_ATTRIBUTES + (
+        "stripe_spacing", "module_spacing")
+
     # Default Values
     stripe_spacing = 10  # Pixel spacing between stripes in a module
     module_spacing = 10  # Pixel spacing between modules
@@ -16,7 +17,7 @@ class SubFrameVDSGenerator(VDSGenerator):
     def __init__(self, path, prefix=None, files=None, output=None, source=None,
                  source_node=None, target_node=None, fill_value=None,
                  stripe_spacing=None, module_spacing=None,
-                 log_level=None):
+                 log_level=None, **kwargs):
         """
         Args:
             path(str): Root folder to find raw files and create VDS
@@ -33,18 +34,19 @@ class SubFrameVDSGenerator(VDSGenerator):
             module_spacing(int): Spacing between modules
             log_level(int): Logging level (off=3, info=2, debug=1) -
                 Default is info
+            kwargs: Other VDSGenerator arguments, e.g. nodes
 
         """
-        super(SubFrameVDSGenerator, self).__init__(
-            path, prefix, files, output, source, source_node, target_node,
-            fill_value, log_level)
-
         # Overwrite default values with arguments, if given
         if stripe_spacing is not None:
             self.stripe_spacing = stripe_spacing
         if module_spacing is not None:
             self.module_spacing = module_spacing
 
+        super(SubFrameVDSGenerator, self).__init__(
+            path, prefix, files, output, source, source_node, target_node,
+            fill_value, log_level, **kwargs)
+
     def process_source_datasets(self):
         """Grab data from the given HDF5 files and check for consistency.
 
@@ -111,13 +113,12 @@ class SubFrameVDSGenerator(VDSGenerator):
                           "  Shape: %s\n"
                           "  Spacing: %s", target_shape, spacing)
 
-        v_layout = h5.VirtualLayout(target_shape, source_meta.dtype)
+        v_layout = self.new_virtual_layout(target_shape, source_meta.dtype)
 
         current_position = 0
         for stripe_idx, file_path in enumerate(self.files):
-            v_source = h5.VirtualSource(
-                file_path, name=self.source_node,
-                shape=source_shape, dtype=source_meta.dtype
+            v_source = self.new_virtual_source(
+                file_path, shape=source_shape, dtype=source_meta.dtype
             )
 
             start = current_position
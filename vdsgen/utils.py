@@ -0,0 +1,24 @@
+"""Argument types shared by the command line tools."""
+
+from argparse import ArgumentTypeError
+
+
+def frame_range_type(value):
+    """Parse a START:STOP[:STEP] frame range argument.
+
+    Args:
+        value(str): Argument, with empty entries for the defaults of a slice
+
+    Returns:
+        tuple: start, stop and step - int or None
+
+    """
+    parts = value.split(":")
+    if len(parts) not in (2, 3):
+        raise ArgumentTypeError("Expected START:STOP[:STEP], got {}".format(
+            value))
+    try:
+        return tuple(int(part) if part else None
+                     for part in parts + [""] * (3 - len(parts)))
+    except ValueError:
+        raise ArgumentTypeError("Expected integers, got {}".format(value))
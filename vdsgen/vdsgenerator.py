@@ -2,13 +2,155 @@
 
 import os
 import re
+import hashlib
 import logging
 
 from collections import namedtuple
 
-import h5py as h5
+# h5py is imported where it is used, so that the command line tool can parse
+# arguments (and print --help) without loading h5py and NumPy
 
 SourceMeta = namedtuple("SourceMeta", ["frames", "height", "width", "dtype"])
+# A dataset mapped alongside the source node - shape excludes the frame axes
+NodeMeta = namedtuple("NodeMeta", ["node", "shape", "dtype"])
+
+
+def find_source_files(path, prefix):
+    """Find HDF5 files in given folder with given prefix.
+
+    Args:
+        path(str): Folder to search
+        prefix(str): Prefix of HDF5 files, followed by an index
+
+    Returns:
+        list: HDF5 files in folder that have the given prefix
+
+    """
+    regex = re.compile(prefix + r"\d+\.(hdf5|hdf|h5)")
+
+    files = []
+    for file_ in sorted(os.listdir(path)):
+        if re.match(regex, file_):
+            files.append(os.path.abspath(os.path.join(path, file_)))
+
+    if len(files) == 0:
+        raise IOError("No files matching pattern found. Got path: {path}, "
+                      "prefix: {prefix}".format(path=path, prefix=prefix))
+
+    return files
+
+
+def read_metadata(file_path, node, nodes=()):
+    """Read the shape and data type of a dataset in an HDF5 file.
+
+    Args:
+        file_path(str): Path to HDF5 file
+        node(str): Dataset in file
+        nodes(list(str)): Other datasets in file with the same frame axes,
+            to read in the same pass
+
+    Returns:
+        dict: Number of frames, height, width and data type of dataset, and
+            a NodeMeta for each of nodes, if given
+
+    """
+    import h5py as h5
+
+    h5_file = h5.File(file_path, 'r')
+    h5_data = h5_file[node]
+    frames, height, width = VDSGenerator.parse_shape(h5_data.shape)
+    data_type = h5_data.dtype
+
+    metadata = dict(frames=frames, height=height, width=width,
+                    dtype=data_type)
+
+    if nodes:
+        node_metadata = []
+        for node_ in nodes:
+            h5_node = h5_file[node_]
+            if tuple(h5_node.shape[:len(frames)]) != tuple(frames):
+                raise ValueError(
+                    "Node {node} in {file} has shape {shape} - expected "
+                    "frames {frames}".format(node=node_, file=file_path,
+                                             shape=h5_node.shape,
+                                             frames=frames))
+            node_metadata.append(NodeMeta(
+                node=node_, shape=tuple(h5_node.shape[len(frames):]),
+                dtype=h5_node.dtype))
+        metadata["nodes"] = tuple(node_metadata)
+
+    return metadata
+
+
+def _frame_axes_selection(key, rank, shape):
+    # Expand key to rank axes, then replace the last two (height and width)
+    # with whole selections of the axes in shape
+    if not isinstance(key, tuple):
+        key = (key,)
+    for idx, axis in enumerate(key):
+        if axis is Ellipsis:
+            key = key[:idx] + (slice(None),) * (rank - len(key) + 1) + \
+                key[idx + 1:]
+            break
+    key = key + (slice(None),) * (rank - len(key))
+
+    return key[:-2] + (slice(None),) * len(shape)
+
+
+def _selection_key(selection):
+    # Hashable form of a selection, to compare them
+    key = []
+    for axis in selection:
+        if isinstance(axis, slice):
+            key.append(("slice", axis.start, axis.stop, axis.step))
+        elif hasattr(axis, "block"):  # MultiBlockSlice
+            key.append(("blocks", axis.start, axis.stride, axis.count,
+                        axis.block))
+        else:
+            key.append(axis)
+    return tuple(key)
+
+
+class _FrameAxesSource(object):
+
+    """A VirtualSource of a node, indexed as if it had the source shape."""
+
+    def __init__(self, source, shape, node_shape):
+        self.source = source
+        self.shape = shape
+        self.node_shape = node_shape
+
+    def __getitem__(self, key):
+        return self.source[
+            _frame_axes_selection(key, len(self.shape), self.node_shape)]
+
+
+class _FrameAxesLayout(object):
+
+    """A VirtualLayout of a node, indexed as if it had the target shape.
+
+    Mappings are projected onto the frame axes, and mappings to frames that
+    are already mapped (e.g. from another stripe of the same frames) are
+    dropped.
+
+    """
+
+    def __init__(self, layout, shape, node_shape):
+        self.layout = layout
+        self.shape = shape
+        self.node_shape = node_shape
+        self._mapped = set()
+
+    def __setitem__(self, key, source):
+        selection = _frame_axes_selection(key, len(self.shape),
+                                          self.node_shape)
+        if _selection_key(selection) in self._mapped:
+            return
+        self._mapped.add(_selection_key(selection))
+
+        if isinstance(source, _FrameAxesSource):
+            source = source.source
+        self.layout[selection] = source
 
 
 class VDSGenerator(object):
@@ -20,6 +162,11 @@ class VDSGenerator(object):
     APPEND = "a"
     READ = "r"
     FULL_SLICE = slice(None)
+    FINGERPRINT = "vdsgen_fingerprint"  # Attribute of target node
+    # Attributes that, with the source files, determine the VDS
+    FINGERPRINT_ATTRIBUTES = ("source_node", "target_node", "fill_value",
+                              "nodes", "roi", "frame_range", "frame_index",
+                              "relative_paths")
 
     # Default Values
     fill_value = -1  # Fill value for spacing
@@ -27,10 +174,25 @@ class VDSGenerator(object):
     target_node = "data"  # Data node in VDS file
     mode = CREATE  # Write mode for vds file
     log_level = 2
+    metadata_cache = None  # Shared cache.MetadataCache, e.g. in the server
+    nodes = ()  # (source, target) node pairs mapped alongside the data
+    node_metadata = ()  # NodeMeta of each of nodes, from the source files
+    roi = None  # (y, x, height, width) region of the VDS frames to map
+    frame_range = None  # (start, stop, step) of the first frame axis to map
+    frame_index = False  # Whether to write a FrameIndex with the VDS
+    relative_paths = False  # Whether to map sources relative to the VDS
+    fingerprint = None  # Digest of the inputs, stored with the VDS
+    skip_unchanged = False  # Whether to skip writing an unchanged VDS
+    up_to_date = False  # Whether the output already matches the fingerprint
+    target_layout = None  # Layout of the target node last generated
+    _node = None  # NodeMeta of the node a layout is being created for
+    _planning = False  # Whether layouts are being created as LayoutPlans
 
     def __init__(self, path, prefix=None, files=None, output=None, source=None,
                  source_node=None, target_node=None, fill_value=None,
-                 log_level=None):
+                 log_level=None, nodes=None, roi=None, frame_range=None,
+                 skip_unchanged=False, frame_index=None,
+                 relative_paths=None):
         """
         Args:
             path(str): Root folder to find raw files and create VDS
@@ -45,6 +207,25 @@ class VDSGenerator(object):
             fill_value(int): Fill value for spacing
             log_level(int): Logging level (off=3, info=2, debug=1) -
                 Default is info
+            nodes(list): Other nodes in the source files to map with the same
+                geometry, in the same pass - (source, target) node pairs, or
+                node names to use for both. Nodes with frames of a different
+                shape (e.g. per-frame timestamps) are mapped by frame.
+            roi(tuple(int)): (y, x, height, width) region of the frames of the
+                VDS, after any gaps and stripes, to map - Default is all
+            frame_range(tuple(int)): (start, stop, step) of the frames of the
+                VDS to map, as for a slice - entries may be None. Selects
+                along the first frame axis, e.g. rows of a reshaped scan.
+                Default is all frames
+            skip_unchanged(bool): Don't write the VDS if the output file
+                already has one with the same fingerprint - the generator
+                class and options, and the path, size and modification time
+                of each source file. The source files are then not opened.
+                An earlier VDS with a different fingerprint is replaced.
+            frame_index(bool): Write a FrameIndex of the source file and
+                frame of each frame in <target node>_frame_index
+            relative_paths(bool): Store source paths relative to the VDS
+                file, so the VDS and sources can be moved together
 
         """
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -53,6 +234,18 @@ class VDSGenerator(object):
         if (prefix is None and files is None) or \
                 (prefix is not None and files is not None):
             raise ValueError("One, and only one, of prefix or files required.")
+        if nodes and source is not None:
+            raise ValueError("Cannot map nodes of raw files that don't exist "
+                             "yet.")
+        if roi is not None and (len(roi) != 4 or min(roi[:2]) < 0 or
+                                min(roi[2:]) < 1):
+            raise ValueError("ROI must be (y, x, height, width) with a "
+                             "positive size, got {}".format(roi))
+        if frame_range is not None and (
+                len(frame_range) != 3 or
+                (frame_range[2] is not None and frame_range[2] < 1)):
+            raise ValueError("Frame range must be (start, stop, step) with a "
+                             "positive step, got {}".format(frame_range))
 
         self.path = path
 
@@ -65,6 +258,18 @@ class VDSGenerator(object):
             self.fill_value = fill_value
         if log_level is not None:
             self.logger.setLevel(log_level * 10)
+        if roi is not None:
+            self.roi = tuple(roi)
+        if frame_range is not None:
+            self.frame_range = tuple(frame_range)
+        if frame_index is not None:
+            self.frame_index = frame_index
+        if relative_paths is not None:
+            self.relative_paths = relative_paths
+        if nodes:
+            self.nodes = tuple(
+                (node, node) if isinstance(node, str) else tuple(node)
+                for node in nodes)
 
         # If Files not given, find files using path and prefix.
         if files is None:
@@ -81,21 +286,35 @@ class VDSGenerator(object):
             self.name = self.construct_vds_name(files)
         else:
             self.name = output
+        self.output_file = os.path.abspath(os.path.join(self.path, self.name))
 
-        # If source not given, check files exist and get metadata.
-        if source is None:
-            for file_ in self.files:
-                if not os.path.isfile(file_):
-                    raise IOError(
-                        "File {} does not exist. To create VDS from raw "
-                        "files that haven't been created yet, source "
-                        "must be provided.".format(file_))
-            self.source_metadata = self.process_source_datasets()
-        # Else, store given source metadata
-        else:
+        # If source given, store given source metadata
+        self.source_metadata = None
+        if source is not None:
             self.source_metadata = self.process_source_metadata(source)
 
-        self.output_file = os.path.abspath(os.path.join(self.path, self.name))
+        self.skip_unchanged = skip_unchanged
+        self.fingerprint = self.create_fingerprint()
+        if skip_unchanged and self.check_fingerprint():
+            self.logger.info("VDS at %s is up to date", self.output_file)
+            self.up_to_date = True
+        # Else, if source not given, check files exist and get metadata.
+        elif source is None:
+            self.read_sources()
+
+    def read_sources(self):
+        """Check the source files exist and read their metadata."""
+        self.check_files()
+        self.source_metadata = self.process_source_datasets()
+
+    def check_files(self):
+        """Check the source files exist."""
+        for file_ in self.files:
+            if not os.path.isfile(file_):
+                raise IOError(
+                    "File {} does not exist. To create VDS from raw "
+                    "files that haven't been created yet, source "
+                    "must be provided.".format(file_))
 
     def process_source_metadata(self, source):
         frames, height, width = self.parse_shape(source['shape'])
@@ -123,25 +342,369 @@ class VDSGenerator(object):
 
         return frames, height, width
 
-    def generate_vds(self):
-        """Generate a virtual dataset."""
+    @classmethod
+    def with_metadata_cache(cls, metadata_cache):
+        """Create a subclass that reads source metadata through a cache.
+
+        Generators scan their sources in __init__, so the cache is set on a
+        subclass rather than on an instance.
+
+        Args:
+            metadata_cache(MetadataCache): Cache to use
+
+        Returns:
+            type: Subclass of this class
+
+        """
+        return type(cls.__name__, (cls,),
+                    dict(metadata_cache=metadata_cache, __doc__=cls.__doc__))
+
+    def create_fingerprint(self):
+        """Create a fingerprint of the inputs of the VDS.
+
+        The options are taken from the attributes named in
+        FINGERPRINT_ATTRIBUTES once they are resolved, so the same VDS has
+        the same fingerprint however its generator was created.
+
+        Returns:
+            str: Digest of the generator class and options, the source
+                metadata if given, and the path, size and modification time of
+                each source file
+
+        """
+        options = [(name, getattr(self, name))
+                   for name in self.FINGERPRINT_ATTRIBUTES]
+
+        files = []
+        for file_ in self.files:
+            try:
+                stat = os.stat(file_)
+                files.append((file_, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                files.append((file_, None, None))  # Not created yet
+
+        inputs = repr((self.__class__.__name__, options,
+                       self.source_metadata, files))
+        return hashlib.sha1(inputs.encode("utf-8")).hexdigest()
+
+    def sharded_fingerprint(self, max_mappings, max_frames):
+        """Create a fingerprint of the inputs of a sharded VDS.
+
+        Args:
+            max_mappings(int): Maximum mappings in each shard
+            max_frames(int): Maximum frames in each shard
+
+        Returns:
+            str: Digest of the fingerprint and the shard budget, so it
+                differs from that of a VDS that is not sharded, or is
+                sharded differently
+
+        """
+        inputs = repr((self.fingerprint, "sharded", max_mappings, max_frames))
+        return hashlib.sha1(inputs.encode("utf-8")).hexdigest()
+
+    def check_fingerprint(self):
+        """Check if the output file already has a VDS with our fingerprint.
+
+        Returns:
+            bool: True if the target node of the output file has the same
+                fingerprint
+
+        """
+        import h5py as h5
+
+        if not os.path.isfile(self.output_file):
+            return False
+
+        try:
+            with h5.File(self.output_file, self.READ) as vds:
+                dataset = vds.get(self.target_node)
+                return dataset is not None and \
+                    dataset.attrs.get(self.FINGERPRINT) == self.fingerprint
+        except (IOError, OSError):
+            return False
+
+    @property
+    def target_nodes(self):
+        """list(str): Nodes this generator creates in the VDS file."""
+        targets = [self.target_node] + [target for _, target in self.nodes]
+        if self.frame_index:
+            targets.append(self.frame_index_node)
+        return targets
+
+    @property
+    def frame_index_node(self):
+        """str: Node of the FrameIndex in the VDS file."""
+        return "{}_frame_index".format(self.target_node.rstrip("/"))
+
+    @property
+    def shard_index_node(self):
+        """str: Node of the index of the shards of a sharded VDS."""
+        return "{}_shards".format(self.target_node.rstrip("/"))
+
+    @property
+    def layout_plan(self):
+        """LayoutPlan: Mappings of the target node last generated, or None."""
+        if self.target_layout is None:
+            return None
+        return self._layout_plan(self.target_layout)
+
+    def _layout_plan(self, layout):
+        from .layoutplan import LayoutPlan
+
+        if isinstance(layout, LayoutPlan):
+            return layout
+        return layout.to_plan(self.output_file)
+
+    def generate_vds(self, virtual_layout=None):
+        """Generate a virtual dataset.
+
+        Args:
+            virtual_layout(StreamingLayout): Layout to write (or a
+                LayoutPlan), if already created for this source metadata -
+                Default is to create it
+
+        """
+        import h5py as h5
+
+        if self.up_to_date:
+            return
+
+        if self.skip_unchanged:
+            self.remove_stale_output()
+        self.check_output()
+        layouts = self.create_layouts(virtual_layout)
+        self.target_layout = layouts[0][1]
+
+        self.logger.info("Creating VDS at %s", self.output_file)
+        with h5.File(self.output_file, self.mode, libver="latest") as vds:
+            self.write_layouts(vds, layouts)
+
+    def generate_sharded_vds(self, max_mappings=None, max_frames=None):
+        """Generate the VDS as shards of frames, with an index of the shards.
+
+        Each shard is a VDS of a range of frames (along the first frame axis)
+        in its own file, named after the output file, with at most
+        max_mappings mappings and max_frames frames. The output file gets a
+        VDS of the shards in each target node, and an index of the start and
+        stop frame and file name of each shard in <target node>_shards, so
+        readers of a window of frames can open just the shards they need.
+
+        The fingerprint stored includes the shard budget. With
+        skip_unchanged, a sharded VDS with the same fingerprint and shard
+        index is not rewritten - though, unlike a plain VDS, the sources are
+        read when the generator is created.
+
+        Args:
+            max_mappings(int): Maximum mappings in each shard
+            max_frames(int): Maximum frames in each shard
+
+        Returns:
+            list(str): Paths of the shard files
+
+        """
+        import numpy as np
+        import h5py as h5
+        from .layoutplan import LayoutPlan, PlanSource, shard_ranges
+
+        if max_mappings is None and max_frames is None:
+            raise ValueError("One of max_mappings or max_frames required")
+
+        index_node = self.shard_index_node
+        if self.fingerprint is not None:
+            self.fingerprint = self.sharded_fingerprint(max_mappings,
+                                                        max_frames)
+        if self.skip_unchanged and self.check_fingerprint():
+            shard_files = self.read_shard_index()
+            if shard_files is not None:
+                self.logger.info("Sharded VDS at %s is up to date",
+                                 self.output_file)
+                self.up_to_date = True
+                return shard_files
+
+        self.up_to_date = False
+        if self.source_metadata is None:
+            self.read_sources()  # Skipped for an up to date plain VDS
+        replacing = self.skip_unchanged and self.remove_stale_output()
+        self.check_output()
+        if self.mode == self.APPEND:
+            with h5.File(self.output_file, self.READ, libver="latest") as vds:
+                if vds.get(index_node) is not None:
+                    raise IOError("VDS {file} already has an entry for node "
+                                  "{node}".format(file=self.output_file,
+                                                  node=index_node))
+
+        plans = [(self.target_node, self.create_layout_plan())] + [
+            (target, self.create_layout_plan(node_meta))
+            for (_, target), node_meta in zip(self.nodes, self.node_metadata)]
+        ranges = shard_ranges([plan for _, plan in plans], max_mappings,
+                              max_frames)
+        self.target_layout = plans[0][1]
+
+        stem, ext = os.path.splitext(self.output_file)
+        digits = len(str(len(ranges) - 1))
+        shard_files = ["{stem}_shard{idx:0{digits}d}{ext}".format(
+            stem=stem, idx=idx, digits=digits, ext=ext)
+            for idx in range(len(ranges))]
+        existing = [file_ for file_ in shard_files if os.path.exists(file_)]
+        if existing and not replacing:  # Else left by the VDS replaced
+            raise IOError("Shard {} already exists".format(existing[0]))
+
+        for shard_file, (start, stop) in zip(shard_files, ranges):
+            self.logger.debug("Creating shard of frames %s to %s at %s",
+                              start, stop, shard_file)
+            layouts = [(target, plan.view(slice(start, stop)))
+                       for target, plan in plans]
+            with h5.File(shard_file, self.CREATE, libver="latest") as shard:
+                self.write_layouts(shard, layouts)
+
+        layouts = []
+        for target, plan in plans:
+            shards_plan = LayoutPlan(plan.shape, plan.dtype, plan.frame_axes)
+            for shard_file, (start, stop) in zip(shard_files, ranges):
+                shards_plan[start:stop] = PlanSource(
+                    shard_file, target, (stop - start,) + plan.shape[1:],
+                    plan.dtype)
+            layouts.append((target, shards_plan))
+
+        index = np.array(
+            [(start, stop, os.path.basename(shard_file))
+             for shard_file, (start, stop) in zip(shard_files, ranges)],
+            dtype=[("start", "i8"), ("stop", "i8"),
+                   ("file", h5.string_dtype())])
+
+        self.logger.info("Creating VDS of %s shards at %s", len(ranges),
+                         self.output_file)
+        with h5.File(self.output_file, self.mode, libver="latest") as vds:
+            # Before the layouts set the fingerprint, so it is never missing
+            # from a VDS matching the fingerprint
+            vds.create_dataset(index_node, data=index)
+            self.write_layouts(vds, layouts)
+
+        return shard_files
+
+    def read_shard_index(self):
+        """Read the shard files from the index of a sharded VDS.
+
+        Returns:
+            list(str): Paths of the shard files, or None if the output file
+                has no shard index
+
+        """
+        import h5py as h5
+
+        with h5.File(self.output_file, self.READ) as vds:
+            index = vds.get(self.shard_index_node)
+            if index is None:
+                return None
+            return [os.path.join(os.path.dirname(self.output_file),
+                                 file_.decode("utf-8"))
+                    for file_ in index["file"]]
+
+    def remove_stale_output(self):
+        """Remove an earlier VDS of the target nodes from the output file.
+
+        Only a VDS written with a fingerprint is removed, with any shards in
+        its shard index - so an unchanged VDS should be checked for first.
+
+        Returns:
+            bool: Whether a VDS was removed
+
+        """
+        import h5py as h5
+
+        if not os.path.isfile(self.output_file):
+            return False
+
+        with h5.File(self.output_file, self.READ) as vds:
+            dataset = vds.get(self.target_node)
+            if dataset is None or self.FINGERPRINT not in dataset.attrs:
+                return False
+        shard_files = self.read_shard_index() or []
+
+        self.logger.info("Removing out of date VDS at %s", self.output_file)
+        with h5.File(self.output_file, self.APPEND, libver="latest") as vds:
+            for node in self.target_nodes + [self.shard_index_node]:
+                if vds.get(node) is not None:
+                    del vds[node]
+        for shard_file in shard_files:
+            if os.path.isfile(shard_file):
+                os.remove(shard_file)
+        return True
+
+    def check_output(self):
+        """Check the target nodes can be created in the output file.
+
+        Sets the write mode to append if the file already exists.
+
+        """
+        import h5py as h5
+
         if os.path.isfile(self.output_file):
             with h5.File(self.output_file, self.READ, libver="latest") as vds:
-                node = vds.get(self.target_node)
-            if node is not None:
+                existing = [target for target in self.target_nodes
+                            if vds.get(target) is not None]
+            if existing:
                 raise IOError("VDS {file} already has an entry for node "
                               "{node}".format(file=self.output_file,
-                                              node=self.target_node))
+                                              node=existing[0]))
             else:
                 self.mode = self.APPEND
 
-        virtual_layout = self.create_virtual_layout(self.source_metadata)
+    def create_layouts(self, virtual_layout=None):
+        """Create the layouts of the target node and any other nodes.
 
-        self.logger.info("Creating VDS at %s", self.output_file)
-        with h5.File(self.output_file, self.mode, libver="latest") as vds:
-            self.validate_node(vds)
-            vds.create_virtual_dataset(self.target_node, virtual_layout,
-                                       fillvalue=self.fill_value)
+        Args:
+            virtual_layout(StreamingLayout): Layout of target node, if already
+                created for this source metadata - Default is to create it
+
+        Returns:
+            list(tuple(str, StreamingLayout)): Target nodes and their layouts
+                (or LayoutPlans), starting with the target node
+
+        """
+        if virtual_layout is None:
+            virtual_layout = self.create_target_layout()
+
+        return [(self.target_node, virtual_layout)] + [
+            (target, self.create_node_layout(node_meta))
+            for (_, target), node_meta in zip(self.nodes, self.node_metadata)]
+
+    def write_layouts(self, vds_file, layouts):
+        """Create virtual datasets in an open VDS file.
+
+        The layouts are written straight to the dataset creation property
+        list, rather than through a VirtualLayout. The fingerprint of the
+        inputs is stored on the target node, and the frame index is written
+        if requested.
+
+        Args:
+            vds_file(h5py.File): File to create datasets in
+            layouts(list(tuple(str, StreamingLayout))): Layouts (or
+                LayoutPlans) from create_layouts
+
+        """
+        (_, virtual_layout), node_layouts = layouts[0], layouts[1:]
+
+        self.validate_node(vds_file)
+        datasets = [(self.target_node, virtual_layout)] + [
+            (self.validate_node(vds_file, target), node_layout)
+            for target, node_layout in node_layouts]
+        for target, layout in datasets:
+            layout.create_virtual_dataset(
+                vds_file, target, fill_value=self.fill_value,
+                relative_paths=self.relative_paths)
+
+        if self.frame_index:
+            from .frameindex import FrameIndex
+            FrameIndex.from_plan(self._layout_plan(virtual_layout)).write(
+                vds_file, self.frame_index_node,
+                relative_paths=self.relative_paths)
+
+        # Set last, so only a complete VDS matches the fingerprint
+        if self.fingerprint is not None:
+            vds_file[self.target_node].attrs[self.FINGERPRINT] = \
+                self.fingerprint
 
     def find_files(self):
         """Find HDF5 files in given folder with given prefix.
@@ -150,21 +713,10 @@ class VDSGenerator(object):
             list: HDF5 files in folder that have the given prefix
 
         """
-        regex = re.compile(self.prefix + r"\d+\.(hdf5|hdf|h5)")
-
-        files = []
-        for file_ in sorted(os.listdir(self.path)):
-            if re.match(regex, file_):
-                files.append(os.path.abspath(os.path.join(self.path, file_)))
-
-        if len(files) == 0:
-            raise IOError("No files matching pattern found. Got path: {path}, "
-                          "prefix: {prefix}".format(path=self.path,
-                                                    prefix=self.prefix))
-        else:
-            self.logger.debug("Found datasets:\n  %s",
-                              ", ".join([f.split("/")[-1] for f in files]))
-            return files
+        files = find_source_files(self.path, self.prefix)
+        self.logger.debug("Found datasets:\n  %s",
+                          ", ".join([f.split("/")[-1] for f in files]))
+        return files
 
     def construct_vds_name(self, files):
         """Generate the file name for the VDS from the sub files.
@@ -192,11 +744,19 @@ class VDSGenerator(object):
             dict: Number of frames, height, width and data type of datasets
 
         """
-        h5_data = h5.File(file_path, 'r')[self.source_node]
-        frames, height, width = self.parse_shape(h5_data.shape)
-        data_type = h5_data.dtype
+        source_nodes = tuple(source for source, _ in self.nodes)
+        if self.metadata_cache is not None:
+            metadata = self.metadata_cache.get_metadata(
+                file_path, self.source_node,
+                lambda path_: read_metadata(path_, self.source_node,
+                                            source_nodes), source_nodes)
+        else:
+            metadata = read_metadata(file_path, self.source_node,
+                                     source_nodes)
 
-        return dict(frames=frames, height=height, width=width, dtype=data_type)
+        if source_nodes:
+            self.node_metadata = metadata["nodes"]
+        return metadata
 
     def process_source_datasets(self):
         """Grab data from the given HDF5 files and check for consistency.
@@ -220,19 +780,218 @@ class VDSGenerator(object):
         """
         raise NotImplementedError("Must be implemented in child class")
 
-    def validate_node(self, vds_file):
+    def create_target_layout(self):
+        """Create the layout of the target node.
+
+        Returns:
+            StreamingLayout: Layout of all of the frames, or a LayoutPlan of
+                just the frame range and ROI if given
+
+        """
+        if self.roi is None and self.frame_range is None:
+            return self.create_virtual_layout(self.source_metadata)
+        return self.create_layout_plan()
+
+    def create_node_layout(self, node_meta):
+        """Create the layout of another node with the same geometry.
+
+        Nodes with frames the same shape as the source node are mapped in the
+        same way. Other nodes are mapped by frame, taking the remaining axes
+        whole - so the mappings of any stripes or sub-frames of a frame after
+        the first are dropped, and any ROI is ignored.
+
+        Args:
+            node_meta(NodeMeta): Attributes of node in source files
+
+        Returns:
+            StreamingLayout: Layout of all of the frames, or a LayoutPlan of
+                just the frame range and ROI if given
+
+        """
+        if self.frame_range is not None or (
+                self.roi is not None and not self._frame_axes_only(node_meta)):
+            return self.create_layout_plan(node_meta)
+
+        self._node = node_meta
+        try:
+            v_layout = self.create_virtual_layout(self.source_metadata)
+        finally:
+            self._node = None
+
+        if isinstance(v_layout, _FrameAxesLayout):
+            v_layout = v_layout.layout
+        return v_layout
+
+    def create_layout_plan(self, node_meta=None):
+        """Create a LayoutPlan of the mappings of the virtual layout.
+
+        Args:
+            node_meta(NodeMeta): Attributes of another node to plan the layout
+                of - Default is the source node
+
+        Returns:
+            LayoutPlan: Mappings from create_virtual_layout, without h5py,
+                cut down to the frame range and ROI if given
+
+        """
+        self._planning = True
+        self._node = node_meta
+        try:
+            plan = self.create_virtual_layout(self.source_metadata)
+        finally:
+            self._planning = False
+            self._node = None
+
+        roi = self.roi
+        if isinstance(plan, _FrameAxesLayout):
+            plan = plan.layout
+            roi = None  # No frame geometry to crop
+        if roi is not None or self.frame_range is not None:
+            plan = self.view_layout_plan(plan, roi)
+        return plan
+
+    def view_layout_plan(self, plan, roi=None):
+        """Map only the frame range and ROI of a LayoutPlan.
+
+        Mappings outside of the view are dropped, and the rest are cut down to
+        the part inside it, so the VDS only reads those parts of the sources.
+
+        Args:
+            plan(LayoutPlan): Mappings of all of the frames
+            roi(tuple(int)): (y, x, height, width) region of the frames -
+                Default is whole frames
+
+        Returns:
+            LayoutPlan: Mappings of the view
+
+        """
+        key = [slice(None)] * len(plan.shape)
+        if self.frame_range is not None:
+            key[0] = slice(*self.frame_range)
+            if not len(range(*key[0].indices(plan.shape[0]))):
+                raise ValueError("Frame range {} selects none of {} "
+                                 "frames".format(self.frame_range,
+                                                 plan.shape[0]))
+        if roi is not None:
+            y, x, height, width = roi
+            if y + height > plan.shape[-2] or x + width > plan.shape[-1]:
+                raise ValueError("ROI {} is outside of frames of shape "
+                                 "{}".format(roi, plan.shape[-2:]))
+            key[-2:] = slice(y, y + height), slice(x, x + width)
+
+        view = plan.view(tuple(key))
+
+        self.logger.debug("View %s of frames %s maps from %s of %s sources",
+                          roi, self.frame_range,
+                          len(set(mapping.file_path
+                                  for mapping in view.mappings)),
+                          len(set(mapping.file_path
+                                  for mapping in plan.mappings)))
+        return view
+
+    def new_virtual_layout(self, shape, dtype):
+        """Create a VirtualLayout of the node a layout is being created for.
+
+        Args:
+            shape(tuple): Shape of VDS
+            dtype: Data type of VDS
+
+        Returns:
+            StreamingLayout: Layout to map sources into (or a LayoutPlan)
+
+        """
+        node = self._node
+        if node is None:
+            return self._new_layout(shape, dtype)
+        elif self._frame_axes_only(node):
+            return _FrameAxesLayout(
+                self._new_layout(shape[:-2] + node.shape, node.dtype),
+                shape, node.shape)
+        else:
+            return self._new_layout(shape, node.dtype)
+
+    def new_virtual_source(self, file_path, shape, dtype):
+        """Create a VirtualSource of the node a layout is being created for.
+
+        Args:
+            file_path(str): Path to source HDF5 file
+            shape(tuple): Shape of source dataset
+            dtype: Data type of source dataset
+
+        Returns:
+            PlanSource: Source to map into a layout
+
+        """
+        node = self._node
+        if node is None:
+            return self._new_source(file_path, self.source_node, shape, dtype)
+        elif self._frame_axes_only(node):
+            return _FrameAxesSource(
+                self._new_source(file_path, node.node,
+                                 shape[:-2] + node.shape, node.dtype),
+                shape, node.shape)
+        else:
+            return self._new_source(file_path, node.node, shape, node.dtype)
+
+    def _new_layout(self, shape, dtype):
+        if self._planning:
+            from .layoutplan import LayoutPlan
+            return LayoutPlan(shape, dtype)
+
+        from .layoutplan import StreamingLayout
+        return StreamingLayout(shape, dtype)
+
+    def _new_source(self, file_path, node, shape, dtype):
+        from .layoutplan import PlanSource
+
+        if not self._planning:
+            # Set into the property list as is, so stored as it will be
+            file_path = self.source_path(file_path)
+        return PlanSource(file_path, node, shape, dtype)
+
+    def source_path(self, file_path):
+        """Get the path to store for a source file in the VDS.
+
+        Args:
+            file_path(str): Path to source file
+
+        Returns:
+            str: file_path, or the path relative to the directory of the VDS
+                file if relative_paths is set
+
+        """
+        if self.relative_paths:
+            return os.path.relpath(file_path,
+                                   os.path.dirname(self.output_file))
+        return file_path
+
+    def _frame_axes_only(self, node_meta):
+        return tuple(node_meta.shape) != (self.source_metadata.height,
+                                          self.source_metadata.width)
+
+    def validate_node(self, vds_file, node=None):
         """Check if it is possible to create the given node.
 
         Create any sub-group of the target node if it doesn't exist.
 
         Args:
             vds_file(h5py.File): File to check for node
+            node(str): Node to check - Default is the target node
+
+        Returns:
+            str: The node, without any trailing /
 
         """
-        while self.target_node.endswith("/"):
-            self.target_node = self.target_node[:-1]
+        if node is None:
+            while self.target_node.endswith("/"):
+                self.target_node = self.target_node[:-1]
+            node = self.target_node
+        else:
+            node = node.rstrip("/")
 
-        if "/" in self.target_node:
-            sub_group = self.target_node.rsplit("/", 1)[0]
+        if "/" in node:
+            sub_group = node.rsplit("/", 1)[0]
             if vds_file.get(sub_group) is None:
                 vds_file.create_group(sub_group)
+
+        return node
@@ -0,0 +1,348 @@
+"""Check a VDS against its sources by sampling each mapping.
+
+Reading a whole VDS to check it costs as much as the data. Instead, a few
+frames of each mapping - the first, the last and some at random - and a few
+regions of those frames - the first and last corners and some at random - are
+read both through the VDS and directly from the source locations a plan of
+the mappings gives. The cost is in proportion to the number of mappings,
+whatever the size of the data.
+
+The plan can be the mappings stored in the VDS (resolving any virtual
+datasets it maps to their raw files), to check that the sources are all
+there and readable, or the plan of the generator that created it, to also
+check that the VDS maps what the generator intended.
+
+"""
+
+import sys
+import time
+import logging
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from collections import namedtuple
+
+import numpy as np
+
+from .flatten import flatten_plan
+from .vdsgenerator import VDSGenerator
+
+logger = logging.getLogger("VDSVerify")
+
+# A sampled region that differs - target and source are the selections of
+# the region in the VDS and in the source
+Mismatch = namedtuple("Mismatch", ["file_path", "node", "target", "source",
+                                   "reason"])
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Check a VDS against its sources by reading samples of "
+                    "each mapping through it and directly from the source.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "file", type=str, help="VDS file to check.")
+    parser.add_argument(
+        "-n", "--node", type=str, dest="node",
+        default=VDSGenerator.target_node, help="Virtual dataset to check.")
+    parser.add_argument(
+        "--frames", type=int, dest="frames", default=3,
+        help="Number of frames to sample from each mapping.")
+    parser.add_argument(
+        "--regions", type=int, dest="regions", default=3,
+        help="Number of regions to sample from each frame.")
+    parser.add_argument(
+        "--region-size", type=int, dest="region_size", default=8,
+        help="Length of each axis of a region.")
+    parser.add_argument(
+        "--seed", type=int, dest="seed", default=None,
+        help="Seed of the random samples, to repeat a check.")
+    parser.add_argument(
+        "-l", "--log-level", type=int, dest="log_level", choices=[1, 2, 3],
+        default=VDSGenerator.log_level,
+        help="Logging level (off=3, info=2, debug=1).")
+
+    return parser.parse_args()
+
+
+def sample_positions(length, count, rng):
+    """Choose positions in a sequence, always including the ends.
+
+    Args:
+        length(int): Length of sequence
+        count(int): Number of positions to choose
+        rng(numpy.random.RandomState): Source of random positions
+
+    Returns:
+        numpy.ndarray: Sorted positions - all of them if there are at most
+            count
+
+    """
+    if length <= count:
+        return np.arange(length)
+    chosen = [0, length - 1][:count]
+    if count > 2:
+        chosen.extend(rng.choice(np.arange(1, length - 1), count - 2,
+                                 replace=False))
+    return np.sort(chosen)
+
+
+def sample_regions(mapping, count, size, rng):
+    """Choose regions of the axes after the frame axes of a mapping.
+
+    Args:
+        mapping(Mapping): Mapping of a plan
+        count(int): Number of regions to choose
+        size(int): Length of each axis of a region
+        rng(numpy.random.RandomState): Source of random regions
+
+    Returns:
+        list(tuple(slice)): Positions in the index arrays of each axis of
+            mapping, from the first corner to the last
+
+    """
+    starts = [sample_positions(max(len(target) - size + 1, 1), count, rng)
+              for target, _ in mapping.axes]
+    regions = []
+    for idx in range(count):
+        region = tuple(slice(int(axis[min(idx, len(axis) - 1)]),
+                             int(axis[min(idx, len(axis) - 1)]) + size)
+                       for axis in starts)
+        if region not in regions:
+            regions.append(region)
+    return regions
+
+
+def _region_selection(frame, indices):
+    # Bounding box of a region, and the elements of the region in it
+    lower = [int(axis.min()) for axis in indices]
+    box = tuple(int(index) for index in frame) + tuple(
+        slice(low, int(axis.max()) + 1) for low, axis in zip(lower, indices))
+    return box, np.ix_(*[axis - low for low, axis in zip(lower, indices)])
+
+
+def _source_frame_shape(mapping):
+    return mapping.shape[:len(mapping.shape) - len(mapping.axes)]
+
+
+def _bounds(mapping):
+    # Lowest and highest target index of the frames and each axis
+    indices = [mapping.frames[0]] + [target for target, _ in mapping.axes]
+    return ([int(axis.min()) for axis in indices],
+            [int(axis.max()) for axis in indices])
+
+
+def later_overlaps(mappings):
+    """Find the later mappings that may map over each mapping of a plan.
+
+    Where mappings overlap, the VDS reads the later one, so these are the
+    mappings to exclude from the samples of each mapping.
+
+    Args:
+        mappings(list(Mapping)): Mappings of a plan, none of them empty
+
+    Returns:
+        list(list(Mapping)): Later mappings whose bounds in the VDS overlap
+            the bounds of each mapping
+
+    """
+    if not mappings:
+        return []
+    lower, upper = [np.array(bounds) for bounds in
+                    zip(*[_bounds(mapping) for mapping in mappings])]
+    overlaps = []
+    for idx in range(len(mappings)):
+        later = np.all((lower[idx + 1:] <= upper[idx]) &
+                       (upper[idx + 1:] >= lower[idx]), axis=1)
+        overlaps.append([mappings[idx + 1 + later_idx]
+                         for later_idx in np.flatnonzero(later)])
+    return overlaps
+
+
+def mapped_elements(frame, indices, later_mappings):
+    """Find the elements of a region that no later mapping maps over.
+
+    Args:
+        frame(int): Target frame of region
+        indices(list(numpy.ndarray)): Target indices of each axis of region
+        later_mappings(list(Mapping)): Later mappings that may overlap it
+
+    Returns:
+        numpy.ndarray: Boolean array the shape of the region, True where
+            the VDS reads the mapping of the region
+
+    """
+    shape = tuple(len(axis) for axis in indices)
+    covered = np.zeros(shape, dtype=bool)
+    for later in later_mappings:
+        if frame not in later.frames[0]:
+            continue
+        overlap = True
+        for axis_idx, (axis, (target, _)) in enumerate(
+                zip(indices, later.axes)):
+            axis_shape = [1] * len(shape)
+            axis_shape[axis_idx] = len(axis)
+            overlap = overlap & np.isin(axis, target).reshape(axis_shape)
+        covered |= overlap
+    return ~covered
+
+
+def verify_plan(file_path, plan, node=None, frames=3, regions=3,
+                region_size=8, seed=None):
+    """Check a virtual dataset against samples of the mappings of a plan.
+
+    Where mappings overlap the VDS reads the later one, so only the elements
+    of a sample that no later mapping maps over are compared.
+
+    Args:
+        file_path(str): Path to VDS file
+        plan(LayoutPlan): Mappings the dataset should have
+        node(str): Virtual dataset - Default is data
+        frames(int): Number of frames to sample from each mapping
+        regions(int): Number of regions to sample from each frame
+        region_size(int): Length of each axis of a region
+        seed(int): Seed of the random samples
+
+    Returns:
+        list(Mismatch): Samples that differ or could not be read
+
+    """
+    import h5py as h5
+
+    node = node or VDSGenerator.target_node
+    rng = np.random.RandomState(seed)
+    start_time = time.time()
+
+    planned = [mapping for mapping in plan.mappings if len(mapping.frames[0])]
+    mappings = {}
+    for mapping, later_mappings in zip(planned, later_overlaps(planned)):
+        mappings.setdefault((mapping.file_path, mapping.node),
+                            []).append((mapping, later_mappings))
+
+    mismatches = []
+    samples = 0
+    with h5.File(file_path, "r") as vds_file:
+        vds = vds_file[node]
+        if vds.shape != plan.shape:
+            return [Mismatch(file_path, node, None, None,
+                             "VDS has shape {}, not {}".format(
+                                 vds.shape, plan.shape))]
+
+        for (source_path, source_node), source_mappings in \
+                sorted(mappings.items()):
+            try:
+                source_file = h5.File(source_path, "r")
+            except (IOError, OSError):
+                mismatches.extend(
+                    Mismatch(source_path, source_node, None, None,
+                             "Cannot open source") for _ in source_mappings)
+                continue
+
+            with source_file:
+                if source_node not in source_file:
+                    mismatches.extend(
+                        Mismatch(source_path, source_node, None, None,
+                                 "Source has no dataset")
+                        for _ in source_mappings)
+                    continue
+                source = source_file[source_node]
+
+                for mapping, later_mappings in source_mappings:
+                    if source.shape != tuple(mapping.shape):
+                        mismatches.append(Mismatch(
+                            source_path, source_node, None, None,
+                            "Source has shape {}, not {}".format(
+                                source.shape, tuple(mapping.shape))))
+                        continue
+
+                    target_frames, source_frames = mapping.frames
+                    frame_samples = sample_positions(len(target_frames),
+                                                     frames, rng)
+                    region_samples = sample_regions(mapping, regions,
+                                                    region_size, rng)
+                    for position in frame_samples:
+                        target_frame = np.unravel_index(
+                            target_frames[position], plan.frame_shape)
+                        source_frame = np.unravel_index(
+                            source_frames[position],
+                            _source_frame_shape(mapping))
+                        for region in region_samples:
+                            target_indices = [axis[0][window] for axis,
+                                              window in zip(mapping.axes,
+                                                            region)]
+                            mapped = mapped_elements(
+                                target_frames[position], target_indices,
+                                later_mappings)
+                            if not mapped.any():
+                                continue
+                            target, target_elements = _region_selection(
+                                target_frame, target_indices)
+                            source_, source_elements = _region_selection(
+                                source_frame, [axis[1][window] for axis,
+                                               window in zip(mapping.axes,
+                                                             region)])
+                            samples += 1
+                            if not np.array_equal(
+                                    vds[target][target_elements][mapped],
+                                    source[source_][source_elements][mapped],
+                                    equal_nan=vds.dtype.kind in "fc"):
+                                mismatches.append(Mismatch(
+                                    source_path, source_node, target,
+                                    source_, "Data differs"))
+
+    for mismatch in mismatches:
+        logger.error("%s of %s: %s at %s, mapped to %s", mismatch.node,
+                     mismatch.file_path, mismatch.reason, mismatch.source,
+                     mismatch.target)
+    logger.info("Checked %s samples of %s mappings of %s in %.1fs - %s "
+                "mismatches", samples, len(plan.mappings), file_path,
+                time.time() - start_time, len(mismatches))
+    return mismatches
+
+
+def verify_vds(file_path, node=None, frames=3, regions=3, region_size=8,
+               seed=None):
+    """Check a virtual dataset against samples of the sources it maps.
+
+    The mappings of any virtual datasets it maps from are resolved, so the
+    samples are read from the raw files.
+
+    Args:
+        file_path(str): Path to VDS file
+        node(str): Virtual dataset - Default is data
+        frames(int): Number of frames to sample from each mapping
+        regions(int): Number of regions to sample from each frame
+        region_size(int): Length of each axis of a region
+        seed(int): Seed of the random samples
+
+    Returns:
+        list(Mismatch): Samples that differ or could not be read
+
+    Raises:
+        IOError: If the shape of a source mapped whole cannot be read
+
+    """
+    node = node or VDSGenerator.target_node
+    plan, _ = flatten_plan(file_path, node)
+    return verify_plan(file_path, plan, node, frames, regions, region_size,
+                       seed)
+
+
+def main():
+    """Run program."""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    args = parse_args()
+    logger.setLevel(args.log_level * 10)
+
+    try:
+        mismatches = verify_vds(args.file, args.node, args.frames,
+                                args.regions, args.region_size, args.seed)
+    except IOError as error:
+        logger.error("Cannot read mappings of %s: %s", args.file, error)
+        return 1
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
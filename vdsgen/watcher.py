@@ -0,0 +1,440 @@
+"""Watch a directory and build a VDS from raw files as they are completed."""
+
+import os
+import re
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+import logging
+
+from .cache import MetadataCache
+from .vdsgenerator import VDSGenerator
+
+
+class PollingMonitor(object):
+
+    """Detect file activity in a directory by comparing stat results."""
+
+    def __init__(self, path, regex, poll_interval=0.2):
+        """
+        Args:
+            path(str): Directory to monitor
+            regex(re.Pattern): Pattern of file names to monitor
+            poll_interval(float): Seconds between scans of the directory
+
+        """
+        self.path = path
+        self.regex = regex
+        self.poll_interval = poll_interval
+        self._stats = {}
+
+    def wait(self, timeout):
+        """Wait for activity on any matching file.
+
+        Args:
+            timeout(float): Maximum seconds to wait
+
+        Returns:
+            tuple(set, set): Names of files that changed, and names of files
+                known to have been closed after writing (always empty here)
+
+        """
+        deadline = time.time() + timeout
+        while True:
+            changed = self.scan()
+            remaining = deadline - time.time()
+            if changed or remaining <= 0:
+                return changed, set()
+            time.sleep(min(self.poll_interval, remaining))
+
+    def scan(self):
+        """Scan the directory for new or changed files.
+
+        Returns:
+            set: Names of files that are new or changed since the last scan
+
+        """
+        changed = set()
+        for entry in os.scandir(self.path):
+            if not self.regex.match(entry.name):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:  # Removed since listing
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._stats.get(entry.name) != signature:
+                self._stats[entry.name] = signature
+                changed.add(entry.name)
+
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyMonitor(PollingMonitor):
+
+    """Detect file activity in a directory with Linux inotify."""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+    _libc = None
+
+    def __init__(self, path, regex, poll_interval=0.2):
+        """
+        Args:
+            path(str): Directory to monitor
+            regex(re.Pattern): Pattern of file names to monitor
+            poll_interval(float): Unused - events are delivered as they occur
+
+        """
+        super(InotifyMonitor, self).__init__(path, regex, poll_interval)
+
+        libc = self.load_libc()
+        if libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | \
+            self.IN_CREATE
+        if libc.inotify_add_watch(self._fd, path.encode(), mask) < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(),
+                          "inotify_add_watch failed for {}".format(path))
+
+        self._initial_scan = True
+
+    @classmethod
+    def load_libc(cls):
+        """Load libc if it provides inotify.
+
+        Returns:
+            ctypes.CDLL: libc, or None if inotify is not available
+
+        """
+        if cls._libc is None:
+            name = ctypes.util.find_library("c")
+            try:
+                libc = ctypes.CDLL(name, use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+            except (OSError, AttributeError, TypeError):
+                return None
+            cls._libc = libc
+
+        return cls._libc
+
+    def wait(self, timeout):
+        """Wait for activity on any matching file.
+
+        Args:
+            timeout(float): Maximum seconds to wait
+
+        Returns:
+            tuple(set, set): Names of files that changed, and names of files
+                that have been closed after writing
+
+        """
+        if self._initial_scan:
+            # Pick up files that existed before the watch was added
+            self._initial_scan = False
+            existing = self.scan()
+            if existing:
+                return existing, set()
+
+        changed, closed = set(), set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return changed, closed
+
+        buffer = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = self.EVENT_HEADER.unpack_from(buffer, offset)
+            offset += self.EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0").decode()
+            offset += length
+
+            if not self.regex.match(name):
+                continue
+            changed.add(name)
+            if mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                closed.add(name)
+
+        return changed, closed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class VDSWatcher(object):
+
+    """Watch a directory and generate a VDS from files as they complete.
+
+    A file is complete when it has been closed after writing (inotify only),
+    or has not changed for settle_time seconds, and it can be opened with the
+    source dataset present. Each time the set of complete files (or the
+    size or modification time of one) changes, the whole VDS is regenerated
+    from all of them - the metadata of each file is only read once - written
+    to a temporary file and moved into place, so readers never see a
+    partially written VDS. So the output file must not have any nodes other
+    than those the generator creates, as they would be lost.
+
+    The generator only gets the files complete so far, so a layout that
+    depends on the whole set of files (e.g. interleaving, where each file
+    maps to every Nth block of frames) must not be generated incrementally.
+
+    """
+
+    # Default Values
+    settle_time = 1.0  # Seconds without writes before a file is complete
+    poll_interval = 0.2  # Seconds between scans when inotify is unavailable
+    log_level = 2
+
+    def __init__(self, path, prefix, generator_factory, files=None,
+                 expected_files=None, incremental=True,
+                 source_node=None, settle_time=None, poll_interval=None,
+                 use_inotify=None, log_level=None):
+        """
+        Args:
+            path(str): Directory to watch
+            prefix(str): Prefix of files to watch for, as for VDSGenerator
+            generator_factory(callable): Called with a list of file names in
+                path and a MetadataCache to create a VDSGenerator for them,
+                reading their metadata through the cache
+            files(list(str)): Explicit file names to wait for, instead of
+                prefix
+            expected_files(int): Number of files to wait for before stopping
+                - Default is len(files), or to watch until stopped
+            incremental(bool): Generate the VDS each time a file completes,
+                rather than once all expected files are complete
+            source_node(str): Data node in source HDF5 files
+            settle_time(float): Seconds without writes before a file is
+                considered complete
+            poll_interval(float): Seconds between scans if polling
+            use_inotify(bool): Force or disable inotify - Default is to use it
+                where available
+            log_level(int): Logging level (off=3, info=2, debug=1) -
+                Default is info
+
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger.setLevel((log_level or self.log_level) * 10)
+
+        if (prefix is None) == (files is None):
+            raise ValueError("One, and only one, of prefix or files required.")
+        if not incremental and expected_files is None and files is None:
+            raise ValueError("expected_files required if not incremental.")
+
+        if settle_time is not None:
+            self.settle_time = settle_time
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+
+        self.path = path
+        self.files = files
+        self.generator_factory = generator_factory
+        self.incremental = incremental
+        self.source_node = source_node or VDSGenerator.source_node
+
+        if files is not None:
+            self.regex = re.compile(
+                "|".join(re.escape(file_) + "$" for file_ in files))
+            if expected_files is None:
+                expected_files = len(files)
+        else:
+            self.regex = re.compile(prefix + r"\d+\.(hdf5|hdf|h5)$")
+        self.expected_files = expected_files
+
+        self.complete = set()
+        self.metadata_cache = MetadataCache()
+        self._last_activity = {}
+        self._generated = None  # Signature of the files last generated from
+
+        if use_inotify is None:
+            use_inotify = InotifyMonitor.load_libc() is not None
+        if use_inotify:
+            self.monitor = InotifyMonitor(path, self.regex)
+        else:
+            self.monitor = PollingMonitor(path, self.regex,
+                                          self.poll_interval)
+        self.logger.debug("Watching %s with %s", path,
+                          self.monitor.__class__.__name__)
+
+    def watch(self, timeout=None):
+        """Watch until all expected files are complete, or timeout.
+
+        Args:
+            timeout(float): Seconds to wait without any file completing
+                before giving up - Default is to wait forever
+
+        Returns:
+            str: Path of the VDS file, or None if it was never generated
+
+        """
+        output_file = None
+        last_progress = time.time()
+
+        try:
+            while not self.finished:
+                wait = self.settle_time / 2
+                if timeout is not None:
+                    wait = min(wait, last_progress + timeout - time.time())
+                    if wait < 0:
+                        raise IOError(
+                            "Timed out after {}s with {} complete files - "
+                            "expected {}".format(timeout, len(self.complete),
+                                                 self.expected_files))
+
+                if self.update(*self.monitor.wait(max(wait, 0))):
+                    last_progress = time.time()
+                    if self.incremental or self.finished:
+                        output_file = self.generate() or output_file
+        finally:
+            self.monitor.close()
+
+        return output_file
+
+    @property
+    def finished(self):
+        return self.expected_files is not None and \
+            len(self.complete) >= self.expected_files
+
+    def update(self, changed, closed):
+        """Update file activity and check which files are now complete.
+
+        Args:
+            changed(set): Names of files with activity
+            closed(set): Names of files closed after writing
+
+        Returns:
+            bool: Whether any files were completed
+
+        """
+        now = time.time()
+        for name in changed:
+            self._last_activity[name] = now
+            self.complete.discard(name)  # Written to again
+
+        completed = False
+        for name, last_activity in list(self._last_activity.items()):
+            if name in closed or now - last_activity >= self.settle_time:
+                if self.is_readable(os.path.join(self.path, name)):
+                    del self._last_activity[name]
+                    self.complete.add(name)
+                    completed = True
+                    self.logger.info("%s complete", name)
+
+        return completed
+
+    def is_readable(self, file_path):
+        """Check the source dataset can be read from file_path.
+
+        Args:
+            file_path(str): Path to HDF5 file
+
+        Returns:
+            bool: True if the file can be opened and has the source node
+
+        """
+        import h5py as h5
+
+        try:
+            with h5.File(file_path, "r") as h5_file:
+                return self.source_node in h5_file
+        except (IOError, OSError):  # Still open for writing, or truncated
+            return False
+
+    def signature(self):
+        """Get the size and modification time of each complete file.
+
+        Returns:
+            frozenset: Name, size and modification time of each file
+
+        """
+        signature = set()
+        for name in self.complete:
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                stat = None
+            signature.add((name, stat and stat.st_size,
+                           stat and stat.st_mtime_ns))
+        return frozenset(signature)
+
+    def check_output(self, gen):
+        """Check the output file only has nodes the generator creates.
+
+        Args:
+            gen(VDSGenerator): Generator of the VDS
+
+        Raises:
+            IOError: If the output file has other nodes, which replacing it
+                would lose
+
+        """
+        import h5py as h5
+
+        if not os.path.exists(gen.output_file):
+            return
+
+        targets = [node.strip("/") for node in gen.target_nodes]
+        with h5.File(gen.output_file, "r") as h5_file:
+            names = []
+            h5_file.visit(names.append)
+        other = [name for name in names if not any(
+            name == target or name.startswith(target + "/") or
+            target.startswith(name + "/") for target in targets)]
+        if other:
+            raise IOError("{} has nodes {} that regenerating the VDS would "
+                          "lose - use another output file".format(
+                              gen.output_file, ", ".join(other)))
+
+    def generate(self):
+        """Generate the VDS from the complete files, if they have changed.
+
+        Returns:
+            str: Path of the VDS file, or None if the files are unchanged
+
+        """
+        signature = self.signature()
+        if signature == self._generated:
+            self.logger.debug("Complete files unchanged - not regenerating")
+            return None
+
+        if self.files is not None:  # In the order given
+            files = [file_ for file_ in self.files if file_ in self.complete]
+        else:
+            files = sorted(self.complete)
+        gen = self.generator_factory(files, self.metadata_cache)
+        self.check_output(gen)
+
+        # Write to a temporary file and move it into place, so that readers
+        # see either the previous VDS or the new one
+        output_file = gen.output_file
+        directory, name = os.path.split(output_file)
+        gen.output_file = os.path.join(directory, ".{}.tmp".format(name))
+        if os.path.exists(gen.output_file):
+            os.remove(gen.output_file)
+
+        gen.generate_vds()
+        os.rename(gen.output_file, output_file)
+        self._generated = signature
+
+        self.logger.info("Generated %s from %s files", output_file,
+                         len(self.complete))
+        return output_file
@@ -0,0 +1,291 @@
+"""Simulate detector file writers appending frames to raw files live.
+
+Each file is written by its own process, appending frames in SWMR mode at the
+time they would arrive from a detector running at a given frame rate, so
+that live VDS generation and reading can be tested without a detector.
+
+In interleave mode frames are spread across the files in blocks, as for
+rawsourcegenerator; in stripe mode every file receives a stripe of every
+frame. Blocks can be dropped at random, in which case the writer skips them
+and the frames read back as the fill value.
+
+"""
+
+import sys
+import json
+import time
+import random
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import h5py
+
+from .rawsourcegenerator import file_frame_indices
+
+INTERLEAVE = "interleave"
+STRIPE = "stripe"
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = ArgumentParser(
+        description="Simulate detector file writers appending frames to raw "
+                    "files at a fixed frame rate.",
+        formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "prefix", type=str, help="Path and name prefix")
+    parser.add_argument(
+        "frames", type=int, help="Number of frames.")
+    parser.add_argument(
+        "files", type=int, help="Number of files (and writer processes).")
+    parser.add_argument(
+        "-m", "--mode", type=str, dest="mode", default=INTERLEAVE,
+        choices=[INTERLEAVE, STRIPE],
+        help="Interleave blocks of frames across files, or write a stripe of "
+             "every frame to each file.")
+    parser.add_argument(
+        "-b", "--block-size", type=int, dest="block_size", default=1,
+        help="Size of contiguous blocks of frames (interleave mode).")
+    parser.add_argument(
+        "-x", "--x-dim", type=int, dest="x_dim", default=100,
+        help="Width of frame (or stripe).")
+    parser.add_argument(
+        "-y", "--y-dim", type=int, dest="y_dim", default=100,
+        help="Height of frame (or stripe).")
+    parser.add_argument(
+        "-d", "--dset", type=str, dest="dset", default="data",
+        help="Dataset name")
+    parser.add_argument(
+        "-t", "--data-type", type=str, dest="dtype", default="int32",
+        help="Data type of datasets.")
+    parser.add_argument(
+        "-r", "--frame-rate", type=float, dest="frame_rate",
+        default=WriterSimulator.frame_rate,
+        help="Frames per second across all writers - 0 to write as fast as "
+             "possible.")
+    parser.add_argument(
+        "-f", "--flush-interval", type=int, dest="flush_interval",
+        default=WriterSimulator.flush_interval,
+        help="Number of frames each writer appends between SWMR flushes.")
+    parser.add_argument(
+        "--drop-probability", type=float, dest="drop_probability",
+        default=WriterSimulator.drop_probability,
+        help="Probability of each block being dropped by its writer.")
+    parser.add_argument(
+        "--seed", type=int, dest="seed", default=None,
+        help="Random seed for dropped blocks.")
+    parser.add_argument(
+        "--timestamps", type=str, dest="timestamps", default=None,
+        help="JSON file to record the time each frame was flushed to.")
+
+    return parser.parse_args()
+
+
+class WriterSimulator(object):
+
+    """Write raw files as a set of detector file writers would."""
+
+    # Default Values
+    frame_rate = 100.0  # Frames per second across all writers
+    flush_interval = 1  # Frames appended between SWMR flushes
+    drop_probability = 0.0  # Probability of each block being dropped
+    fill_value = -1  # Value of frames in dropped blocks
+    start_delay = 0.5  # Seconds for writer processes to start and open files
+
+    def __init__(self, prefix, frames, files, mode=INTERLEAVE, block_size=1,
+                 x_dim=100, y_dim=100, dset="data", dtype="int32",
+                 frame_rate=None, flush_interval=None, drop_probability=None,
+                 seed=None, fill_value=None):
+        """
+        Args:
+            prefix(str): Path and name prefix of files
+            frames(int): Total number of frames
+            files(int): Number of files, each written by its own process
+            mode(str): interleave or stripe
+            block_size(int): Number of contiguous frames in each block
+                (interleave mode)
+            x_dim(int): Width of frame (or stripe)
+            y_dim(int): Height of frame (or stripe)
+            dset(str): Dataset name
+            dtype(str): Data type of datasets
+            frame_rate(float): Frames per second across all writers - 0 to
+                write as fast as possible
+            flush_interval(int): Frames appended between SWMR flushes
+            drop_probability(float): Probability of each block being dropped
+            seed(int): Random seed for dropped blocks
+            fill_value(int): Value of frames in dropped blocks
+
+        """
+        if mode not in (INTERLEAVE, STRIPE):
+            raise ValueError("Mode must be {} or {}, got {}".format(
+                INTERLEAVE, STRIPE, mode))
+
+        self.prefix = prefix
+        self.frames = frames
+        self.files = files
+        self.mode = mode
+        self.block_size = block_size
+        self.x_dim = x_dim
+        self.y_dim = y_dim
+        self.dset = dset
+        self.dtype = dtype
+        self.seed = seed
+
+        # Overwrite default values with arguments, if given
+        if frame_rate is not None:
+            self.frame_rate = frame_rate
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if drop_probability is not None:
+            self.drop_probability = drop_probability
+        if fill_value is not None:
+            self.fill_value = fill_value
+
+        self.file_paths = [prefix + "_{}.h5".format(file_idx)
+                           for file_idx in range(files)]
+
+    def frame_indices(self, file_idx):
+        """Calculate the global index of each frame written to a file.
+
+        Args:
+            file_idx(int): Index of file
+
+        Returns:
+            numpy.ndarray: Global frame index of each frame in the file
+
+        """
+        if self.mode == STRIPE:
+            return np.arange(self.frames)
+        return file_frame_indices(file_idx, self.frames, self.files,
+                                  self.block_size)
+
+    def dropped_frames(self, file_idx):
+        """Choose the frames dropped by the writer of a file.
+
+        Args:
+            file_idx(int): Index of file
+
+        Returns:
+            set(int): Global indexes of frames that will not be written
+
+        """
+        if not self.drop_probability:
+            return set()
+
+        seed = None if self.seed is None else self.seed * self.files + file_idx
+        rng = random.Random(seed)
+
+        dropped = set()
+        indices = self.frame_indices(file_idx)
+        for start in range(0, len(indices), self.block_size):
+            if rng.random() < self.drop_probability:
+                dropped.update(indices[start:start + self.block_size].tolist())
+        return dropped
+
+    def run(self):
+        """Run a writer process for each file and wait for them to finish.
+
+        Returns:
+            dict: Global frame index -> list of times (since the epoch) that
+                the frame was flushed to each file that it was written to
+
+        """
+        start_time = time.time() + self.start_delay
+        jobs = [(self, file_idx, start_time) for file_idx in range(self.files)]
+
+        timestamps = {}
+        with ProcessPoolExecutor(max_workers=self.files) as pool:
+            for file_timestamps in pool.map(_run_writer, jobs):
+                for frame, flushed in file_timestamps.items():
+                    timestamps.setdefault(frame, []).append(flushed)
+
+        return timestamps
+
+    def write_file(self, file_idx, start_time):
+        """Append the frames of a file as they become due.
+
+        Args:
+            file_idx(int): Index of file
+            start_time(float): Time (since the epoch) frame 0 is due
+
+        Returns:
+            dict: Global frame index -> time the frame was flushed
+
+        """
+        indices = self.frame_indices(file_idx)
+        dropped = self.dropped_frames(file_idx)
+        frame_shape = (self.y_dim, self.x_dim)
+        frame = np.empty(frame_shape, dtype=self.dtype)
+
+        timestamps = {}
+        pending = []
+        with h5py.File(self.file_paths[file_idx], "w",
+                       libver="latest") as h5_file:
+            dataset = h5_file.create_dataset(
+                self.dset, shape=(0,) + frame_shape,
+                maxshape=(None,) + frame_shape, chunks=(1,) + frame_shape,
+                dtype=self.dtype, fillvalue=self.fill_value)
+            h5_file.swmr_mode = True
+
+            for local_idx, global_idx in enumerate(indices.tolist()):
+                if self.frame_rate:
+                    delay = start_time + global_idx / self.frame_rate - \
+                        time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                if global_idx in dropped:
+                    continue
+
+                if dataset.shape[0] <= local_idx:
+                    dataset.resize(local_idx + 1, axis=0)
+                frame[...] = global_idx
+                dataset[local_idx] = frame
+                pending.append(global_idx)
+
+                if len(pending) >= self.flush_interval:
+                    self._flush(dataset, pending, timestamps)
+
+            # Extend over any dropped blocks at the end
+            if dataset.shape[0] < len(indices):
+                dataset.resize(len(indices), axis=0)
+            self._flush(dataset, pending, timestamps)
+
+        return timestamps
+
+    @staticmethod
+    def _flush(dataset, pending, timestamps):
+        dataset.flush()
+        flushed = time.time()
+        for global_idx in pending:
+            timestamps[global_idx] = flushed
+        del pending[:]
+
+
+def _run_writer(job):
+    simulator, file_idx, start_time = job
+    return simulator.write_file(file_idx, start_time)
+
+
+def main():
+    """Run program."""
+    args = parse_args()
+
+    simulator = WriterSimulator(
+        args.prefix, args.frames, args.files, mode=args.mode,
+        block_size=args.block_size, x_dim=args.x_dim, y_dim=args.y_dim,
+        dset=args.dset, dtype=args.dtype, frame_rate=args.frame_rate,
+        flush_interval=args.flush_interval,
+        drop_probability=args.drop_probability, seed=args.seed)
+    timestamps = simulator.run()
+
+    if args.timestamps is not None:
+        with open(args.timestamps, "w") as timestamp_file:
+            json.dump({str(frame): flushed
+                       for frame, flushed in sorted(timestamps.items())},
+                      timestamp_file)
+
+
+if __name__ == "__main__":
+    sys.exit(main())